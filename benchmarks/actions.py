@@ -0,0 +1,261 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, List
+
+from benchmarks.fake_bigquery import FakeBigQueryClient, FakeGoogleClient
+from source.arg_parser import ArgumentParser
+from source.bigquery_actions import (
+    BigQueryCopyPartitionsAction,
+    BigQueryDeletePartitionsAction,
+    BigQueryDisplayAction,
+    BigQuerySwitchAction,
+)
+from source.bulk_strategy import AUTO, PER_PARTITION
+from source.rate_limiter import RateLimiter
+
+PROJECT = "project"
+DATASET = "dataset"
+TABLE = "events"
+START_DATE = "20000101"
+DEFAULT_SIZES = (10, 100, 10000)
+DEFAULT_LATENCY = 0.005
+# per-partition calls multiplexed on one event loop, where hundreds in
+# flight cost coroutines rather than threads
+ASYNCIO = "asyncio"
+ASYNCIO_PARALLELISM = 256
+
+# the fake answers quota errors itself, the benchmark measures the tool's
+# own overhead so the client side limits are lifted
+UNLIMITED_RATE = 1e9
+
+
+@dataclass
+class BenchmarkResult:
+    scenario: str
+    size: int
+    strategy: str
+    wall_seconds: float
+    peak_memory_bytes: int
+    api_calls: int
+    max_in_flight: int
+
+
+def partition_ids(size: int) -> List[str]:
+    from source.bigquery_actions import generate_range
+
+    return generate_range(START_DATE, end_date(size))
+
+
+def end_date(size: int) -> str:
+    import datetime
+
+    start = datetime.datetime.strptime(START_DATE, "%Y%m%d")
+    return (start + datetime.timedelta(days=size - 1)).strftime("%Y%m%d")
+
+
+def build_client(options: argparse.Namespace) -> FakeBigQueryClient:
+    fake = FakeGoogleClient(
+        latency=options.latency,
+        job_duration=options.job_duration,
+        failure_rate=options.failure_rate,
+    )
+    rate_limiter = RateLimiter(
+        table_rate=UNLIMITED_RATE, project_rate=UNLIMITED_RATE, base_backoff=0.01
+    )
+    return FakeBigQueryClient(fake, rate_limiter)
+
+
+def parse(client: FakeBigQueryClient, arguments: List[str]) -> argparse.Namespace:
+    return ArgumentParser(
+        switch_action=BigQuerySwitchAction(client),
+        display_action=BigQueryDisplayAction(client),
+        delete_partitions_action=BigQueryDeletePartitionsAction(client),
+        copy_partitions=BigQueryCopyPartitionsAction(client),
+    ).build_parser(arguments)
+
+
+def strategy_arguments(strategy: str) -> List[str]:
+    if strategy == ASYNCIO:
+        return [
+            f"--strategy={PER_PARTITION}",
+            "--asyncio",
+            f"--parallelism={ASYNCIO_PARALLELISM}",
+        ]
+    return [f"--strategy={strategy}"]
+
+
+def delete_partitions(
+    client: FakeBigQueryClient, size: int, strategy: str, directory: str
+) -> argparse.Namespace:
+    # one extra partition outside the range keeps the plan off the truncate path
+    client.fake.add_table(f"{PROJECT}.{DATASET}.{TABLE}", partition_ids(size + 1))
+    return parse(
+        client,
+        [
+            "delete-partitions",
+            f"--project-id={PROJECT}",
+            f"--dataset-id={DATASET}",
+            f"--table={TABLE}",
+            f"--start-date={START_DATE}",
+            f"--end-date={end_date(size)}",
+            f"--journal={os.path.join(directory, 'delete.journal')}",
+            *strategy_arguments(strategy),
+        ],
+    )
+
+
+def copy_partitions(
+    client: FakeBigQueryClient, size: int, strategy: str, directory: str
+) -> argparse.Namespace:
+    client.fake.add_table(f"src_{PROJECT}.{DATASET}.{TABLE}", partition_ids(size))
+    client.fake.add_table(f"dst_{PROJECT}.{DATASET}.{TABLE}", partition_ids(size + 1))
+    return parse(
+        client,
+        [
+            "copy-partitions",
+            f"--src-project-id=src_{PROJECT}",
+            f"--dst-project-id=dst_{PROJECT}",
+            f"--dataset-id={DATASET}",
+            f"--table={TABLE}",
+            f"--start-date={START_DATE}",
+            f"--end-date={end_date(size)}",
+            f"--journal={os.path.join(directory, 'copy.journal')}",
+            *strategy_arguments(strategy),
+        ],
+    )
+
+
+def switch_color(
+    client: FakeBigQueryClient, size: int, strategy: str, directory: str
+) -> argparse.Namespace:
+    manifest = os.path.join(directory, "manifest.yaml")
+    with open(manifest, "w") as manifest_file:
+        for index in range(size):
+            client.fake.add_view(
+                f"{PROJECT}.{DATASET}.view_{index}",
+                f"SELECT * FROM `{PROJECT}.{DATASET}_versions.table_{index}_blue`",
+            )
+            manifest_file.write(f"- view_{index}\n")
+    return parse(
+        client,
+        [
+            "switch-color",
+            f"--project-id={PROJECT}",
+            f"--dataset-id={DATASET}",
+            f"--manifest={manifest}",
+        ],
+    )
+
+
+SCENARIOS = {
+    "delete-partitions": (delete_partitions, (PER_PARTITION, AUTO, ASYNCIO)),
+    "copy-partitions": (copy_partitions, (PER_PARTITION, AUTO, ASYNCIO)),
+    "switch-color": (switch_color, ("-",)),
+}
+
+
+def run_scenario(
+    name: str,
+    setup: Callable[..., argparse.Namespace],
+    size: int,
+    strategy: str,
+    options: argparse.Namespace,
+) -> BenchmarkResult:
+    client = build_client(options)
+    with tempfile.TemporaryDirectory() as directory:
+        args = setup(client, size, strategy, directory)
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            args.func(args)
+            wall_seconds = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return BenchmarkResult(
+        name,
+        size,
+        strategy,
+        wall_seconds,
+        peak,
+        sum(client.fake.calls.values()),
+        client.fake.max_in_flight,
+    )
+
+
+def run_benchmarks(options: argparse.Namespace) -> List[BenchmarkResult]:
+    results = []
+    for name in options.scenarios:
+        setup, strategies = SCENARIOS[name]
+        for size in options.sizes:
+            for strategy in strategies:
+                result = run_scenario(name, setup, size, strategy, options)
+                logging.warning(format_result(result))
+                results.append(result)
+    return results
+
+
+def format_result(result: BenchmarkResult) -> str:
+    return (
+        f"{result.scenario:<18} {result.size:>6} {result.strategy:<14} "
+        f"{result.wall_seconds:9.3f}s {result.peak_memory_bytes / 1024 ** 2:9.1f}MiB "
+        f"{result.api_calls:>7} calls {result.max_in_flight:>4} in flight"
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the actions against an in-process BigQuery stand-in"
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS)
+    )
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=DEFAULT_LATENCY,
+        help="seconds every API call takes",
+    )
+    parser.add_argument(
+        "--job-duration",
+        type=float,
+        default=0.0,
+        help="seconds every copy or query job runs",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="fraction of API calls failing with a retryable error",
+    )
+    parser.add_argument(
+        "--json", help="also write the results to this file, to compare runs"
+    )
+    return parser
+
+
+def main(arguments: List[str] = None) -> List[BenchmarkResult]:
+    options = build_parser().parse_args(arguments)
+    logging.basicConfig(format="%(message)s")
+    # the actions log every partition, which would dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+    # the client libraries are imported lazily, warm them up so the first
+    # scenario does not pay for the imports
+    from google.cloud import bigquery  # noqa: F401
+
+    results = run_benchmarks(options)
+    if options.json is not None:
+        with open(options.json, "w") as results_file:
+            json.dump([asdict(result) for result in results], results_file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
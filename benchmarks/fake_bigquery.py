@@ -0,0 +1,482 @@
+import collections
+import contextlib
+import datetime
+import itertools
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Set
+
+from source.bigquery_utils import BigQueryClient, PartitionMetadata, Partitioning
+from source.bulk_strategy import partition_bounds
+from source.partition_executor import DEFAULT_POLL_INTERVAL
+from source.rate_limiter import RateLimiter
+
+_TABLE_REFERENCE = re.compile(r"`([\w-]+\.[\w-]+\.[\w$-]+)`")
+_PARTITIONS_QUERY = re.compile(
+    r"FROM `([\w-]+)\.([\w-]+)\.INFORMATION_SCHEMA\.PARTITIONS`"
+)
+_TIMESTAMP_LITERAL = re.compile(r"'(\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}:\d{2})?)'")
+
+
+@dataclass
+class FakeTable:
+    table_id: str
+    view_query: Optional[str] = None
+    partitioning: Optional[Partitioning] = None
+    partitions: Dict[str, PartitionMetadata] = field(default_factory=dict)
+
+    @property
+    def table_type(self) -> str:
+        return "VIEW" if self.view_query is not None else "TABLE"
+
+    @property
+    def time_partitioning(self):
+        if self.partitioning is None:
+            return None
+        return SimpleNamespace(
+            field=self.partitioning.column, type_=self.partitioning.granularity
+        )
+
+    def to_api_repr(self) -> dict:
+        project_id, dataset_id, table_id = self.table_id.split(".")
+        resource = {
+            "tableReference": {
+                "projectId": project_id,
+                "datasetId": dataset_id,
+                "tableId": table_id,
+            },
+            "type": self.table_type,
+        }
+        if self.view_query is not None:
+            resource["view"] = {"query": self.view_query, "useLegacySql": False}
+        if self.partitioning is not None:
+            resource["timePartitioning"] = {"type": self.partitioning.granularity}
+            if self.partitioning.column is not None:
+                resource["timePartitioning"]["field"] = self.partitioning.column
+                resource["schema"] = {
+                    "fields": [
+                        {
+                            "name": self.partitioning.column,
+                            "type": self.partitioning.column_type,
+                        }
+                    ]
+                }
+        return resource
+
+    @property
+    def schema(self) -> list:
+        if self.partitioning is None or self.partitioning.column is None:
+            return []
+        return [
+            SimpleNamespace(
+                name=self.partitioning.column,
+                field_type=self.partitioning.column_type,
+            )
+        ]
+
+
+class FakeJob:
+    def __init__(
+        self,
+        job_id: str,
+        duration: float,
+        error: Exception = None,
+        rows: list = None,
+        statistics: dict = None,
+    ):
+        self.job_id = job_id
+        self.error = error
+        self.rows = rows or []
+        self._finishes_at = time.monotonic() + duration
+        self._properties = {"statistics": statistics or {}}
+
+    def done(self) -> bool:
+        return time.monotonic() >= self._finishes_at
+
+    def result(self) -> list:
+        remaining = self._finishes_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        if self.error is not None:
+            raise self.error
+        return self.rows
+
+
+# stands in for the parts of bigquery.Client that BigQueryClient uses, so the
+# rate limiter, instrumentation and actions run unchanged without network;
+# failure_rate injects retryable 503s, jobs on failing_tables fail and
+# quota_per_second answers 429 once a table sees more calls in a second
+class FakeGoogleClient:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        job_duration: float = 0.0,
+        failure_rate: float = 0.0,
+        failing_tables: Set[str] = None,
+        quota_per_second: Optional[int] = None,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.job_duration = job_duration
+        self.failure_rate = failure_rate
+        self.failing_tables = failing_tables or set()
+        self.quota_per_second = quota_per_second
+        self.tables: Dict[str, FakeTable] = {}
+        self.calls: Dict[str, int] = collections.Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._job_ids = itertools.count()
+        self._recent_calls: Dict[str, collections.deque] = collections.defaultdict(
+            collections.deque
+        )
+        self._lock = threading.Lock()
+
+    def add_table(
+        self,
+        table_id: str,
+        partition_ids: List[str] = (),
+        partitioning: Partitioning = Partitioning("day", "DATE", "DAY"),
+        rows_per_partition: int = 1000,
+        bytes_per_partition: int = 1024 ** 2,
+    ) -> FakeTable:
+        modified = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        table = FakeTable(
+            table_id,
+            partitioning=partitioning,
+            partitions={
+                partition_id: PartitionMetadata(
+                    partition_id, rows_per_partition, bytes_per_partition, modified
+                )
+                for partition_id in partition_ids
+            },
+        )
+        self.tables[table_id] = table
+        return table
+
+    def add_view(self, view_id: str, query: str) -> FakeTable:
+        view = FakeTable(view_id, view_query=query)
+        self.tables[view_id] = view
+        return view
+
+    def get_table(self, table_id: str) -> FakeTable:
+        with self._api_call("get_table", table_id):
+            return self._table(table_id)
+
+    def get_dataset(self, dataset_id: str) -> SimpleNamespace:
+        with self._api_call("get_dataset", dataset_id):
+            return SimpleNamespace(dataset_id=dataset_id, location="US")
+
+    def list_tables(self, dataset_id: str) -> list:
+        with self._api_call("list_tables", dataset_id):
+            return [
+                SimpleNamespace(
+                    table_id=table.table_id.split(".")[-1], table_type=table.table_type
+                )
+                for table_id, table in sorted(self.tables.items())
+                if table_id.rsplit(".", 1)[0] == dataset_id
+            ]
+
+    def update_table(self, view, fields: List[str]) -> FakeTable:
+        view_id = f"{view.project}.{view.dataset_id}.{view.table_id}"
+        with self._api_call("update_table", view_id):
+            return self._update_view(view_id, view.view_query)
+
+    def delete_table(self, table_id: str, not_found_ok: bool = False) -> None:
+        with self._api_call("delete_table", table_id):
+            self._delete(table_id, not_found_ok)
+
+    def copy_table(self, src_table_id: str, dst_table_id: str, job_config=None) -> FakeJob:
+        with self._api_call("copy_table", dst_table_id):
+            return self._copy(src_table_id, dst_table_id)
+
+    def _update_view(self, view_id: str, query: str) -> FakeTable:
+        table = self._table(view_id)
+        table.view_query = query
+        return table
+
+    def _delete(self, table_id: str, not_found_ok: bool) -> None:
+        name, _, partition_id = table_id.partition("$")
+        with self._lock:
+            if partition_id:
+                table = self.tables.get(name)
+                if table is not None:
+                    table.partitions.pop(partition_id, None)
+                    return
+            elif self.tables.pop(name, None) is not None:
+                return
+        if not not_found_ok:
+            self._raise("NotFound", f"Not found: Table {table_id}")
+
+    def _copy(self, src_table_id: str, dst_table_id: str) -> FakeJob:
+        src_name, _, partition_id = src_table_id.partition("$")
+        dst_name = dst_table_id.partition("$")[0]
+        source = self._table(src_name)
+        with self._lock:
+            destination = self.tables.get(dst_name)
+            if destination is None:
+                destination = self.tables[dst_name] = FakeTable(
+                    dst_name, partitioning=source.partitioning
+                )
+            if partition_id:
+                metadata = source.partitions.get(partition_id)
+                copied = {partition_id: metadata} if metadata else {}
+                # WRITE_TRUNCATE clears the partition even when nothing is copied
+                destination.partitions.pop(partition_id, None)
+            else:
+                copied = dict(source.partitions)
+                destination.partitions.clear()
+            destination.partitions.update(copied)
+        copied_bytes = sum(p.total_logical_bytes for p in copied.values())
+        return self._job(
+            dst_table_id, {"copy": {"copiedLogicalBytes": str(copied_bytes)}}
+        )
+
+    def query(
+        self, query: str, job_config=None, project: str = None, location: str = None
+    ) -> FakeJob:
+        partitions_query = _PARTITIONS_QUERY.search(query)
+        target = partitions_query.group(0) if partitions_query else query[:64]
+        with self._api_call("query", target):
+            if partitions_query is not None:
+                table_name = job_config.query_parameters[0].value
+                table_id = ".".join(partitions_query.groups() + (table_name,))
+                table = self.tables.get(table_id)
+                rows = [
+                    SimpleNamespace(**vars(metadata))
+                    for metadata in (table.partitions.values() if table else [])
+                ]
+                return self._job(table_id, rows=rows)
+            if "FARM_FINGERPRINT" in query:
+                return self._fingerprint(query)
+            return self._run_statement(query)
+
+    def _fingerprint(self, query: str) -> FakeJob:
+        # rows are not modelled, so a partition's content is its metadata;
+        # a copy shares it with the source and fingerprints the same
+        table_id = _TABLE_REFERENCE.findall(query)[0]
+        with self._lock:
+            table = self._table(table_id)
+            rows = []
+            for partition_id in _matching(table.partitions, _ranges(query)):
+                metadata = table.partitions[partition_id]
+                rows.append(
+                    SimpleNamespace(
+                        partition_id=partition_id,
+                        row_count=metadata.total_rows,
+                        fingerprint=hash(
+                            (metadata.total_rows, metadata.total_logical_bytes)
+                        ),
+                    )
+                )
+        return self._job(table_id, rows=rows)
+
+    def _run_statement(self, query: str) -> FakeJob:
+        tables = _TABLE_REFERENCE.findall(query)
+        ranges = _ranges(query)
+        processed = 0
+        with self._lock:
+            if query.startswith("TRUNCATE TABLE"):
+                self._table(tables[0]).partitions.clear()
+            elif query.startswith("DELETE FROM"):
+                table = self._table(tables[0])
+                for partition_id in _matching(table.partitions, ranges):
+                    processed += table.partitions.pop(partition_id).total_logical_bytes
+            elif query.startswith("BEGIN TRANSACTION"):
+                destination, source = self._table(tables[0]), self._table(tables[2])
+                for partition_id in _matching(destination.partitions, ranges):
+                    destination.partitions.pop(partition_id)
+                for partition_id in _matching(source.partitions, ranges):
+                    metadata = source.partitions[partition_id]
+                    destination.partitions[partition_id] = metadata
+                    processed += metadata.total_logical_bytes
+        return self._job(
+            tables[0] if tables else "query",
+            {"query": {"totalBytesProcessed": str(processed)}},
+        )
+
+    def _job(self, table_id: str, statistics: dict = None, rows: list = None) -> FakeJob:
+        error = None
+        if table_id.split("$")[0] in self.failing_tables:
+            error = self._error("BadRequest", f"job on {table_id} failed")
+        return FakeJob(
+            f"fake_job_{next(self._job_ids)}",
+            self.job_duration,
+            error=error,
+            rows=rows,
+            statistics=statistics,
+        )
+
+    def _table(self, table_id: str) -> FakeTable:
+        table = self.tables.get(table_id)
+        if table is None:
+            self._raise("NotFound", f"Not found: Table {table_id}")
+        return table
+
+    @contextlib.contextmanager
+    def _api_call(self, method: str, target: str) -> Iterator[None]:
+        self._begin_call(method)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            self._check_call(target)
+            yield
+        finally:
+            self._end_call()
+
+    def _begin_call(self, method: str) -> None:
+        with self._lock:
+            self.calls[method] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _end_call(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def _check_call(self, target: str) -> None:
+        table = target.split("$")[0]
+        with self._lock:
+            flaky = self._random.random() < self.failure_rate
+            throttled = False
+            if self.quota_per_second is not None:
+                now = time.monotonic()
+                recent = self._recent_calls[table]
+                while recent and recent[0] <= now - 1:
+                    recent.popleft()
+                throttled = len(recent) >= self.quota_per_second
+                if not throttled:
+                    recent.append(now)
+        if throttled:
+            self._raise("TooManyRequests", f"quota exceeded on {table}")
+        if flaky:
+            self._raise("ServiceUnavailable", f"injected failure on {target}")
+
+    @staticmethod
+    def _error(name: str, message: str) -> Exception:
+        from google.api_core import exceptions
+
+        return getattr(exceptions, name)(message)
+
+    def _raise(self, name: str, message: str) -> None:
+        raise self._error(name, message)
+
+
+_TABLE_PATH = re.compile(r"^projects/([\w-]+)/datasets/([\w-]+)/tables/([\w$-]+)$")
+_JOB_PATH = re.compile(r"^projects/([\w-]+)/jobs(?:/([\w-]+))?$")
+
+
+# answers the REST calls of AsyncBigQueryClient from the tables of a
+# FakeGoogleClient; latency is awaited, so it does not hold a thread
+class FakeAsyncTransport:
+    def __init__(self, google_client: FakeGoogleClient):
+        self.google_client = google_client
+        self.jobs: Dict[str, FakeJob] = {}
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def request(
+        self, method: str, path: str, params: dict = None, body: dict = None
+    ) -> dict:
+        import asyncio
+
+        fake = self.google_client
+        table_path = _TABLE_PATH.match(path)
+        target = ".".join(table_path.groups()) if table_path else path
+        fake._begin_call(f"rest_{method.lower()}")
+        try:
+            if fake.latency:
+                await asyncio.sleep(fake.latency)
+            fake._check_call(target)
+            if table_path is not None:
+                return self._table_request(method, target, body)
+            job_path = _JOB_PATH.match(path)
+            if job_path is not None:
+                return self._job_request(method, job_path.group(1), job_path.group(2), body)
+            fake._raise("NotFound", f"Not found: {path}")
+        finally:
+            fake._end_call()
+
+    def _table_request(self, method: str, table_id: str, body: dict) -> dict:
+        fake = self.google_client
+        if method == "DELETE":
+            fake._delete(table_id, not_found_ok=False)
+            return {}
+        if method == "PATCH":
+            fake._update_view(table_id, body["view"]["query"])
+        return fake._table(table_id).to_api_repr()
+
+    def _job_request(self, method: str, project_id: str, job_id: str, body: dict) -> dict:
+        if method == "POST":
+            job_id = body["jobReference"]["jobId"]
+            if job_id in self.jobs:
+                self.google_client._raise("Conflict", f"Already Exists: Job {job_id}")
+            copy = body["configuration"]["copy"]
+            self.jobs[job_id] = self.google_client._copy(
+                _table_id(copy["sourceTables"][0]), _table_id(copy["destinationTable"])
+            )
+        job = self.jobs.get(job_id)
+        if job is None:
+            self.google_client._raise("NotFound", f"Not found: Job {job_id}")
+        status = {"state": "DONE" if job.done() else "RUNNING"}
+        if job.done() and job.error is not None:
+            status["errorResult"] = {"reason": "invalid", "message": str(job.error)}
+        return {
+            "jobReference": {"projectId": project_id, "jobId": job_id},
+            "status": status,
+            "statistics": job._properties["statistics"],
+        }
+
+
+def _table_id(reference: dict) -> str:
+    return f"{reference['projectId']}.{reference['datasetId']}.{reference['tableId']}"
+
+
+class FakeBigQueryClient(BigQueryClient):
+    def __init__(
+        self, google_client: FakeGoogleClient = None, rate_limiter: RateLimiter = None
+    ):
+        super().__init__(rate_limiter)
+        self._google_client = google_client or FakeGoogleClient()
+
+    @property
+    def fake(self) -> FakeGoogleClient:
+        return self._google_client
+
+    def _build_async_client(self):
+        from source.async_bigquery import AsyncBigQueryClient, AsyncRateLimiter
+
+        return AsyncBigQueryClient(
+            lambda: FakeAsyncTransport(self.fake),
+            AsyncRateLimiter.like(self.rate_limiter),
+            poll_interval=min(DEFAULT_POLL_INTERVAL, self.fake.job_duration / 4 or 0.001),
+            metadata_cache=self.metadata_cache,
+        )
+
+
+def _ranges(query: str) -> List[tuple]:
+    values = [
+        datetime.datetime.fromisoformat(value)
+        for value in _TIMESTAMP_LITERAL.findall(query)
+    ]
+    return list(zip(values[::2], values[1::2]))
+
+
+def _matching(partitions: Dict[str, PartitionMetadata], ranges: List[tuple]) -> List[str]:
+    matching = []
+    for partition_id in partitions:
+        try:
+            start, _ = partition_bounds(partition_id)
+        except ValueError:
+            continue
+        if any(low <= start < high for low, high in ranges):
+            matching.append(partition_id)
+    return matching
@@ -3,8 +3,6 @@ if [ ! -d $PWD/venv/ ]
 then
     echo "Error: virtualenv does not exists. The requirements will be installed soon"
     virtualenv --python=python3 venv
-    source $PWD/venv/bin/activate
-    pip3 install -r requirements.txt
+    $PWD/venv/bin/pip3 install -r requirements.txt
 fi
-source $PWD/venv/bin/activate
-python3 main.py $1 $2 $3 $4 $5 $6 $7
\ No newline at end of file
+exec $PWD/venv/bin/python3 main.py "$@"
@@ -1,9 +1,14 @@
 import logging
+import sys
 
 from source.arg_parser import ArgumentParser
 from source.bigquery_actions import BigQuerySwitchAction, BigQueryDisplayAction, BigQueryDeletePartitionsAction, \
-    BigQueryCopyPartitionsAction
+    BigQueryCopyPartitionsAction, BigQueryVerifyPartitionsAction, MergeReportsAction
 from source.bigquery_utils import BigQueryClient
+from source.daemon import BigQueryServeAction, forward
+from source.instrumentation import MetricsCollector, set_instrumentation
+from source.metadata_cache import MetadataCache, default_cache_path
+from source.partition_executor import PartitionsFailed
 
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
@@ -15,9 +20,50 @@ if __name__ == "__main__":
         switch_action=BigQuerySwitchAction(bigquery_client),
         display_action=BigQueryDisplayAction(bigquery_client),
         delete_partitions_action=BigQueryDeletePartitionsAction(bigquery_client),
-        copy_partitions=BigQueryCopyPartitionsAction(bigquery_client)
+        copy_partitions=BigQueryCopyPartitionsAction(bigquery_client),
+        serve_action=BigQueryServeAction(bigquery_client),
+        verify_partitions_action=BigQueryVerifyPartitionsAction(bigquery_client),
+        merge_reports_action=MergeReportsAction()
     )
 
     args = parser.build_parser()
 
-    print(args.func(args))
+    if args.socket is not None and getattr(args, "command_parser", None) is None:
+        if args.metrics_file is not None or args.profile or not args.cache:
+            sys.exit(
+                "--metrics-file, --profile and --no-cache apply to the server, pass them to serve"
+            )
+        try:
+            status, output = forward(args.socket, sys.argv[1:])
+        except OSError as e:
+            sys.exit(f"cannot reach the server on {args.socket}: {e}")
+        if output:
+            print(output, file=sys.stdout if status == 0 else sys.stderr)
+        sys.exit(status)
+
+    if args.cache:
+        bigquery_client.metadata_cache = MetadataCache(default_cache_path())
+
+    metrics = None
+    if args.metrics_file is not None or args.profile:
+        metrics = MetricsCollector()
+        set_instrumentation(metrics)
+    status = 0
+    try:
+        try:
+            result = args.func(args)
+        except PartitionsFailed as e:
+            # the report is printed all the same, scripts see the failure in
+            # the exit status
+            result, status = e.output, 1
+        # with --output ndjson the records were already streamed
+        if result is not None:
+            print(result)
+    finally:
+        if bigquery_client.metadata_cache is not None:
+            bigquery_client.metadata_cache.flush()
+        if metrics is not None and args.metrics_file is not None:
+            metrics.export(args.metrics_file, args.metrics_format)
+        if metrics is not None and args.profile:
+            print(metrics.profile(), file=sys.stderr)
+    sys.exit(status)
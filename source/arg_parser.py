@@ -1,7 +1,16 @@
 import abc
 import argparse
+import os
 from abc import ABC
 
+from source.bigquery_utils import REBUILD_STRATEGIES
+from source.bulk_strategy import AUTO, STRATEGIES
+from source.instrumentation import METRICS_FORMATS
+from source.partition_executor import DEFAULT_PARALLELISM
+from source.partition_range import GRANULARITIES
+from source.progress import OUTPUTS, TEXT
+from source.sharding import Shard
+
 
 class Action(ABC):
     @abc.abstractmethod
@@ -9,6 +18,20 @@ class Action(ABC):
         pass
 
 
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value}")
+    return number
+
+
+def shard(value: str) -> Shard:
+    try:
+        return Shard.parse(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
 class ArgumentParser:
     def __init__(
         self,
@@ -16,47 +39,365 @@ class ArgumentParser:
         display_action: Action,
         delete_partitions_action: Action,
         copy_partitions: Action,
+        serve_action: Action = None,
+        verify_partitions_action: Action = None,
+        merge_reports_action: Action = None,
     ):
         self.switch_action = switch_action
         self.display_action = display_action
         self.delete_partitions_action = delete_partitions_action
         self.copy_partitions_action = copy_partitions
+        self.serve_action = serve_action
+        self.verify_partitions_action = verify_partitions_action
+        self.merge_reports_action = merge_reports_action
 
     def build_parser(self, args=None) -> argparse.Namespace:
         parser = argparse.ArgumentParser(
             description="Helper to automate some common bigquery tasks"
         )
+        parser.add_argument(
+            "--metrics-file",
+            help="write per-call metrics of the run to this file",
+        )
+        parser.add_argument(
+            "--metrics-format",
+            choices=METRICS_FORMATS,
+            default="json",
+            help="json summary or Prometheus textfile exposition",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="print the time spent in each phase to stderr",
+        )
+        parser.add_argument(
+            "--no-cache",
+            dest="cache",
+            action="store_false",
+            help="fetch table and view metadata instead of reusing recent lookups",
+        )
+        parser.add_argument(
+            "--socket",
+            default=os.environ.get("BIGQUERY_UTILS_SOCKET"),
+            help="run the command on the server listening on this socket, see serve",
+        )
+
+        # commands forwarded to serve write their progress to the connection
+        parser.set_defaults(stdout=None)
 
         subparsers = parser.add_subparsers()
 
         display = subparsers.add_parser("display")
         display.add_argument("--project-id", required=True)
         display.add_argument("--dataset-id", required=True)
-        display.add_argument("--view", required=True)
+        display_target = display.add_mutually_exclusive_group(required=True)
+        display_target.add_argument("--view")
+        display_target.add_argument(
+            "--all",
+            action="store_true",
+            help="report the color of every view in the dataset",
+        )
+        display.add_argument(
+            "--filter",
+            action="append",
+            default=[],
+            help="glob on view names, used with --all; may be repeated",
+        )
+        display.add_argument(
+            "--output",
+            choices=OUTPUTS,
+            default=TEXT,
+            help="ndjson writes one record per view and table",
+        )
+        display.add_argument(
+            "--parallelism",
+            type=positive_int,
+            default=DEFAULT_PARALLELISM,
+            help="maximum number of views fetched at the same time",
+        )
         display.set_defaults(func=self.display_action.run)
 
         switch = subparsers.add_parser("switch-color")
         switch.add_argument("--project-id", required=True)
         switch.add_argument("--dataset-id", required=True)
-        switch.add_argument("--view", required=True)
+        switch_target = switch.add_mutually_exclusive_group(required=True)
+        switch_target.add_argument("--view")
+        switch_target.add_argument(
+            "--manifest",
+            help="YAML file listing the views to switch together",
+        )
         switch.add_argument("--rebuild", action="store_true")
+        switch.add_argument(
+            "--rebuild-strategy",
+            choices=REBUILD_STRATEGIES,
+            default="copy",
+            help="how the non-production table is recreated by --rebuild; a snapshot is "
+            "read-only, so the view then serves a table nothing can write to until the "
+            "next copy or clone rebuild replaces it",
+        )
+        switch.add_argument(
+            "--parallelism",
+            type=positive_int,
+            default=DEFAULT_PARALLELISM,
+            help="maximum number of views read or rebuilt at the same time",
+        )
+        switch.add_argument(
+            "--output",
+            choices=OUTPUTS,
+            default=TEXT,
+            help="ndjson writes one record per finished view as it completes",
+        )
         switch.set_defaults(func=self.switch_action.run)
 
         delete_partitions = subparsers.add_parser("delete-partitions")
         delete_partitions.add_argument("--project-id", required=True)
         delete_partitions.add_argument("--dataset-id", required=True)
-        delete_partitions.add_argument("--table", required=True)
-        delete_partitions.add_argument("--start-date", required=True)
-        delete_partitions.add_argument("--end-date", required=True)
+        delete_partitions.add_argument(
+            "--table",
+            required=True,
+            nargs="+",
+            help="one or more tables: names, globs matched against the dataset, or @FILE "
+            "listing them one per line",
+        )
+        delete_partitions.add_argument(
+            "--start-date",
+            required=True,
+            help="first partition: YYYYMMDDHH, YYYYMMDD, YYYYMM, YYYY or an integer",
+        )
+        delete_partitions.add_argument("--end-date", required=True, help="last partition, included")
+        delete_partitions.add_argument(
+            "--granularity",
+            choices=GRANULARITIES,
+            help="partition granularity, inferred from --start-date unless integer",
+        )
+        delete_partitions.add_argument(
+            "--interval",
+            type=positive_int,
+            default=1,
+            help="width of integer range partitions",
+        )
+        delete_partitions.add_argument(
+            "--parallelism",
+            type=positive_int,
+            default=DEFAULT_PARALLELISM,
+            help="maximum number of partitions deleted at the same time",
+        )
+        delete_partitions.add_argument(
+            "--max-per-table",
+            type=positive_int,
+            help="maximum number of partitions of one table deleted at the same time, "
+            "--parallelism by default",
+        )
+        delete_partitions.add_argument(
+            "--no-plan",
+            dest="plan",
+            action="store_false",
+            help="skip the partition metadata lookup and process every date",
+        )
+        delete_partitions.add_argument(
+            "--strategy",
+            choices=STRATEGIES,
+            default=AUTO,
+            help="one call per partition, or one billed DML query for the whole range "
+            "with bulk; auto deletes partition by partition",
+        )
+        delete_partitions.add_argument(
+            "--asyncio",
+            action="store_true",
+            help="multiplex the partition calls on one event loop instead of threads, needs aiohttp",
+        )
+        delete_partitions.add_argument(
+            "--shard",
+            type=shard,
+            help="INDEX/COUNT, process only the INDEX-th of COUNT slices of the range (0-based)",
+        )
+        delete_partitions.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="print the planned deletions with their size and an estimated duration",
+        )
+        delete_partitions.add_argument(
+            "--journal",
+            help="file recording finished partitions, derived from the arguments by default",
+        )
+        delete_partitions.add_argument(
+            "--resume",
+            action="store_true",
+            help="skip the partitions the journal records as finished",
+        )
+        delete_partitions.add_argument(
+            "--output",
+            choices=OUTPUTS,
+            default=TEXT,
+            help="ndjson writes one record per finished partition as it completes",
+        )
         delete_partitions.set_defaults(func=self.delete_partitions_action.run)
 
         copy_partitions = subparsers.add_parser("copy-partitions")
         copy_partitions.add_argument("--src-project-id", required=True)
-        copy_partitions.add_argument("--dst-project-id", required=True)
+        copy_partitions.add_argument(
+            "--dst-project-id",
+            required=True,
+            nargs="+",
+            help="one or more projects receiving the partitions",
+        )
         copy_partitions.add_argument("--dataset-id", required=True)
-        copy_partitions.add_argument("--table", required=True)
-        copy_partitions.add_argument("--start-date", required=True)
-        copy_partitions.add_argument("--end-date", required=True)
+        copy_partitions.add_argument(
+            "--table",
+            required=True,
+            nargs="+",
+            help="one or more tables: names, globs matched against the dataset, or @FILE "
+            "listing them one per line",
+        )
+        copy_partitions.add_argument(
+            "--start-date",
+            required=True,
+            help="first partition: YYYYMMDDHH, YYYYMMDD, YYYYMM, YYYY or an integer",
+        )
+        copy_partitions.add_argument("--end-date", required=True, help="last partition, included")
+        copy_partitions.add_argument(
+            "--granularity",
+            choices=GRANULARITIES,
+            help="partition granularity, inferred from --start-date unless integer",
+        )
+        copy_partitions.add_argument(
+            "--interval",
+            type=positive_int,
+            default=1,
+            help="width of integer range partitions",
+        )
+        copy_partitions.add_argument(
+            "--parallelism",
+            type=positive_int,
+            default=DEFAULT_PARALLELISM,
+            help="maximum number of copy jobs running at the same time",
+        )
+        copy_partitions.add_argument(
+            "--max-per-table",
+            type=positive_int,
+            help="maximum number of partitions of one table copied at the same time, "
+            "--parallelism by default",
+        )
+        copy_partitions.add_argument(
+            "--no-plan",
+            dest="plan",
+            action="store_false",
+            help="skip the partition metadata lookup and process every date",
+        )
+        copy_partitions.add_argument(
+            "--incremental",
+            action="store_true",
+            help="copy only partitions that changed since the last copy",
+        )
+        copy_partitions.add_argument(
+            "--strategy",
+            choices=STRATEGIES,
+            default=AUTO,
+            help="one call per partition, one query for the whole range, or chosen from the plan; "
+            "bulk needs an existing destination table, auto copies into a missing one "
+            "partition by partition",
+        )
+        copy_partitions.add_argument(
+            "--asyncio",
+            action="store_true",
+            help="multiplex the partition calls on one event loop instead of threads, needs aiohttp",
+        )
+        copy_partitions.add_argument(
+            "--shard",
+            type=shard,
+            help="INDEX/COUNT, process only the INDEX-th of COUNT slices of the range (0-based)",
+        )
+        copy_partitions.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="print the planned copies with their size and an estimated duration",
+        )
+        copy_partitions.add_argument(
+            "--journal",
+            help="file recording finished partitions, derived from the arguments by default",
+        )
+        copy_partitions.add_argument(
+            "--resume",
+            action="store_true",
+            help="skip the partitions the journal records as finished",
+        )
+        copy_partitions.add_argument(
+            "--output",
+            choices=OUTPUTS,
+            default=TEXT,
+            help="ndjson writes one record per finished partition as it completes",
+        )
         copy_partitions.set_defaults(func=self.copy_partitions_action.run)
 
+        if self.verify_partitions_action is not None:
+            verify_partitions = subparsers.add_parser("verify-partitions")
+            verify_partitions.add_argument("--src-project-id", required=True)
+            verify_partitions.add_argument(
+                "--dst-project-id",
+                required=True,
+                nargs="+",
+                help="one or more projects compared with the source",
+            )
+            verify_partitions.add_argument("--dataset-id", required=True)
+            verify_partitions.add_argument("--table", required=True)
+            verify_partitions.add_argument(
+                "--start-date",
+                required=True,
+                help="first partition: YYYYMMDDHH, YYYYMMDD, YYYYMM or YYYY",
+            )
+            verify_partitions.add_argument(
+                "--end-date", required=True, help="last partition, included"
+            )
+            verify_partitions.add_argument(
+                "--granularity",
+                choices=GRANULARITIES,
+                help="partition granularity, inferred from --start-date",
+            )
+            verify_partitions.add_argument(
+                "--interval",
+                type=positive_int,
+                default=1,
+                help="width of integer range partitions",
+            )
+            verify_partitions.add_argument(
+                "--recopy",
+                action="store_true",
+                help="copy the mismatching partitions again from the source; the command "
+                "exits with an error while any mismatch is left",
+            )
+            verify_partitions.add_argument(
+                "--parallelism",
+                type=positive_int,
+                default=DEFAULT_PARALLELISM,
+                help="maximum number of copy jobs running at the same time with --recopy",
+            )
+            verify_partitions.add_argument(
+                "--output",
+                choices=OUTPUTS,
+                default=TEXT,
+                help="ndjson writes one record per mismatching partition",
+            )
+            verify_partitions.set_defaults(func=self.verify_partitions_action.run)
+
+        if self.merge_reports_action is not None:
+            merge_reports = subparsers.add_parser(
+                "merge-reports",
+                help="combine the journals or ndjson outputs of sharded runs",
+            )
+            merge_reports.add_argument("files", nargs="+", metavar="FILE")
+            merge_reports.add_argument(
+                "--output",
+                choices=OUTPUTS,
+                default=TEXT,
+                help="ndjson writes the merged partition and summary records",
+            )
+            merge_reports.set_defaults(func=self.merge_reports_action.run)
+
+        if self.serve_action is not None:
+            serve = subparsers.add_parser(
+                "serve",
+                help="keep a warm client and run the commands sent to --socket",
+            )
+            serve.set_defaults(func=self.serve_action.run, command_parser=self)
+
         return parser.parse_args(args)
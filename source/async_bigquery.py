@@ -0,0 +1,596 @@
+import asyncio
+import contextlib
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+import weakref
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    Optional,
+    Protocol,
+    TypeVar,
+)
+
+from source.bigquery_utils import BigQueryClient, job_bytes, job_id, table_from_resource
+from source.instrumentation import CallRecord, get_instrumentation
+from source.metadata_cache import MetadataCache
+from source.partition_executor import (
+    DEFAULT_MAX_POLL_FAILURES,
+    DEFAULT_POLL_INTERVAL,
+    FAILED,
+    SUCCEEDED,
+    PartitionResult,
+    PartitionTask,
+    task_queue,
+)
+from source.rate_limiter import (
+    DEFAULT_BASE_BACKOFF,
+    DEFAULT_MAX_BACKOFF,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_PROJECT_RATE,
+    DEFAULT_TABLE_RATE,
+    CallStats,
+    RateLimiter,
+    TokenBucket,
+    is_retryable,
+    is_throttled,
+)
+
+if TYPE_CHECKING:
+    from google.cloud.bigquery import Table
+
+T = TypeVar("T")
+
+BIGQUERY_API = "https://bigquery.googleapis.com/bigquery/v2"
+BIGQUERY_SCOPE = "https://www.googleapis.com/auth/bigquery"
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_ASYNC_MAX_CONCURRENCY = 1024
+
+# BigQuery reports a failed job with a reason, not an HTTP status
+_JOB_ERROR_STATUS = {
+    "notFound": 404,
+    "duplicate": 409,
+    "accessDenied": 403,
+    "rateLimitExceeded": 429,
+    "backendError": 503,
+    "internalError": 500,
+}
+
+
+class AsyncTransport(Protocol):
+    async def open(self) -> None:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+    async def request(
+        self, method: str, path: str, params: dict = None, body: dict = None
+    ) -> dict:
+        ...
+
+
+class AiohttpTransport:
+    # one pooled session per event loop; the connector bounds the sockets
+    # opened however many coroutines are waiting on BigQuery
+    def __init__(self, credentials, max_connections: int = DEFAULT_MAX_CONNECTIONS):
+        self.credentials = credentials
+        self.max_connections = max_connections
+        self._session = None
+
+    async def open(self) -> None:
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError("--asyncio needs aiohttp, pip install aiohttp") from e
+
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections)
+        )
+
+    async def close(self) -> None:
+        await self._session.close()
+
+    async def request(
+        self, method: str, path: str, params: dict = None, body: dict = None
+    ) -> dict:
+        headers = {"Authorization": f"Bearer {await self._token()}"}
+        async with self._session.request(
+            method, f"{BIGQUERY_API}/{path}", params=params, json=body, headers=headers
+        ) as response:
+            text = await response.text()
+            payload = json.loads(text) if text else {}
+            if response.status >= 400:
+                from google.api_core import exceptions
+
+                error = payload.get("error", {})
+                raise exceptions.from_http_status(
+                    response.status,
+                    error.get("message", response.reason),
+                    errors=error.get("errors", []),
+                )
+            return payload
+
+    async def _token(self) -> str:
+        if not self.credentials.valid:
+            await asyncio.to_thread(_refresh, self.credentials)
+        return self.credentials.token
+
+
+_refresh_lock = threading.Lock()
+
+
+def _refresh(credentials) -> None:
+    from google.auth.transport.requests import Request
+
+    with _refresh_lock:
+        if not credentials.valid:
+            credentials.refresh(Request())
+
+
+class AsyncRateLimiter(RateLimiter):
+    # the same retry policy and backoff as RateLimiter, but waits on the event
+    # loop instead of blocking a thread per call; built with like(), it draws
+    # on the buckets and the adaptive concurrency of the given limiter, so
+    # coroutines and the threads running whole-table tasks share one budget
+    def __init__(
+        self,
+        table_rate: float = DEFAULT_TABLE_RATE,
+        project_rate: float = DEFAULT_PROJECT_RATE,
+        max_concurrency: int = DEFAULT_ASYNC_MAX_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_backoff: float = DEFAULT_BASE_BACKOFF,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+    ):
+        super().__init__(
+            table_rate, project_rate, max_concurrency, max_retries, base_backoff, max_backoff
+        )
+        # per event loop, set when a concurrency slot may have freed; every
+        # command run by serve gets a loop of its own
+        self._released = weakref.WeakKeyDictionary()
+        self._released_lock = threading.Lock()
+        self.concurrency.add_listener(self._on_release)
+
+    @classmethod
+    def like(cls, rate_limiter: RateLimiter) -> "AsyncRateLimiter":
+        limiter = cls(
+            rate_limiter.table_rate,
+            rate_limiter.project_rate,
+            rate_limiter.concurrency.maximum,
+            max_retries=rate_limiter.max_retries,
+            base_backoff=rate_limiter.base_backoff,
+            max_backoff=rate_limiter.max_backoff,
+        )
+        limiter._buckets = rate_limiter._buckets
+        limiter._buckets_lock = rate_limiter._buckets_lock
+        limiter.concurrency = rate_limiter.concurrency
+        limiter.concurrency.add_listener(limiter._on_release)
+        return limiter
+
+    async def call_async(
+        self,
+        project_id: str,
+        table_id: Optional[str],
+        operation: Callable[[], Awaitable[T]],
+        stats: Optional[CallStats] = None,
+        retryable: Callable[[Exception], bool] = is_retryable,
+    ) -> T:
+        stats = stats or CallStats()
+        attempt = 0
+        while True:
+            queued = time.monotonic()
+            await _acquire(self._bucket(f"project:{project_id}", self.project_rate))
+            if table_id is not None:
+                table_key = table_id.split("$")[0]
+                await _acquire(self._bucket(f"table:{table_key}", self.table_rate))
+            async with self._slot():
+                stats.queue_wait += time.monotonic() - queued
+                try:
+                    result = await operation()
+                except Exception as e:
+                    if not retryable(e) or attempt >= self.max_retries:
+                        raise
+                    if is_throttled(e):
+                        self.concurrency.on_throttle()
+                    error = e
+                else:
+                    self.concurrency.on_success()
+                    return result
+
+            backoff = self.backoff(attempt)
+            logging.warning(
+                f"retrying {table_id or project_id} in {backoff:.1f}s after: {error}"
+            )
+            await asyncio.sleep(backoff)
+            attempt += 1
+            stats.retries = attempt
+
+    @contextlib.asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        loop = asyncio.get_running_loop()
+        with self._released_lock:
+            released = self._released.get(loop)
+            if released is None:
+                released = self._released[loop] = asyncio.Event()
+        while True:
+            # cleared before trying, a slot freed in between sets it again
+            released.clear()
+            if self.concurrency.try_enter():
+                break
+            await released.wait()
+        try:
+            yield
+        finally:
+            self.concurrency.__exit__(None, None, None)
+
+    def _on_release(self) -> None:
+        # called from any thread, the events are set on their own loop
+        with self._released_lock:
+            released = list(self._released.items())
+        for loop, event in released:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # the loop of a finished command
+                pass
+
+
+async def _acquire(bucket: TokenBucket) -> None:
+    while True:
+        wait = bucket.try_acquire()
+        if wait == 0:
+            return
+        await asyncio.sleep(wait)
+
+
+class RestJob:
+    # the REST job resource, shaped like the library's jobs so job_id()
+    # and job_bytes() read it the same way
+    def __init__(self, resource: dict):
+        self._properties = resource
+
+    @property
+    def job_id(self) -> str:
+        return self._properties["jobReference"]["jobId"]
+
+    @property
+    def project(self) -> str:
+        return self._properties["jobReference"]["projectId"]
+
+    @property
+    def location(self) -> Optional[str]:
+        return self._properties["jobReference"].get("location")
+
+    @property
+    def state(self) -> Optional[str]:
+        return self._properties.get("status", {}).get("state")
+
+    def error(self) -> Optional[Exception]:
+        error_result = self._properties.get("status", {}).get("errorResult")
+        if error_result is None:
+            return None
+        from google.api_core import exceptions
+
+        return exceptions.from_http_status(
+            _JOB_ERROR_STATUS.get(error_result.get("reason"), 400),
+            error_result.get("message", f"job {self.job_id} failed"),
+            errors=[error_result],
+        )
+
+
+class AsyncBigQueryClient:
+    def __init__(
+        self,
+        transport_factory: Callable[[], AsyncTransport] = None,
+        rate_limiter: AsyncRateLimiter = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        metadata_cache: MetadataCache = None,
+    ):
+        self.transport_factory = transport_factory or self._aiohttp_transport
+        self.rate_limiter = rate_limiter or AsyncRateLimiter()
+        self.metadata_cache = metadata_cache
+        self.max_connections = max_connections
+        self.poll_interval = poll_interval
+        self._credentials = None
+        self._credentials_lock = threading.Lock()
+        self._transports = weakref.WeakKeyDictionary()
+
+    async def __aenter__(self) -> "AsyncBigQueryClient":
+        transport = self.transport_factory()
+        await transport.open()
+        self._transports[asyncio.get_running_loop()] = transport
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._transports.pop(asyncio.get_running_loop()).close()
+
+    def _aiohttp_transport(self) -> AiohttpTransport:
+        with self._credentials_lock:
+            if self._credentials is None:
+                import google.auth
+
+                self._credentials, _ = google.auth.default(scopes=[BIGQUERY_SCOPE])
+        return AiohttpTransport(self._credentials, self.max_connections)
+
+    def _request(
+        self, method: str, path: str, params: dict = None, body: dict = None
+    ) -> Awaitable[dict]:
+        transport = self._transports.get(asyncio.get_running_loop())
+        if transport is None:
+            raise RuntimeError("AsyncBigQueryClient is used outside of async with")
+        return transport.request(method, path, params, body)
+
+    async def _call(
+        self,
+        method: str,
+        project_id: str,
+        table_id: Optional[str],
+        operation: Callable[[], Awaitable[T]],
+    ) -> T:
+        stats = CallStats()
+        started = time.monotonic()
+        try:
+            result = await self.rate_limiter.call_async(
+                project_id, table_id, operation, stats
+            )
+        except Exception as e:
+            BigQueryClient._record(
+                method, project_id, table_id, started, stats, error=str(e)
+            )
+            raise
+        BigQueryClient._record(
+            method, project_id, table_id, started, stats, job_id=job_id(result)
+        )
+        return result
+
+    async def _write(
+        self,
+        method: str,
+        project_id: str,
+        table_id: str,
+        operation: Callable[[], Awaitable[T]],
+    ) -> T:
+        try:
+            return await self._call(method, project_id, table_id, operation)
+        finally:
+            if self.metadata_cache is not None:
+                self.metadata_cache.invalidate(table_id)
+
+    async def extract_view_info(
+        self, project_id: str, dataset: str, table: str, use_cache: bool = True
+    ) -> "Table":
+        view_id = f"{project_id}.{dataset}.{table}"
+        resource = (
+            self.metadata_cache.get(view_id)
+            if self.metadata_cache is not None and use_cache
+            else None
+        )
+        if resource is None:
+            resource = await self._call(
+                "extract_view_info",
+                project_id,
+                view_id,
+                lambda: self._request("GET", _table_path(project_id, dataset, table)),
+            )
+            if self.metadata_cache is not None:
+                self.metadata_cache.put(view_id, resource)
+        return table_from_resource(resource)
+
+    async def update_view(
+        self, project_id: str, dataset: str, table: str, query_updated: str
+    ) -> None:
+        await self._write(
+            "update_view",
+            project_id,
+            f"{project_id}.{dataset}.{table}",
+            lambda: self._request(
+                "PATCH",
+                _table_path(project_id, dataset, table),
+                body={"view": {"query": query_updated, "useLegacySql": False}},
+            ),
+        )
+
+    async def delete_table(self, project_id: str, dataset: str, table: str) -> None:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            await self._write(
+                "delete_table",
+                project_id,
+                f"{project_id}.{dataset}.{table}",
+                lambda: self._request("DELETE", _table_path(project_id, dataset, table)),
+            )
+        except NotFound:
+            pass
+
+    async def copy_table(
+        self,
+        src_project_id: str,
+        dataset: str,
+        start_table: str,
+        dst_table: str,
+        dst_project_id: str = None,
+        write_disposition: str = "WRITE_TRUNCATE",
+    ) -> RestJob:
+        job = await self.submit_copy_table(
+            src_project_id, dataset, start_table, dst_table, dst_project_id, write_disposition
+        )
+        return await self.wait_for_job(job)
+
+    async def submit_copy_table(
+        self,
+        src_project_id: str,
+        dataset: str,
+        start_table: str,
+        dst_table: str,
+        dst_project_id: str = None,
+        write_disposition: str = "WRITE_TRUNCATE",
+    ) -> RestJob:
+        project_id = dst_project_id or src_project_id
+        # the id is chosen here, so a retried insert cannot start a second job
+        reference = {"projectId": project_id, "jobId": f"bigquery_utils_{uuid.uuid4().hex}"}
+        body = {
+            "jobReference": reference,
+            "configuration": {
+                "copy": {
+                    "sourceTables": [_table_reference(src_project_id, dataset, start_table)],
+                    "destinationTable": _table_reference(project_id, dataset, dst_table),
+                    "writeDisposition": write_disposition,
+                }
+            },
+        }
+
+        async def insert() -> RestJob:
+            from google.api_core.exceptions import Conflict
+
+            try:
+                resource = await self._request(
+                    "POST", f"projects/{project_id}/jobs", body=body
+                )
+            except Conflict:
+                resource = await self._request(
+                    "GET", f"projects/{project_id}/jobs/{reference['jobId']}"
+                )
+            return RestJob(resource)
+
+        return await self._write(
+            "submit_copy_table", project_id, f"{project_id}.{dataset}.{dst_table}", insert
+        )
+
+    async def wait_for_job(self, job: RestJob) -> RestJob:
+        # polls go straight to the transport, like job.done() on the
+        # synchronous client, so they do not use the table buckets
+        failures = 0
+        while job.state != "DONE":
+            await asyncio.sleep(self.poll_interval)
+            params = {"location": job.location} if job.location else None
+            try:
+                job = RestJob(
+                    await self._request(
+                        "GET", f"projects/{job.project}/jobs/{job.job_id}", params
+                    )
+                )
+            except Exception as e:
+                failures += 1
+                if not is_retryable(e) or failures >= DEFAULT_MAX_POLL_FAILURES:
+                    raise
+                logging.warning(f"polling job {job.job_id} failed: {e}")
+            else:
+                failures = 0
+        error = job.error()
+        if error is not None:
+            raise error
+        return job
+
+
+def _table_path(project_id: str, dataset: str, table: str) -> str:
+    return f"projects/{project_id}/datasets/{dataset}/tables/{table}"
+
+
+def _table_reference(project_id: str, dataset: str, table: str) -> dict:
+    return {"projectId": project_id, "datasetId": dataset, "tableId": table}
+
+
+class AsyncPartitionExecutor:
+    # runs the tasks on an event loop in a background thread and yields the
+    # results like PartitionExecutor, so journals, summaries and progress
+    # are handled by the caller unchanged; coroutine operations are
+    # multiplexed on the loop, plain callables run in the default executor
+    def __init__(self, parallelism: int, session: AsyncContextManager = None):
+        if parallelism < 1:
+            raise ValueError(f"parallelism must be at least 1: {parallelism}")
+        self.parallelism = parallelism
+        self.session = session
+
+    def run(self, tasks: Iterable[PartitionTask]) -> Iterator[PartitionResult]:
+        results = queue.Queue()
+        finished = object()
+
+        def run_loop() -> None:
+            try:
+                asyncio.run(self._run(tasks, results.put))
+            except BaseException as e:
+                results.put(e)
+            finally:
+                results.put(finished)
+
+        threading.Thread(target=run_loop, name="asyncio", daemon=True).start()
+        while True:
+            result = results.get()
+            if result is finished:
+                return
+            if isinstance(result, BaseException):
+                raise result
+            yield result
+
+    async def _run(
+        self, tasks: Iterable[PartitionTask], emit: Callable[[Any], None]
+    ) -> None:
+        if self.session is None:
+            return await self._run_tasks(tasks, emit)
+        async with self.session:
+            await self._run_tasks(tasks, emit)
+
+    async def _run_tasks(
+        self, tasks: Iterable[PartitionTask], emit: Callable[[Any], None]
+    ) -> None:
+        tasks = task_queue(tasks)
+        pending = set()
+        while True:
+            while len(pending) < self.parallelism:
+                task = tasks.take()
+                if task is None:
+                    break
+                pending.add(asyncio.ensure_future(_execute(task)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                # released on the loop, before more tasks are taken
+                tasks.release(result.target)
+                emit(result)
+
+
+async def _execute(task: PartitionTask) -> PartitionResult:
+    started = time.monotonic()
+    try:
+        if asyncio.iscoroutinefunction(task.operation):
+            job = await task.operation()
+        else:
+            job = await asyncio.to_thread(task.operation)
+    except Exception as e:
+        logging.error(f"operation on {task.partition} failed: {e}")
+        return PartitionResult(
+            task.partition,
+            FAILED,
+            time.monotonic() - started,
+            error=str(e),
+            target=task.target,
+        )
+    result = PartitionResult(
+        task.partition,
+        SUCCEEDED,
+        time.monotonic() - started,
+        job_id=job_id(job),
+        bytes=job_bytes(job),
+        target=task.target,
+    )
+    if result.job_id is not None:
+        get_instrumentation().record_call(
+            CallRecord(
+                "job", task.partition, result.duration, job_id=result.job_id, bytes=result.bytes
+            )
+        )
+    return result
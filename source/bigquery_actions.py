@@ -1,17 +1,104 @@
 import argparse
-import datetime
+import contextlib
+import fnmatch
+import functools
 import logging
-from typing import List
-
-from google.cloud.bigquery import Table
+import os
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from source.arg_parser import Action
 from source.bigquery_utils import (
-    extract_table_from_query,
-    extract_production_table_color,
+    MIXED,
     BigQueryClient,
-    extract_table_from_query_name_only,
+    Partitioning,
+    ViewQueryAnalysis,
+    analyze_view_query,
+    switch_color,
+)
+from source.bulk_strategy import (
+    AUTO,
+    BULK,
+    PER_PARTITION,
+    bulk_copy_query,
+    bulk_delete_query,
+    choose_strategy,
+)
+from source.cost_planner import (
+    BULK_COPY,
+    BULK_DELETE,
+    COPY,
+    COPY_TABLE,
+    DELETE,
+    TRUNCATE,
+    DryRun,
+    estimate_seconds,
+    format_duration,
+    planned_operations,
+)
+from source.instrumentation import get_instrumentation
+from source.journal import Journal, default_journal_path
+from source.manifest import ViewReference, load_manifest
+from source.partition_executor import (
+    FAILED,
+    SUCCEEDED,
+    FairQueue,
+    JobPoller,
+    JobTask,
+    PartitionExecutor,
+    PartitionResult,
+    PartitionTask,
+    RunSummary,
+    check_summaries,
+    round_robin,
+)
+from source.partition_planner import (
+    WHOLE_TABLE,
+    PartitionPlan,
+    largest_first,
+    plan_incremental_copy,
+    plan_partitions,
+    unplanned,
+    without_completed,
 )
+from source.partition_range import DAY, INTEGER, PartitionRange
+from source.progress import NdjsonWriter, progress_writer
+from source.rate_limiter import DEFAULT_MAX_CONCURRENCY
+from source.sharding import merge_results, shard_partitions
+from source.verification import (
+    MISSING_IN_SOURCE,
+    Mismatch,
+    PartitionFingerprint,
+    diff_fingerprints,
+    fingerprint_query,
+    parse_fingerprints,
+)
+from source.view_rewriter import TableReference
+
+T = TypeVar("T")
+
+ROLLED_BACK = "rolled back"
+
+
+@dataclass
+class ViewColorReport:
+    view: str
+    table: Optional[str] = None
+    color: Optional[str] = None
+    error: Optional[str] = None
 
 
 class BigQueryDisplayAction(Action):
@@ -20,10 +107,126 @@ class BigQueryDisplayAction(Action):
         self.bigquery_client = bigquery_client
 
     def run(self, args: argparse.Namespace):
+        if args.all is True:
+            return self._display_dataset(args)
+
+        # the command audits the color being served, a cached view could show
+        # the one from before a switch made elsewhere
         view = self.bigquery_client.extract_view_info(
-            args.project_id, args.dataset_id, args.view
+            args.project_id, args.dataset_id, args.view, use_cache=False
+        )
+        references = analyze_view_query(view.view_query).references
+        progress = progress_writer(args)
+        if progress is not None:
+            for reference in references:
+                progress.write(
+                    asdict(ViewColorReport(args.view, reference.table, reference.color))
+                )
+            return None
+        if len(references) == 1:
+            return references[0].color
+        return "\n".join(f"{reference.table}: {reference.color}" for reference in references)
+
+    def _display_dataset(self, args: argparse.Namespace) -> str:
+        views = [
+            view
+            for view in self.bigquery_client.list_views(
+                args.project_id, args.dataset_id
+            )
+            if not args.filter
+            or any(fnmatch.fnmatchcase(view, pattern) for pattern in args.filter)
+        ]
+        logging.info(f"fetching {len(views)} views from {args.dataset_id}")
+
+        describe = functools.partial(
+            self._describe_view, args.project_id, args.dataset_id
+        )
+        with ThreadPoolExecutor(max_workers=args.parallelism) as pool:
+            progress = progress_writer(args)
+            if progress is not None:
+                for reports in as_completed(pool.submit(describe, view) for view in views):
+                    for report in reports.result():
+                        progress.write(asdict(report))
+                return None
+            reports = [
+                report for reports in pool.map(describe, sorted(views)) for report in reports
+            ]
+
+        return format_view_color_table(reports)
+
+    def _describe_view(
+        self, project_id: str, dataset: str, view_name: str
+    ) -> List[ViewColorReport]:
+        # one report per referenced table, a view joining several colored
+        # tables shows each of them; read live like a single view
+        try:
+            view = self.bigquery_client.extract_view_info(
+                project_id, dataset, view_name, use_cache=False
+            )
+            analysis = analyze_view_query(view.view_query)
+        except Exception as e:
+            logging.error(f"cannot describe view {view_name}: {e}")
+            return [ViewColorReport(view_name, error=str(e))]
+        return [
+            ViewColorReport(view_name, reference.table, reference.color)
+            for reference in analysis.references
+        ]
+
+
+def format_view_color_table(reports: List[ViewColorReport]) -> str:
+    rows = [("VIEW", "TABLE", "COLOR")] + [
+        (report.view, report.table or "-", report.color or f"error: {report.error}")
+        for report in reports
+    ]
+    widths = [max(len(row[column]) for row in rows) for column in range(2)]
+    return "\n".join(
+        f"{row[0]:<{widths[0]}}  {row[1]:<{widths[1]}}  {row[2]}" for row in rows
+    )
+
+
+def view_switch_record(
+    view: ViewReference,
+    analysis: ViewQueryAnalysis,
+    status: str,
+    error: Optional[str] = None,
+) -> dict:
+    return {
+        "type": "view",
+        "view": str(view),
+        "from": analysis.color,
+        "to": switch_color(analysis.color),
+        "status": status,
+        "error": error,
+    }
+
+
+def check_single_color(view: ViewReference, analysis: ViewQueryAnalysis) -> None:
+    # switching flips each table, so a view reading blue and green tables
+    # would stay mixed, only the other way around
+    if analysis.color == MIXED:
+        tables = ", ".join(
+            f"{reference.table} ({reference.color})" for reference in analysis.references
+        )
+        raise ValueError(
+            f"cannot switch {view}, it reads tables of both colors: {tables}"
+        )
+
+
+def check_one_color_per_table(
+    tables: Dict[Tuple[str, str, str], Tuple[str, TableReference]]
+) -> None:
+    # views reading both colors of a table would rebuild each color from the
+    # other, the outcome depending on which copy runs last
+    colors = defaultdict(set)
+    for (project_id, dataset_id, _), (_, reference) in tables.items():
+        base_table = reference.table_name_only[: -len(reference.color) - 1]
+        colors[f"{project_id}.{dataset_id}.{base_table}"].add(reference.color)
+    conflicts = sorted(table for table, found in colors.items() if len(found) > 1)
+    if conflicts:
+        raise ValueError(
+            f"the manifest reads both colors of {', '.join(conflicts)}, "
+            f"switch those views to one color first"
         )
-        return extract_production_table_color(view.view_query)
 
 
 class BigQuerySwitchAction(Action):
@@ -32,76 +235,321 @@ class BigQuerySwitchAction(Action):
         self.bigquery_client = bigquery_client
 
     def run(self, args: argparse.Namespace):
+        if args.manifest is not None:
+            return self._run_manifest(args)
+
         view = self.bigquery_client.extract_view_info(
-            args.project_id, args.dataset_id, args.view
+            args.project_id, args.dataset_id, args.view, use_cache=False
         )
 
+        analysis = analyze_view_query(view.view_query)
+        check_single_color(ViewReference(args.project_id, args.dataset_id, args.view), analysis)
+
         if args.rebuild is True:
-            self.__rebuild_non_production_table(args.project_id, args.dataset_id, view)
+            for reference in analysis.references:
+                self.__rebuild_non_production_table(
+                    args.project_id, reference, args.rebuild_strategy
+                )
 
-        query_updated = self._switch_and_replace_color(view.view_query)
         self.bigquery_client.update_view(
-            args.project_id, args.dataset_id, args.view, query_updated
+            args.project_id, args.dataset_id, args.view, analysis.switched_query
         )
-        return query_updated
+        progress = progress_writer(args)
+        if progress is not None:
+            view = ViewReference(args.project_id, args.dataset_id, args.view)
+            progress.write(view_switch_record(view, analysis, SUCCEEDED))
+            return None
+        return analysis.switched_query
+
+    def _run_manifest(self, args: argparse.Namespace) -> str:
+        views = load_manifest(args.manifest, args.project_id, args.dataset_id)
+        logging.info(f"switching {len(views)} views from {args.manifest}")
+
+        instrumentation = get_instrumentation()
+        with ThreadPoolExecutor(max_workers=args.parallelism) as pool:
+            with instrumentation.phase("read views"):
+                queries = list(pool.map(self._read_view_query, views))
+                analyses = [analyze_view_query(query) for query in queries]
+            for view, analysis in zip(views, analyses):
+                check_single_color(view, analysis)
+
+            if args.rebuild is True:
+                tables = {
+                    (
+                        reference.project_id or view.project_id,
+                        reference.dataset_id,
+                        reference.table_name_only,
+                    ): (view.project_id, reference)
+                    for view, analysis in zip(views, analyses)
+                    for reference in analysis.references
+                }
+                check_one_color_per_table(tables)
+                rebuilds = [
+                    pool.submit(
+                        self.__rebuild_non_production_table,
+                        project_id,
+                        reference,
+                        args.rebuild_strategy,
+                    )
+                    for project_id, reference in tables.values()
+                ]
+                with instrumentation.phase("rebuild"):
+                    for rebuild in rebuilds:
+                        rebuild.result()
+
+        # the rate limiter never runs more calls than its concurrency ceiling,
+        # extra threads would only wait for it
+        with instrumentation.phase("switch"), ThreadPoolExecutor(
+            max_workers=min(len(views), DEFAULT_MAX_CONCURRENCY)
+        ) as pool:
+            updates = {
+                view: pool.submit(
+                    self.bigquery_client.update_view,
+                    view.project_id,
+                    view.dataset_id,
+                    view.view,
+                    analysis.switched_query,
+                )
+                for view, analysis in zip(views, analyses)
+            }
+            failed = {}
+            for view, update in updates.items():
+                try:
+                    update.result()
+                except Exception as e:
+                    failed[view] = e
+
+        # records are written once the batch is settled, a view reported as
+        # switched is never rolled back afterwards
+        progress = progress_writer(args)
+        if failed:
+            switched = [
+                (view, query)
+                for view, query in zip(views, queries)
+                if view not in failed
+            ]
+            self._rollback(switched)
+            if progress is not None:
+                for view, analysis in zip(views, analyses):
+                    error = failed.get(view)
+                    progress.write(
+                        view_switch_record(
+                            view,
+                            analysis,
+                            FAILED if error is not None else ROLLED_BACK,
+                            str(error) if error is not None else None,
+                        )
+                    )
+            raise RuntimeError(
+                f"switch failed for {', '.join(str(view) for view in failed)}: "
+                f"{'; '.join(str(e) for e in failed.values())}; "
+                f"{len(switched)} switched views rolled back"
+            )
+
+        if progress is not None:
+            for view, analysis in zip(views, analyses):
+                progress.write(view_switch_record(view, analysis, SUCCEEDED))
+            return None
+        return "\n".join(
+            f"{view}: {analysis.color} -> {switch_color(analysis.color)}"
+            for view, analysis in zip(views, analyses)
+        )
+
+    def _read_view_query(self, view: ViewReference) -> str:
+        # the query read here is rewritten and kept for the rollback, a cached
+        # copy would overwrite whatever changed in the view since
+        return self.bigquery_client.extract_view_info(
+            view.project_id, view.dataset_id, view.view, use_cache=False
+        ).view_query
+
+    def _rollback(self, switched: List[Tuple[ViewReference, str]]) -> None:
+        if not switched:
+            return
+        logging.warning(f"rolling back {len(switched)} switched views")
+        with ThreadPoolExecutor(
+            max_workers=min(len(switched), DEFAULT_MAX_CONCURRENCY)
+        ) as pool:
+            rollbacks = {
+                view: pool.submit(
+                    self.bigquery_client.update_view,
+                    view.project_id,
+                    view.dataset_id,
+                    view.view,
+                    query,
+                )
+                for view, query in switched
+            }
+            for view, rollback in rollbacks.items():
+                try:
+                    rollback.result()
+                except Exception as e:
+                    logging.error(f"rollback of {view} failed: {e}")
 
     def __rebuild_non_production_table(
-        self, project_id: str, dataset: str, view: Table
+        self, view_project_id: str, reference: TableReference, strategy: str
     ) -> None:
-        production_table = extract_table_from_query_name_only(
-            extract_table_from_query(view.view_query)
-        )
-        actual_production_color = extract_production_table_color(view.view_query)
-        actual_non_production_color = self._switch_color(actual_production_color)
-        non_production_table = production_table.replace(
-            actual_production_color, actual_non_production_color
-        )
+        production_table = reference.table_name_only
+        non_production_table = reference.non_production_table_name_only
 
-        logging.info(f"deleting table {non_production_table}")
-        self.bigquery_client.delete_table(
-            project_id, f"{dataset}_versions", non_production_table
-        )
         logging.info(
-            f"table deleted... coping table {production_table} into {non_production_table}"
+            f"rebuilding table {non_production_table} from {production_table} with {strategy}"
         )
-        self.bigquery_client.copy_table(
-            project_id,
-            f"{dataset}_versions",
+        # the tables live where the query points, whatever the view's dataset
+        self.bigquery_client.rebuild_table(
+            reference.project_id or view_project_id,
+            reference.dataset_id,
             production_table,
             non_production_table,
+            strategy,
         )
-        logging.info(f"copy done")
+        logging.info(f"rebuild done")
 
     @staticmethod
     def _switch_and_replace_color(query: str) -> str:
-        table = extract_table_from_query(query)
-
-        current_color = extract_production_table_color(query)
-        new_color = BigQuerySwitchAction._switch_color(current_color)
-        new_table_name = table.replace(current_color, new_color)
-        return query.replace(table, new_table_name)
+        return analyze_view_query(query).switched_query
 
     @staticmethod
     def _switch_color(current_color: str) -> str:
-        return "blue" if current_color == "green" else "green"
+        return switch_color(current_color)
 
 
 def generate_range(start_date_str: str, end_date_str: str) -> List[str]:
-    date_format = "%Y%m%d"
-    start_date = datetime.datetime.strptime(start_date_str, date_format).date()
-    end_date = datetime.datetime.strptime(end_date_str, date_format).date()
+    return list(PartitionRange(start_date_str, end_date_str, DAY))
 
-    number_of_days = (end_date - start_date).days
 
-    if number_of_days <= 0:
-        raise ValueError(
-            f"actual cannot be in the future: actual: {start_date_str}, current_date: {end_date_str}"
-        )
+def finish(summary: RunSummary, progress: Optional[NdjsonWriter]) -> Optional[RunSummary]:
+    if progress is None:
+        check_summaries([summary], str(summary))
+        return summary
+    progress.write(summary.to_record())
+    check_summaries([summary], None)
+    return None
 
-    return [
-        (start_date + datetime.timedelta(days=day)).strftime(date_format)
-        for day in range(number_of_days + 1)
-    ]
+
+def dry_run_result(
+    args: argparse.Namespace, reports: List[DryRun], calls_per_second: float
+) -> Optional[str]:
+    operations = [planned for report in reports for planned in report.operations]
+    seconds = estimate_seconds(operations, args.parallelism, calls_per_second)
+    progress = progress_writer(args)
+    if progress is not None:
+        for report in reports:
+            for planned in report.operations:
+                progress.write(planned.to_record(report.operation))
+            progress.write({**report.to_record(), "estimated_seconds": seconds})
+        return None
+    return "\n".join(
+        [
+            *(str(report) for report in reports),
+            f"estimated duration: {format_duration(seconds)} "
+            f"with parallelism {args.parallelism}",
+        ]
+    )
+
+
+def wait_for(submit: Callable[[], T]) -> T:
+    job = submit()
+    job.result()
+    return job
+
+
+def requested_partitions(args: argparse.Namespace) -> PartitionRange:
+    return PartitionRange(args.start_date, args.end_date, args.granularity, args.interval)
+
+
+def shard_name(args: argparse.Namespace) -> Tuple[str, ...]:
+    # workers of one run sharing a cache directory must not share a journal
+    if args.shard is None:
+        return ()
+    return (f"shard{args.shard.index}of{args.shard.count}",)
+
+
+def requested_strategy(args: argparse.Namespace) -> str:
+    if args.granularity != INTEGER:
+        return args.strategy
+    # range conditions are built on time bounds, integer ranges have none
+    if args.strategy == BULK:
+        raise ValueError("the bulk strategy needs time partitions")
+    return PER_PARTITION
+
+
+def requested_tables(
+    args: argparse.Namespace, project_id: str, bigquery_client: BigQueryClient
+) -> List[str]:
+    # table names, globs matched against the tables of the dataset, and
+    # @FILE listing either one per line
+    names = []
+    for value in args.table:
+        if value.startswith("@"):
+            names.extend(read_table_names(value[1:]))
+        else:
+            names.append(value)
+
+    tables = []
+    listing = None
+    for name in names:
+        if not any(character in name for character in "*?["):
+            tables.append(name)
+            continue
+        if listing is None:
+            listing = bigquery_client.list_tables(project_id, args.dataset_id)
+        matched = [table for table in listing if fnmatch.fnmatchcase(table, name)]
+        if not matched:
+            logging.warning(f"no table of {args.dataset_id} matches {name}")
+        tables.extend(matched)
+    if not tables:
+        raise ValueError(f"no table of {args.dataset_id} matches {' '.join(args.table)}")
+    return list(dict.fromkeys(tables))
+
+
+def read_table_names(path: str) -> List[str]:
+    with open(path) as tables_file:
+        return [
+            line.strip()
+            for line in tables_file
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+@dataclass(frozen=True)
+class TableTarget:
+    # a table of the run, and for a copy one of its destinations; the label
+    # keys tasks, journals and summaries, with a single table it is only the
+    # destination project, or None for a deletion
+    table: str
+    label: Optional[str]
+    destination: Optional[str] = None
+
+
+def plan_tables(
+    tables: List[str], plan: Callable[[str], T], parallelism: int
+) -> Dict[str, T]:
+    if len(tables) == 1:
+        return {tables[0]: plan(tables[0])}
+    # the listings of the tables are independent, so they run side by side
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(tables))) as pool:
+        return dict(zip(tables, pool.map(plan, tables)))
+
+
+def fan_out_journal_path(path: str, label: str) -> str:
+    # each target resumes on its own, so each gets its own file
+    root, extension = os.path.splitext(path)
+    return f"{root}.{label}{extension}"
+
+
+def finish_all(
+    summaries: List[RunSummary], progress: Optional[NdjsonWriter]
+) -> Union[RunSummary, str, None]:
+    if len(summaries) == 1:
+        return finish(summaries[0], progress)
+    if progress is not None:
+        for summary in summaries:
+            progress.write(summary.to_record())
+        check_summaries(summaries, None)
+        return None
+    output = "\n".join(str(summary) for summary in summaries)
+    check_summaries(summaries, output)
+    return output
 
 
 class BigQueryDeletePartitionsAction(Action):
@@ -110,13 +558,238 @@ class BigQueryDeletePartitionsAction(Action):
         self.bigquery_client = bigquery_client
 
     def run(self, args: argparse.Namespace):
-        dates = generate_range(args.start_date, args.end_date)
-        logging.info(f"start deleting tables for {dates}")
-        for date in dates:
-            self.bigquery_client.delete_table(
-                args.project_id, args.dataset_id, f"{args.table}${date}"
+        dates = shard_partitions(requested_partitions(args), args.shard)
+        tables = requested_tables(args, args.project_id, self.bigquery_client)
+        targets = [
+            TableTarget(
+                table,
+                f"{args.project_id}.{args.dataset_id}.{table}" if len(tables) > 1 else None,
+            )
+            for table in tables
+        ]
+        journals = {target.label: self._journal(args, target) for target in targets}
+        with get_instrumentation().phase("plan"):
+            table_plans = plan_tables(
+                tables, functools.partial(self._plan, args, dates), args.parallelism
+            )
+            plans = {
+                target.label: without_completed(
+                    table_plans[target.table], journals[target.label].completed()
+                )
+                for target in targets
+            }
+        # opening the journals truncates them, a dry run leaves them untouched
+        if args.dry_run is True:
+            return self._dry_run(args, targets, plans)
+        with contextlib.ExitStack() as stack:
+            for journal in journals.values():
+                stack.enter_context(journal)
+            with get_instrumentation().phase("execute"):
+                return self._delete(args, targets, plans, journals)
+
+    @staticmethod
+    def _journal(args: argparse.Namespace, target: TableTarget) -> Journal:
+        if args.journal is None:
+            path = default_journal_path(
+                "delete-partitions",
+                f"{args.project_id}.{args.dataset_id}.{target.table}",
+                args.start_date,
+                args.end_date,
+                *shard_name(args),
+            )
+        elif target.label is not None:
+            path = fan_out_journal_path(args.journal, target.label)
+        else:
+            path = args.journal
+        return Journal(path, resume=args.resume)
+
+    def _dry_run(
+        self,
+        args: argparse.Namespace,
+        targets: List[TableTarget],
+        plans: Dict[Optional[str], PartitionPlan],
+    ) -> Optional[str]:
+        reports = []
+        for target in targets:
+            plan = plans[target.label]
+            # building the tasks settles the strategy without running anything
+            tasks = list(self._tasks(args, target, plan))
+            if plan.whole_table:
+                kind = TRUNCATE
+            elif tasks and tasks[0].partition == WHOLE_TABLE:
+                kind = BULK_DELETE
+            else:
+                kind = DELETE
+            reports.append(
+                DryRun(
+                    "delete-partitions",
+                    planned_operations(
+                        (task.partition for task in tasks),
+                        kind,
+                        plan.metadata,
+                        plan.partitions,
+                        target.label,
+                    ),
+                    plan.skipped,
+                    target.label,
+                )
+            )
+        return dry_run_result(args, reports, self.bigquery_client.rate_limiter.table_rate)
+
+    def _delete(
+        self,
+        args: argparse.Namespace,
+        targets: List[TableTarget],
+        plans: Dict[Optional[str], PartitionPlan],
+        journals: Dict[Optional[str], Journal],
+    ):
+        logging.info(
+            f"start deleting {sum(len(plan.partitions) for plan in plans.values())} partitions "
+            f"of {', '.join(target.table for target in targets)}"
+        )
+        # one queue for every table, taken in turn, so the run shares its
+        # parallelism instead of finishing the tables one after the other
+        tasks = FairQueue(
+            {
+                target.label: self._stream(args, target, plans[target.label])
+                for target in targets
+            },
+            args.max_per_table,
+        )
+        summaries = {
+            target.label: RunSummary(
+                "delete-partitions", skipped=plans[target.label].skipped, target=target.label
+            )
+            for target in targets
+        }
+        progress = progress_writer(args)
+        for result in self._run_tasks(args, tasks):
+            journals[result.target].record(result)
+            summaries[result.target].results.append(result)
+            if progress is not None:
+                progress.write(result.to_record("delete-partitions"))
+        for target in targets:
+            summary = summaries[target.label]
+            logging.info(
+                f"deletion in {target.table} completed: {len(summary.succeeded)} succeeded, "
+                f"{len(summary.failed)} failed"
+            )
+        return finish_all(list(summaries.values()), progress)
+
+    def _run_tasks(
+        self, args: argparse.Namespace, tasks: FairQueue[PartitionTask]
+    ) -> Iterator[PartitionResult]:
+        if args.asyncio is not True:
+            return PartitionExecutor(args.parallelism).run(tasks)
+
+        from source.async_bigquery import AsyncPartitionExecutor
+
+        return AsyncPartitionExecutor(
+            args.parallelism, self.bigquery_client.async_client
+        ).run(tasks)
+
+    def _stream(
+        self, args: argparse.Namespace, target: TableTarget, plan: PartitionPlan
+    ) -> Iterable[PartitionTask]:
+        tasks = self._tasks(args, target, plan)
+        if args.asyncio is not True:
+            return tasks
+
+        # the partition deletions are multiplexed on one event loop, a
+        # truncation or bulk statement is a single call left to a thread
+        client = self.bigquery_client.async_client
+        return (
+            task
+            if task.partition == WHOLE_TABLE
+            else PartitionTask(
+                task.partition,
+                functools.partial(
+                    client.delete_table,
+                    args.project_id,
+                    args.dataset_id,
+                    f"{target.table}${task.partition}",
+                ),
+                task.target,
+            )
+            for task in tasks
+        )
+
+    def _tasks(
+        self, args: argparse.Namespace, target: TableTarget, plan: PartitionPlan
+    ) -> Iterable[PartitionTask]:
+        table_id = f"{args.project_id}.{args.dataset_id}.{target.table}"
+        if plan.whole_table:
+            logging.info(f"range covers the whole table, truncating {target.table}")
+            return [
+                PartitionTask(
+                    WHOLE_TABLE,
+                    functools.partial(
+                        self.bigquery_client.truncate_table,
+                        args.project_id,
+                        args.dataset_id,
+                        target.table,
+                    ),
+                    target.label,
+                )
+            ]
+
+        # a DML delete is billed on the bytes it scans while partition deletes
+        # are free, so it is never chosen on behalf of the user
+        if requested_strategy(args) == BULK and plan.partitions:
+            logging.info(
+                f"deleting {len(plan.partitions)} partitions of {target.table} "
+                f"with a single statement"
+            )
+            # the statement is built on the live table, a partitioning changed
+            # within the cache TTL would delete the wrong rows
+            partitioning = self.bigquery_client.get_partitioning(
+                args.project_id, args.dataset_id, target.table, use_cache=False
+            )
+            # the statement covers every planned partition, so it is journaled
+            # like a whole table operation
+            return [
+                PartitionTask(
+                    WHOLE_TABLE,
+                    functools.partial(
+                        self.bigquery_client.run_query,
+                        args.project_id,
+                        table_id,
+                        bulk_delete_query(table_id, partitioning, plan.partitions),
+                    ),
+                    target.label,
+                )
+            ]
+
+        # a generator, so the executor starts on the first partitions while
+        # the rest of a long range is still to be produced
+        return (
+            PartitionTask(
+                date,
+                functools.partial(
+                    self.bigquery_client.delete_table,
+                    args.project_id,
+                    args.dataset_id,
+                    f"{target.table}${date}",
+                ),
+                target.label,
             )
-        logging.info("deletion completed")
+            for date in plan.partitions
+        )
+
+    def _plan(
+        self, args: argparse.Namespace, dates: Sequence[str], table: str
+    ) -> PartitionPlan:
+        if args.plan is False:
+            return unplanned(dates)
+        existing = self.bigquery_client.list_partitions(
+            args.project_id, args.dataset_id, table
+        )
+        plan = plan_partitions(dates, existing)
+        logging.info(
+            f"{len(plan.partitions)} partitions of {table} to delete, "
+            f"{len(plan.skipped)} missing or empty"
+        )
+        return plan
 
 
 class BigQueryCopyPartitionsAction(Action):
@@ -125,17 +798,511 @@ class BigQueryCopyPartitionsAction(Action):
         self.bigquery_client = bigquery_client
 
     def run(self, args: argparse.Namespace):
-        dates = generate_range(args.start_date, args.end_date)
+        dates = shard_partitions(requested_partitions(args), args.shard)
+        tables = requested_tables(args, args.src_project_id, self.bigquery_client)
+        destinations = list(dict.fromkeys(args.dst_project_id))
+        targets = [
+            TableTarget(
+                table,
+                destination
+                if len(tables) == 1
+                else f"{destination}.{args.dataset_id}.{table}",
+                destination,
+            )
+            for table in tables
+            for destination in destinations
+        ]
+        journals = {
+            target.label: self._journal(args, target, len(targets) > 1) for target in targets
+        }
+        with get_instrumentation().phase("plan"):
+            table_plans = plan_tables(
+                tables,
+                functools.partial(self._plan, args, dates, destinations),
+                args.parallelism,
+            )
+            plans = {
+                target.label: largest_first(
+                    without_completed(
+                        table_plans[target.table][target.destination],
+                        journals[target.label].completed(),
+                    )
+                )
+                for target in targets
+            }
+        # opening the journals truncates them, a dry run leaves them untouched
+        if args.dry_run is True:
+            return self._dry_run(args, targets, plans)
+        with contextlib.ExitStack() as stack:
+            for journal in journals.values():
+                stack.enter_context(journal)
+            with get_instrumentation().phase("execute"):
+                return self._copy(args, targets, plans, journals)
+
+    @staticmethod
+    def _journal(args: argparse.Namespace, target: TableTarget, fan_out: bool) -> Journal:
+        if args.journal is None:
+            path = default_journal_path(
+                "copy-partitions",
+                f"{args.src_project_id}.{args.dataset_id}.{target.table}",
+                f"{target.destination}.{args.dataset_id}.{target.table}",
+                args.start_date,
+                args.end_date,
+                *shard_name(args),
+            )
+        elif fan_out:
+            path = fan_out_journal_path(args.journal, target.label)
+        else:
+            path = args.journal
+        return Journal(path, resume=args.resume)
+
+    def _dry_run(
+        self,
+        args: argparse.Namespace,
+        targets: List[TableTarget],
+        plans: Dict[str, PartitionPlan],
+    ) -> Optional[str]:
+        reports = []
+        for target in targets:
+            plan = plans[target.label]
+            # building the tasks settles the strategy without submitting a job
+            tasks = list(self._tasks(args, target, plan))
+            if plan.whole_table:
+                kind = COPY_TABLE
+            elif tasks and tasks[0].partition == WHOLE_TABLE:
+                kind = BULK_COPY
+            else:
+                kind = COPY
+            reports.append(
+                DryRun(
+                    "copy-partitions",
+                    planned_operations(
+                        (task.partition for task in tasks),
+                        kind,
+                        plan.metadata,
+                        plan.partitions,
+                        target.label,
+                    ),
+                    plan.skipped,
+                    target.label,
+                )
+            )
+        return dry_run_result(args, reports, self.bigquery_client.rate_limiter.table_rate)
+
+    def _copy(
+        self,
+        args: argparse.Namespace,
+        targets: List[TableTarget],
+        plans: Dict[str, PartitionPlan],
+        journals: Dict[str, Journal],
+    ):
+        for target in targets:
+            logging.info(
+                f"start copy table {args.src_project_id}.{args.dataset_id}.{target.table} "
+                f"to {target.destination}.{args.dataset_id}.{target.table}"
+            )
+
+        # interleaved so every table and destination progresses at the same
+        # pace and the run takes about as long as the slowest one alone
+        tasks = FairQueue(
+            {
+                target.label: self._stream(args, target, plans[target.label])
+                for target in targets
+            },
+            args.max_per_table,
+        )
+        summaries = {
+            target.label: RunSummary(
+                "copy-partitions", skipped=plans[target.label].skipped, target=target.label
+            )
+            for target in targets
+        }
+        progress = progress_writer(args)
+        for result in self._run_tasks(args, tasks):
+            logging.info(
+                f"copy of partition {result.partition} to {result.target} {result.status} "
+                f"in {result.duration:.1f}s (job {result.job_id})"
+            )
+            journals[result.target].record(result)
+            summaries[result.target].results.append(result)
+            if progress is not None:
+                progress.write(result.to_record("copy-partitions"))
+        for summary in summaries.values():
+            logging.info(
+                f"copy to {summary.target} completed: {len(summary.succeeded)} succeeded, "
+                f"{len(summary.failed)} failed"
+            )
+        return finish_all(list(summaries.values()), progress)
+
+    def _run_tasks(
+        self, args: argparse.Namespace, tasks: FairQueue
+    ) -> Iterator[PartitionResult]:
+        if args.asyncio is not True:
+            return JobPoller(args.parallelism).run(tasks)
+
+        from source.async_bigquery import AsyncPartitionExecutor
+
+        return AsyncPartitionExecutor(
+            args.parallelism, self.bigquery_client.async_client
+        ).run(tasks)
+
+    def _stream(
+        self, args: argparse.Namespace, target: TableTarget, plan: PartitionPlan
+    ) -> Iterable[Union[JobTask, PartitionTask]]:
+        tasks = self._tasks(args, target, plan)
+        if args.asyncio is not True:
+            return tasks
+
+        # each partition copy is submitted and polled by its own coroutine,
+        # a whole table copy or bulk query is submitted and awaited in a thread
+        client = self.bigquery_client.async_client
+        return (
+            PartitionTask(task.partition, functools.partial(wait_for, task.submit), task.target)
+            if task.partition == WHOLE_TABLE
+            else PartitionTask(
+                task.partition,
+                functools.partial(
+                    client.copy_table,
+                    args.src_project_id,
+                    args.dataset_id,
+                    f"{target.table}${task.partition}",
+                    f"{target.table}${task.partition}",
+                    target.destination,
+                ),
+                task.target,
+            )
+            for task in tasks
+        )
+
+    def _tasks(
+        self, args: argparse.Namespace, target: TableTarget, plan: PartitionPlan
+    ) -> Iterable[JobTask]:
+        if plan.whole_table:
+            logging.info(
+                f"range covers the whole table, copying {target.table} "
+                f"to {target.destination} at once"
+            )
+            tables = [(WHOLE_TABLE, target.table)]
+        else:
+            bulk_task = self._bulk_task(args, target, plan)
+            if bulk_task is not None:
+                return [bulk_task]
+            tables = ((date, f"{target.table}${date}") for date in plan.partitions)
+        return (
+            JobTask(
+                partition,
+                functools.partial(
+                    self.bigquery_client.submit_copy_table,
+                    src_project_id=args.src_project_id,
+                    dataset=args.dataset_id,
+                    start_table=table,
+                    dst_table=table,
+                    dst_project_id=target.destination,
+                ),
+                target.label,
+            )
+            for partition, table in tables
+        )
+
+    def _bulk_task(
+        self, args: argparse.Namespace, target: TableTarget, plan: PartitionPlan
+    ) -> Optional[JobTask]:
+        strategy = choose_strategy(requested_strategy(args), plan)
+        if strategy != BULK or not plan.partitions:
+            return None
+
+        # the query is built on the live schema, a column added within the
+        # cache TTL would otherwise be left out of the INSERT
+        partitioning = self.bigquery_client.get_partitioning(
+            args.src_project_id, args.dataset_id, target.table, use_cache=False
+        )
+        if partitioning.column is None and args.strategy == AUTO:
+            logging.info(
+                f"{target.table} is ingestion-time partitioned, copying partition by partition"
+            )
+            return None
+        # copy jobs create a missing destination table, the query only
+        # inserts into an existing one
+        if args.strategy == AUTO and not self.bigquery_client.table_exists(
+            target.destination, args.dataset_id, target.table
+        ):
+            logging.info(
+                f"{target.destination}.{args.dataset_id}.{target.table} does not exist, "
+                "copying partition by partition"
+            )
+            return None
+
+        src_table_id = f"{args.src_project_id}.{args.dataset_id}.{target.table}"
+        dst_table_id = f"{target.destination}.{args.dataset_id}.{target.table}"
+        logging.info(
+            f"copying {len(plan.partitions)} partitions to {dst_table_id} with a single query"
+        )
+        return JobTask(
+            WHOLE_TABLE,
+            functools.partial(
+                self.bigquery_client.submit_query,
+                target.destination,
+                dst_table_id,
+                bulk_copy_query(
+                    src_table_id,
+                    dst_table_id,
+                    partitioning,
+                    plan.partitions,
+                    self.bigquery_client.get_columns(
+                        args.src_project_id, args.dataset_id, target.table, use_cache=False
+                    ),
+                ),
+            ),
+            target.label,
+        )
+
+    def _plan(
+        self,
+        args: argparse.Namespace,
+        dates: Sequence[str],
+        destinations: List[str],
+        table: str,
+    ) -> Dict[str, PartitionPlan]:
+        if args.plan is False and args.incremental is not True:
+            return {destination: unplanned(dates) for destination in destinations}
+
+        # the source is listed once whatever the number of destinations
+        with ThreadPoolExecutor(max_workers=len(destinations) + 1) as pool:
+            source = pool.submit(
+                self.bigquery_client.list_partitions,
+                args.src_project_id,
+                args.dataset_id,
+                table,
+            )
+            if args.incremental is True:
+                listings = self._list_destinations(args, table, destinations, pool)
+                plans = {
+                    destination: plan_incremental_copy(
+                        dates, source.result(), listings[destination].result()
+                    )
+                    for destination in destinations
+                }
+                for destination, plan in plans.items():
+                    logging.info(
+                        f"{len(plan.partitions)} partitions of {table} changed in {destination}, "
+                        f"{len(plan.skipped)} up to date, missing or empty"
+                    )
+                return plans
+
+            plan = plan_partitions(dates, source.result())
+            plans = {destination: plan for destination in destinations}
+            if plan.whole_table or plan.skipped:
+                # a table copy truncates the destination, so it is only equivalent
+                # when no destination partition would survive a per-partition copy,
+                # and a skipped partition may still hold rows the copy would clear
+                listings = self._list_destinations(args, table, destinations, pool)
+                plans = {
+                    destination: plan_partitions(
+                        dates, source.result(), listings[destination].result()
+                    )
+                    for destination in destinations
+                }
         logging.info(
-            f"start copy tables from {args.src_project_id}.{args.dataset_id}.{args.table} "
-            f"to {args.dst_project_id}.{args.dataset_id}.{args.table}"
-        )
-        for date in dates:
-            self.bigquery_client.copy_table(
-                src_project_id=args.src_project_id,
-                dataset=args.dataset_id,
-                start_table=f"{args.table}${date}",
-                dst_table=f"{args.table}${date}",
-                dst_project_id=args.dst_project_id,
-            )
-        logging.info("copy completed")
+            f"{len(plan.partitions)} partitions of {table} to copy, "
+            f"{len(plan.skipped)} missing or empty"
+        )
+        return plans
+
+    def _list_destinations(
+        self,
+        args: argparse.Namespace,
+        table: str,
+        destinations: List[str],
+        pool: ThreadPoolExecutor,
+    ) -> Dict[str, Future]:
+        return {
+            destination: pool.submit(
+                self.bigquery_client.list_partitions,
+                destination,
+                args.dataset_id,
+                table,
+            )
+            for destination in destinations
+        }
+
+
+class BigQueryVerifyPartitionsAction(Action):
+    def __init__(self, bigquery_client: BigQueryClient):
+        super().__init__()
+        self.bigquery_client = bigquery_client
+
+    def run(self, args: argparse.Namespace):
+        dates = requested_partitions(args)
+        if dates.granularity == INTEGER:
+            raise ValueError("fingerprints are computed on time partitions only")
+        destinations = [
+            destination
+            for destination in dict.fromkeys(args.dst_project_id)
+            if destination != args.src_project_id
+        ]
+        partitioning = self.bigquery_client.get_partitioning(
+            args.src_project_id, args.dataset_id, args.table
+        )
+
+        # one grouped query per side instead of a count per partition
+        with get_instrumentation().phase("fingerprint"), ThreadPoolExecutor(
+            max_workers=len(destinations) + 1
+        ) as pool:
+            fingerprints = {
+                project_id: pool.submit(
+                    self._fingerprints, args, project_id, partitioning, dates
+                )
+                for project_id in [args.src_project_id, *destinations]
+            }
+            fingerprints = {
+                project_id: future.result()
+                for project_id, future in fingerprints.items()
+            }
+        source = fingerprints[args.src_project_id]
+        reports = {
+            destination: (
+                diff_fingerprints(source, fingerprints[destination]),
+                len(set(source) | set(fingerprints[destination])),
+            )
+            for destination in destinations
+        }
+
+        progress = progress_writer(args)
+        lines = []
+        for destination, (mismatches, compared) in reports.items():
+            logging.info(
+                f"{compared - len(mismatches)} partitions match in {destination}, "
+                f"{len(mismatches)} mismatched"
+            )
+            if progress is not None:
+                for mismatch in mismatches:
+                    progress.write(mismatch_record(mismatch, destination))
+                progress.write(
+                    {
+                        "type": "summary",
+                        "operation": "verify-partitions",
+                        "target": destination,
+                        "matched": compared - len(mismatches),
+                        "mismatched": len(mismatches),
+                    }
+                )
+            lines.append(
+                f"verify-partitions to {destination}: {compared - len(mismatches)} "
+                f"partitions match, {len(mismatches)} mismatched"
+            )
+            lines.extend(f"  {mismatch}" for mismatch in mismatches)
+
+        summaries = []
+        unresolved = {destination: mismatches for destination, (mismatches, _) in reports.items()}
+        if args.recopy is True:
+            summaries = self._recopy(args, unresolved, progress)
+            lines.extend(str(summary) for summary in summaries)
+            # a failed copy is in its summary, what no copy could fix is left
+            unresolved = {
+                destination: [
+                    mismatch for mismatch in mismatches if mismatch.reason == MISSING_IN_SOURCE
+                ]
+                for destination, mismatches in unresolved.items()
+            }
+        # the command fails while the tables differ, so scripts can gate on it
+        summaries.extend(
+            mismatch_summary(destination, mismatches)
+            for destination, mismatches in unresolved.items()
+            if mismatches
+        )
+        check_summaries(summaries, None if progress is not None else "\n".join(lines))
+
+        return None if progress is not None else "\n".join(lines)
+
+    def _fingerprints(
+        self,
+        args: argparse.Namespace,
+        project_id: str,
+        partitioning: Partitioning,
+        dates: Sequence[str],
+    ) -> Dict[str, PartitionFingerprint]:
+        table_id = f"{project_id}.{args.dataset_id}.{args.table}"
+        return parse_fingerprints(
+            self.bigquery_client.query_rows(
+                project_id, table_id, fingerprint_query(table_id, partitioning, dates)
+            )
+        )
+
+    def _recopy(
+        self,
+        args: argparse.Namespace,
+        mismatches: Dict[str, List[Mismatch]],
+        progress: Optional[NdjsonWriter],
+    ) -> List[RunSummary]:
+        # a partition only the destination has cannot be copied from the
+        # source, it is reported and left to the operator
+        tasks = round_robin(
+            [
+                JobTask(
+                    mismatch.partition_id,
+                    functools.partial(
+                        self.bigquery_client.submit_copy_table,
+                        src_project_id=args.src_project_id,
+                        dataset=args.dataset_id,
+                        start_table=f"{args.table}${mismatch.partition_id}",
+                        dst_table=f"{args.table}${mismatch.partition_id}",
+                        dst_project_id=destination,
+                    ),
+                    destination,
+                )
+                for mismatch in destination_mismatches
+                if mismatch.reason != MISSING_IN_SOURCE
+            ]
+            for destination, destination_mismatches in mismatches.items()
+        )
+        summaries = {
+            destination: RunSummary("recopy-partitions", target=destination)
+            for destination in mismatches
+        }
+        for result in JobPoller(args.parallelism).run(tasks):
+            summaries[result.target].results.append(result)
+            if progress is not None:
+                progress.write(result.to_record("recopy-partitions"))
+        if progress is not None:
+            for summary in summaries.values():
+                progress.write(summary.to_record())
+        return list(summaries.values())
+
+
+def mismatch_summary(destination: str, mismatches: List[Mismatch]) -> RunSummary:
+    return RunSummary(
+        "verify-partitions",
+        [
+            PartitionResult(
+                mismatch.partition_id, FAILED, 0.0, error=mismatch.reason, target=destination
+            )
+            for mismatch in mismatches
+        ],
+        target=destination,
+    )
+
+
+def mismatch_record(mismatch: Mismatch, destination: str) -> dict:
+    return {
+        "type": "mismatch",
+        "target": destination,
+        "partition": mismatch.partition_id,
+        "reason": mismatch.reason,
+        "source_rows": mismatch.source.row_count if mismatch.source else None,
+        "destination_rows": (
+            mismatch.destination.row_count if mismatch.destination else None
+        ),
+    }
+
+
+class MergeReportsAction(Action):
+    def run(self, args: argparse.Namespace):
+        summaries = merge_results(args.files)
+        progress = progress_writer(args)
+        if progress is not None:
+            for summary in summaries:
+                for result in summary.results:
+                    progress.write(result.to_record(summary.operation))
+                progress.write(summary.to_record())
+            return None
+        return "\n".join(str(summary) for summary in summaries)
@@ -1,29 +1,336 @@
-from google.cloud import bigquery
-from google.cloud.bigquery import Table, CopyJobConfig
-from sql_metadata import Parser
+import copy
+import datetime
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from source.instrumentation import CallRecord, get_instrumentation
+from source.metadata_cache import MetadataCache
+from source.rate_limiter import CallStats, RateLimiter, is_rejected, is_retryable
+from source.view_rewriter import TableReference, rewrite_view_query, switch_color
+
+if TYPE_CHECKING:
+    from google.cloud import bigquery
+    from google.cloud.bigquery import CopyJob, QueryJob, Table
+
+    from source.async_bigquery import AsyncBigQueryClient
+
+T = TypeVar("T")
+
+REBUILD_STRATEGIES = ("copy", "clone", "snapshot")
+
+
+@dataclass(frozen=True)
+class PartitionMetadata:
+    partition_id: str
+    total_rows: int
+    total_logical_bytes: int
+    last_modified_time: Optional[datetime.datetime] = None
+
+
+@dataclass(frozen=True)
+class Partitioning:
+    column: Optional[str]
+    column_type: str
+    granularity: str
 
 
 class BigQueryClient:
-    def __init__(self):
-        self.google_client = bigquery.Client()
+    def __init__(
+        self, rate_limiter: RateLimiter = None, metadata_cache: MetadataCache = None
+    ):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.metadata_cache = metadata_cache
+        self._google_client = None
+        self._google_client_lock = threading.Lock()
+        self._async_client = None
+        # a dataset keeps the location it was created in
+        self._dataset_locations: Dict[str, str] = {}
+
+    @property
+    def google_client(self) -> "bigquery.Client":
+        if self._google_client is None:
+            with self._google_client_lock:
+                if self._google_client is None:
+                    from google.cloud import bigquery
+
+                    self._google_client = bigquery.Client()
+        return self._google_client
+
+    @property
+    def async_client(self) -> "AsyncBigQueryClient":
+        # built on first use, so only --asyncio runs import asyncio and aiohttp
+        if self._async_client is None:
+            with self._google_client_lock:
+                if self._async_client is None:
+                    self._async_client = self._build_async_client()
+        return self._async_client
+
+    def _build_async_client(self) -> "AsyncBigQueryClient":
+        from source.async_bigquery import AsyncBigQueryClient, AsyncRateLimiter
+
+        return AsyncBigQueryClient(
+            rate_limiter=AsyncRateLimiter.like(self.rate_limiter),
+            metadata_cache=self.metadata_cache,
+        )
+
+    def _call(
+        self,
+        method: str,
+        project_id: str,
+        table_id: Optional[str],
+        operation: Callable[[], T],
+        retryable: Callable[[Exception], bool] = is_retryable,
+    ) -> T:
+        stats = CallStats()
+        started = time.monotonic()
+        try:
+            result = self.rate_limiter.call(
+                project_id, table_id, operation, stats, retryable
+            )
+        except Exception as e:
+            self._record(method, project_id, table_id, started, stats, error=str(e))
+            raise
+        self._record(
+            method, project_id, table_id, started, stats, job_id=job_id(result)
+        )
+        return result
+
+    @staticmethod
+    def _record(
+        method: str,
+        project_id: str,
+        table_id: Optional[str],
+        started: float,
+        stats: CallStats,
+        **details,
+    ) -> None:
+        get_instrumentation().record_call(
+            CallRecord(
+                method,
+                table_id or project_id,
+                time.monotonic() - started,
+                stats.queue_wait,
+                stats.retries,
+                **details,
+            )
+        )
+
+    def _write(
+        self,
+        method: str,
+        project_id: str,
+        table_id: str,
+        operation: Callable[[], T],
+        retryable: Callable[[Exception], bool] = is_retryable,
+    ) -> T:
+        # a failed call may still have changed the table, it is invalidated
+        # either way
+        try:
+            return self._call(method, project_id, table_id, operation, retryable)
+        finally:
+            if self.metadata_cache is not None:
+                self.metadata_cache.invalidate(table_id)
 
-    def extract_view_info(self, project_id, dataset, table) -> Table:
+    def extract_view_info(self, project_id, dataset, table, use_cache=True) -> "Table":
         view_id = f"{project_id}.{dataset}.{table}"
-        return self.google_client.get_table(view_id)
+        if self.metadata_cache is None:
+            return self._call(
+                "extract_view_info",
+                project_id,
+                view_id,
+                lambda: self.google_client.get_table(view_id),
+            )
+
+        # callers acting on what they read, such as a switch rewriting the
+        # view query, pass use_cache=False for the live table rather than a
+        # copy another process may have outdated
+        resource = self.metadata_cache.get(view_id) if use_cache else None
+        if resource is not None:
+            get_instrumentation().record_call(CallRecord("metadata_cache_hit", view_id, 0.0))
+            return table_from_resource(resource)
+        table = self._call(
+            "extract_view_info",
+            project_id,
+            view_id,
+            lambda: self.google_client.get_table(view_id),
+        )
+        self.metadata_cache.put(view_id, table.to_api_repr())
+        return table
+
+    def table_exists(self, project_id: str, dataset: str, table: str) -> bool:
+        return self.table_type(project_id, dataset, table) is not None
+
+    def table_type(self, project_id: str, dataset: str, table: str) -> Optional[str]:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self.extract_view_info(project_id, dataset, table, use_cache=False).table_type
+        except NotFound:
+            return None
+
+    def list_views(self, project_id: str, dataset: str) -> List[str]:
+        return self._call(
+            "list_views",
+            project_id,
+            None,
+            lambda: [
+                table.table_id
+                for table in self.google_client.list_tables(f"{project_id}.{dataset}")
+                if table.table_type == "VIEW"
+            ],
+        )
+
+    def list_tables(self, project_id: str, dataset: str) -> List[str]:
+        return self._call(
+            "list_tables",
+            project_id,
+            None,
+            lambda: [
+                table.table_id
+                for table in self.google_client.list_tables(f"{project_id}.{dataset}")
+                if table.table_type == "TABLE"
+            ],
+        )
 
     def update_view(
         self, project_id: str, dataset: str, table: str, query_updated: str
     ) -> None:
+        from google.cloud.bigquery import Table
+
         view_id = f"{project_id}.{dataset}.{table}"
-        view = bigquery.Table(view_id)
+        view = Table(view_id)
 
         view.view_query = query_updated
 
-        self.google_client.update_table(view, ["view_query"])
+        self._write(
+            "update_view",
+            project_id,
+            view_id,
+            lambda: self.google_client.update_table(view, ["view_query"]),
+        )
 
     def delete_table(self, project_id: str, dataset: str, table: str) -> None:
         table_id = f"{project_id}.{dataset}.{table}"
-        self.google_client.delete_table(table_id, not_found_ok=True)
+        self._write(
+            "delete_table",
+            project_id,
+            table_id,
+            lambda: self.google_client.delete_table(table_id, not_found_ok=True),
+        )
+
+    def get_partitioning(
+        self, project_id: str, dataset: str, table: str, use_cache: bool = True
+    ) -> Partitioning:
+        table_info = self.extract_view_info(project_id, dataset, table, use_cache)
+        time_partitioning = table_info.time_partitioning
+        if time_partitioning is None:
+            raise ValueError(f"{project_id}.{dataset}.{table} is not time partitioned")
+
+        column = time_partitioning.field
+        if column is None:
+            return Partitioning(None, "TIMESTAMP", time_partitioning.type_)
+        column_type = next(
+            field.field_type for field in table_info.schema if field.name == column
+        )
+        return Partitioning(column, column_type, time_partitioning.type_)
+
+    def get_columns(
+        self, project_id: str, dataset: str, table: str, use_cache: bool = True
+    ) -> List[str]:
+        table_info = self.extract_view_info(project_id, dataset, table, use_cache)
+        return [field.name for field in table_info.schema]
+
+    def submit_query(self, project_id: str, table_id: str, query: str) -> "QueryJob":
+        # the job runs, and is billed, in the project of the table it writes,
+        # the one its calls are rate limited on; the library picks a new job
+        # id on each call, so it is only submitted again when BigQuery refused it
+        location = self._dataset_location(project_id, table_id)
+        return self._write(
+            "submit_query",
+            project_id,
+            table_id,
+            lambda: self.google_client.query(query, project=project_id, location=location),
+            retryable=is_rejected,
+        )
+
+    def run_query(self, project_id: str, table_id: str, query: str) -> None:
+        self.submit_query(project_id, table_id, query).result()
+
+    def query_rows(self, project_id: str, table_id: str, query: str) -> list:
+        location = self._dataset_location(project_id, table_id)
+        return self._call(
+            "query_rows",
+            project_id,
+            table_id,
+            lambda: list(
+                self.google_client.query(query, project=project_id, location=location).result()
+            ),
+        )
+
+    def _dataset_location(self, project_id: str, table_id: str) -> str:
+        dataset_id = table_id.split("$")[0].rsplit(".", 1)[0]
+        location = self._dataset_locations.get(dataset_id)
+        if location is None:
+            location = self._dataset_locations[dataset_id] = self._call(
+                "get_dataset",
+                project_id,
+                None,
+                lambda: self.google_client.get_dataset(dataset_id).location,
+            )
+        return location
+
+    def truncate_table(self, project_id: str, dataset: str, table: str) -> None:
+        table_id = f"{project_id}.{dataset}.{table}"
+        location = self._dataset_location(project_id, table_id)
+        self._write(
+            "truncate_table",
+            project_id,
+            table_id,
+            lambda: self.google_client.query(
+                f"TRUNCATE TABLE `{table_id}`", project=project_id, location=location
+            ).result(),
+        )
+
+    def list_partitions(
+        self, project_id: str, dataset: str, table: str
+    ) -> Dict[str, PartitionMetadata]:
+        from google.cloud.bigquery import QueryJobConfig, ScalarQueryParameter
+
+        query = (
+            "SELECT partition_id, total_rows, total_logical_bytes, last_modified_time "
+            f"FROM `{project_id}.{dataset}.INFORMATION_SCHEMA.PARTITIONS` "
+            "WHERE table_name = @table_name"
+        )
+        configs = QueryJobConfig(
+            query_parameters=[ScalarQueryParameter("table_name", "STRING", table)]
+        )
+        table_id = f"{project_id}.{dataset}.{table}"
+        location = self._dataset_location(project_id, table_id)
+        rows = self._call(
+            "list_partitions",
+            project_id,
+            table_id,
+            lambda: list(
+                self.google_client.query(
+                    query, job_config=configs, project=project_id, location=location
+                ).result()
+            ),
+        )
+        return {
+            row.partition_id: PartitionMetadata(
+                row.partition_id,
+                row.total_rows or 0,
+                row.total_logical_bytes or 0,
+                row.last_modified_time,
+            )
+            for row in rows
+            if row.partition_id is not None
+        }
 
     def copy_table(
         self,
@@ -33,25 +340,165 @@ class BigQueryClient:
         dst_table: str,
         dst_project_id: str = None,
     ) -> None:
+        started = time.monotonic()
+        job = self.submit_copy_table(
+            src_project_id, dataset, start_table, dst_table, dst_project_id
+        )
+        job.result()
+        # submit_copy_table already counted the API call, this records the
+        # job like the job poller does, with its duration and copied bytes
+        get_instrumentation().record_call(
+            CallRecord(
+                "job",
+                f"{dst_project_id or src_project_id}.{dataset}.{dst_table}",
+                time.monotonic() - started,
+                job_id=job.job_id,
+                bytes=job_bytes(job),
+            )
+        )
+
+    def submit_copy_table(
+        self,
+        src_project_id: str,
+        dataset: str,
+        start_table: str,
+        dst_table: str,
+        dst_project_id: str = None,
+        operation_type: str = None,
+        write_disposition: str = "WRITE_TRUNCATE",
+    ) -> "CopyJob":
+        from google.cloud.bigquery import CopyJobConfig
+
         start_table_id = f"{src_project_id}.{dataset}.{start_table}"
         dst_table_id = f"{dst_project_id or src_project_id}.{dataset}.{dst_table}"
 
         configs = CopyJobConfig()
-        configs.write_disposition = "WRITE_TRUNCATE"
+        configs.write_disposition = write_disposition
+        if operation_type is not None:
+            configs.operation_type = operation_type
 
-        job = self.google_client.copy_table(start_table_id, dst_table_id, job_config=configs)
-        job.result()
+        return self._write(
+            "submit_copy_table",
+            dst_project_id or src_project_id,
+            dst_table_id,
+            lambda: self.google_client.copy_table(
+                start_table_id, dst_table_id, job_config=configs
+            ),
+            retryable=is_rejected,
+        )
 
+    def rebuild_table(
+        self,
+        project_id: str,
+        dataset: str,
+        src_table: str,
+        dst_table: str,
+        strategy: str = "copy",
+    ) -> None:
+        if strategy not in REBUILD_STRATEGIES:
+            raise ValueError(f"unknown rebuild strategy: {strategy}")
 
-def extract_table_from_query(query: str) -> str:
+        started = time.monotonic()
+        if strategy == "copy":
+            # WRITE_TRUNCATE replaces the destination, so it is only deleted
+            # first when an earlier snapshot rebuild left a read-only snapshot
+            if self.table_type(project_id, dataset, dst_table) == "SNAPSHOT":
+                self.delete_table(project_id, dataset, dst_table)
+            self.copy_table(project_id, dataset, src_table, dst_table)
+        else:
+            # clones and snapshots can only be created on a missing table
+            self.delete_table(project_id, dataset, dst_table)
+            job = self.submit_copy_table(
+                project_id,
+                dataset,
+                src_table,
+                dst_table,
+                operation_type=strategy.upper(),
+                write_disposition="WRITE_EMPTY",
+            )
+            job.result()
+        logging.info(
+            f"rebuilt {dataset}.{dst_table} from {src_table} with {strategy} strategy "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+
+def table_from_resource(resource: dict) -> "Table":
+    from google.cloud.bigquery import Table
+
+    # the table keeps the dict it is built from, the cached one stays intact
+    return Table.from_api_repr(copy.deepcopy(resource))
+
+
+def job_id(job) -> Optional[str]:
+    value = getattr(job, "job_id", None)
+    return value if isinstance(value, str) else None
+
+
+def job_bytes(job) -> Optional[int]:
+    properties = getattr(job, "_properties", None)
+    if not isinstance(properties, dict):
+        return None
+    statistics = properties.get("statistics", {})
+    copied = statistics.get("copy", {}).get("copiedLogicalBytes")
+    if copied is not None:
+        return int(copied)
+    processed = statistics.get("query", {}).get("totalBytesProcessed")
+    return int(processed) if processed is not None else None
+
+
+ANALYSIS_CACHE_SIZE = 256
+MIXED = "mixed"
+
+_analysis_cache: "OrderedDict[str, ViewQueryAnalysis]" = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ViewQueryAnalysis:
+    references: Tuple[TableReference, ...]
+    switched_query: str
+
+    @property
+    def color(self) -> str:
+        colors = {reference.color for reference in self.references}
+        return colors.pop() if len(colors) == 1 else MIXED
+
+
+def analyze_view_query(query: str) -> ViewQueryAnalysis:
     if not query:
         raise ValueError("query is None")
 
-    table = Parser(query).tables
-    if len(table) > 1:
-        raise ValueError(f"More than a single table in the view: {table}")
+    key = hashlib.sha256(query.encode("utf-8")).hexdigest()
+    with _analysis_cache_lock:
+        analysis = _analysis_cache.get(key)
+        if analysis is not None:
+            _analysis_cache.move_to_end(key)
+            return analysis
+
+    analysis = _analyze_view_query(query)
+
+    with _analysis_cache_lock:
+        _analysis_cache[key] = analysis
+        if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+    return analysis
 
-    return table[0]
+
+def _analyze_view_query(query: str) -> ViewQueryAnalysis:
+    references, switched_query = rewrite_view_query(query)
+    if not references:
+        raise ValueError("no blue or green table in the view")
+    return ViewQueryAnalysis(tuple(references), switched_query)
+
+
+def extract_table_from_query(query: str) -> str:
+    references = analyze_view_query(query).references
+    if len(references) > 1:
+        raise ValueError(
+            f"More than a single table in the view: {[r.table for r in references]}"
+        )
+    return references[0].table
 
 
 def extract_table_from_query_name_only(table_name: str) -> str:
@@ -59,5 +506,4 @@ def extract_table_from_query_name_only(table_name: str) -> str:
 
 
 def extract_production_table_color(query):
-    table = extract_table_from_query(query)
-    return "green" if table.endswith("green") else "blue"
+    return analyze_view_query(query).color
@@ -0,0 +1,115 @@
+import datetime
+from typing import List, Tuple
+
+from source.bigquery_utils import Partitioning
+from source.partition_planner import PartitionPlan
+
+AUTO = "auto"
+PER_PARTITION = "per-partition"
+BULK = "bulk"
+STRATEGIES = (AUTO, PER_PARTITION, BULK)
+
+# one query job replaces one API call per partition, so it pays off once the
+# per-call latency dominates; the query is billed on the bytes it scans while
+# copy jobs and partition deletes are free, hence the size ceiling on bulk
+# copies, and bulk deletes are only run when asked for
+BULK_MIN_PARTITIONS = 100
+BULK_COPY_MAX_BYTES = 10 * 1024 ** 3
+
+_PARTITION_ID_FORMATS = {
+    10: "%Y%m%d%H",
+    8: "%Y%m%d",
+    6: "%Y%m",
+    4: "%Y",
+}
+
+
+def choose_strategy(requested: str, plan: PartitionPlan) -> str:
+    # the copy strategy, deletes use the requested one as is
+    if requested != AUTO:
+        return requested
+    if len(plan.partitions) < BULK_MIN_PARTITIONS or not plan.metadata:
+        return PER_PARTITION
+    total_bytes = sum(
+        plan.metadata[partition_id].total_logical_bytes
+        for partition_id in plan.partitions
+        if partition_id in plan.metadata
+    )
+    return BULK if total_bytes <= BULK_COPY_MAX_BYTES else PER_PARTITION
+
+
+def partition_bounds(partition_id: str) -> Tuple[datetime.datetime, datetime.datetime]:
+    date_format = _PARTITION_ID_FORMATS.get(len(partition_id))
+    if date_format is None:
+        raise ValueError(f"not a time partition: {partition_id}")
+    start = datetime.datetime.strptime(partition_id, date_format)
+    if len(partition_id) == 10:
+        end = start + datetime.timedelta(hours=1)
+    elif len(partition_id) == 8:
+        end = start + datetime.timedelta(days=1)
+    elif len(partition_id) == 6:
+        end = (start + datetime.timedelta(days=32)).replace(day=1)
+    else:
+        end = start.replace(year=start.year + 1)
+    return start, end
+
+
+def contiguous_ranges(
+    partition_ids: List[str],
+) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+    ranges = []
+    for partition_id in sorted(partition_ids):
+        start, end = partition_bounds(partition_id)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def range_condition(partitioning: Partitioning, partition_ids: List[str]) -> str:
+    column = f"`{partitioning.column}`" if partitioning.column else "_PARTITIONTIME"
+    conditions = [
+        f"({column} >= {_literal(partitioning, start)} AND {column} < {_literal(partitioning, end)})"
+        for start, end in contiguous_ranges(partition_ids)
+    ]
+    return " OR ".join(conditions)
+
+
+def bulk_delete_query(
+    table_id: str, partitioning: Partitioning, partition_ids: List[str]
+) -> str:
+    return f"DELETE FROM `{table_id}` WHERE {range_condition(partitioning, partition_ids)}"
+
+
+def bulk_copy_query(
+    src_table_id: str,
+    dst_table_id: str,
+    partitioning: Partitioning,
+    partition_ids: List[str],
+    columns: List[str],
+) -> str:
+    if partitioning.column is None:
+        raise ValueError(
+            f"bulk copy needs a partitioning column, {src_table_id} is ingestion-time partitioned"
+        )
+    condition = range_condition(partitioning, partition_ids)
+    # columns are matched by name, a destination whose columns were added in
+    # another order would otherwise silently receive shifted values
+    names = ", ".join(f"`{column}`" for column in columns)
+    # the transaction replaces the partitions atomically, like WRITE_TRUNCATE
+    return (
+        "BEGIN TRANSACTION;\n"
+        f"DELETE FROM `{dst_table_id}` WHERE {condition};\n"
+        f"INSERT INTO `{dst_table_id}` ({names}) "
+        f"SELECT {names} FROM `{src_table_id}` WHERE {condition};\n"
+        "COMMIT TRANSACTION;"
+    )
+
+
+def _literal(partitioning: Partitioning, value: datetime.datetime) -> str:
+    if partitioning.column_type == "DATE":
+        return f"DATE '{value:%Y-%m-%d}'"
+    if partitioning.column_type == "DATETIME":
+        return f"DATETIME '{value:%Y-%m-%d %H:%M:%S}'"
+    return f"TIMESTAMP '{value:%Y-%m-%d %H:%M:%S}'"
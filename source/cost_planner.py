@@ -0,0 +1,172 @@
+import heapq
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from source.bigquery_utils import PartitionMetadata
+from source.partition_planner import WHOLE_TABLE
+
+DELETE = "delete"
+TRUNCATE = "truncate"
+BULK_DELETE = "bulk delete"
+COPY = "copy"
+COPY_TABLE = "copy table"
+BULK_COPY = "bulk copy"
+
+# rough figures, the estimate tells minutes from hours rather than predicts
+# the exact duration: a metadata call, the fixed cost of any job, and the
+# throughput of copy jobs and of the queries behind the bulk strategy
+API_CALL_SECONDS = 0.5
+JOB_OVERHEAD_SECONDS = 2.0
+COPY_BYTES_PER_SECOND = 1024 ** 3
+QUERY_BYTES_PER_SECOND = 256 * 1024 ** 2
+
+_JOB_THROUGHPUT = {
+    TRUNCATE: None,
+    BULK_DELETE: QUERY_BYTES_PER_SECOND,
+    COPY: COPY_BYTES_PER_SECOND,
+    COPY_TABLE: COPY_BYTES_PER_SECOND,
+    BULK_COPY: QUERY_BYTES_PER_SECOND,
+}
+
+
+@dataclass
+class PlannedOperation:
+    partition: str
+    kind: str
+    rows: Optional[int] = None
+    bytes: Optional[int] = None
+    target: Optional[str] = None
+
+    @property
+    def estimated_seconds(self) -> float:
+        if self.kind == DELETE:
+            return API_CALL_SECONDS
+        throughput = _JOB_THROUGHPUT[self.kind]
+        if throughput is None or self.bytes is None:
+            return JOB_OVERHEAD_SECONDS
+        return JOB_OVERHEAD_SECONDS + self.bytes / throughput
+
+    def to_record(self, operation: str) -> dict:
+        return {
+            "type": "planned",
+            "operation": operation,
+            **asdict(self),
+            "estimated_seconds": self.estimated_seconds,
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"  {self.partition:<12} {self.kind:<12} {_format_bytes(self.bytes):>10} "
+            f"{_format_rows(self.rows):>14}"
+        )
+
+
+@dataclass
+class DryRun:
+    operation: str
+    operations: List[PlannedOperation] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    target: Optional[str] = None
+
+    # without a plan the sizes are unknown, shown as ? rather than 0
+    @property
+    def bytes(self) -> Optional[int]:
+        return _known_sum(operation.bytes for operation in self.operations)
+
+    @property
+    def rows(self) -> Optional[int]:
+        return _known_sum(operation.rows for operation in self.operations)
+
+    def to_record(self) -> dict:
+        return {
+            "type": "dry_run",
+            "operation": self.operation,
+            "target": self.target,
+            "operations": len(self.operations),
+            "bytes": self.bytes,
+            "rows": self.rows,
+            "skipped": len(self.skipped),
+        }
+
+    def __str__(self) -> str:
+        operation = self.operation
+        if self.target is not None:
+            operation += f" to {self.target}"
+        kinds = Counter(planned.kind for planned in self.operations)
+        line = (
+            f"{operation} (dry run): "
+            + (", ".join(f"{count} {kind}" for kind, count in kinds.items()) or "nothing to do")
+            + f", {_format_bytes(self.bytes)}, {_format_rows(self.rows)}"
+        )
+        if self.skipped:
+            line += f", {len(self.skipped)} skipped"
+        return "\n".join([line, *(str(planned) for planned in self.operations)])
+
+
+def planned_operations(
+    partitions: Iterable[str],
+    kind: str,
+    metadata: Dict[str, PartitionMetadata],
+    covered: Iterable[str] = (),
+    target: Optional[str] = None,
+) -> List[PlannedOperation]:
+    # a whole table operation moves every partition it covers
+    operations = []
+    covered = list(covered)
+    for partition_id in partitions:
+        sizes = [metadata.get(p) for p in (covered if partition_id == WHOLE_TABLE else [partition_id])]
+        known = [size for size in sizes if size is not None]
+        operations.append(
+            PlannedOperation(
+                partition_id,
+                kind,
+                sum(size.total_rows for size in known) if known else None,
+                sum(size.total_logical_bytes for size in known) if known else None,
+                target,
+            )
+        )
+    return operations
+
+
+def estimate_seconds(
+    operations: List[PlannedOperation], parallelism: int, calls_per_second: float
+) -> float:
+    # largest first on the earliest free worker, the order the run uses
+    workers = [0.0] * min(parallelism, len(operations))
+    for duration in sorted((op.estimated_seconds for op in operations), reverse=True):
+        heapq.heappush(workers, heapq.heappop(workers) + duration)
+    makespan = max(workers, default=0.0)
+    # every call on a table waits for its token, whatever the parallelism
+    busiest_table = max(Counter(op.target for op in operations).values(), default=0)
+    return max(makespan, busiest_table / calls_per_second)
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
+
+
+def _known_sum(values: Iterable[Optional[int]]) -> Optional[int]:
+    values = list(values)
+    known = [value for value in values if value is not None]
+    # nothing to do moves nothing, operations of unknown size an unknown amount
+    return sum(known) if known or not values else None
+
+
+def _format_bytes(size: Optional[int]) -> str:
+    if size is None:
+        return "? bytes"
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _format_rows(rows: Optional[int]) -> str:
+    return "? rows" if rows is None else f"{rows:,} rows"
@@ -0,0 +1,185 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from typing import Callable, List, TextIO, Tuple
+
+from source.arg_parser import Action
+from source.bigquery_utils import BigQueryClient
+from source.instrumentation import MetricsCollector, get_instrumentation
+from source.partition_executor import PartitionsFailed
+
+# the server's working directory is shared by every command, so relative
+# paths are resolved against the directory the client ran in
+PATH_ARGUMENTS = ("manifest", "journal", "files")
+# values of these are paths only when prefixed by @
+FILE_REFERENCE_ARGUMENTS = ("table",)
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "bigquery_utils",
+    )
+    return os.path.join(runtime_dir, "bigquery_utils.sock")
+
+
+def forward(
+    path: str, argv: List[str], cwd: str = None, stdout: TextIO = None
+) -> Tuple[int, str]:
+    stdout = stdout or sys.stdout
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        with connection.makefile("rw") as stream:
+            request = {"argv": argv, "cwd": cwd or os.getcwd()}
+            stream.write(json.dumps(request) + "\n")
+            stream.flush()
+            for line in stream:
+                response = json.loads(line)
+                if "line" not in response:
+                    return response["status"], response["output"]
+                stdout.write(response["line"])
+                stdout.flush()
+    raise ConnectionError(f"the server on {path} closed the connection")
+
+
+class ConnectionStream:
+    # what a command writes to stdout is relayed line by line to the client
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> None:
+        with self._lock:
+            self.wfile.write((json.dumps({"line": text}) + "\n").encode())
+
+    def flush(self) -> None:
+        self.wfile.flush()
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        request = json.loads(self.rfile.readline())
+        status, output = self.server.execute(
+            request["argv"], request["cwd"], ConnectionStream(self.wfile)
+        )
+        self.wfile.write(
+            (json.dumps({"status": status, "output": output}) + "\n").encode()
+        )
+
+
+class CommandServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(
+        self, path: str, command_parser, after_command: Callable[[], None] = None
+    ):
+        self.command_parser = command_parser
+        self.after_command = after_command
+        super().__init__(path, CommandHandler)
+
+    def server_bind(self) -> None:
+        # the socket runs commands with the server's credentials, it is created
+        # private rather than restricted after the bind, when another local
+        # user could already have connected
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def execute(
+        self, argv: List[str], cwd: str, stdout: TextIO = None
+    ) -> Tuple[int, str]:
+        try:
+            args = self.command_parser.build_parser(argv)
+        except SystemExit:
+            return 2, f"invalid arguments: {' '.join(argv)}"
+        if getattr(args, "command_parser", None) is not None:
+            return 2, "serve cannot be forwarded to a running server"
+        for name in PATH_ARGUMENTS:
+            value = getattr(args, name, None)
+            if isinstance(value, list):
+                setattr(args, name, [os.path.join(cwd, path) for path in value])
+            elif value is not None:
+                setattr(args, name, os.path.join(cwd, value))
+        for name in FILE_REFERENCE_ARGUMENTS:
+            value = getattr(args, name, None)
+            if isinstance(value, list):
+                setattr(
+                    args,
+                    name,
+                    [
+                        f"@{os.path.join(cwd, item[1:])}" if item.startswith("@") else item
+                        for item in value
+                    ],
+                )
+        args.stdout = stdout
+        logging.info(f"running {' '.join(argv)}")
+        try:
+            result = args.func(args)
+            return 0, "" if result is None else str(result)
+        except PartitionsFailed as e:
+            return 1, e.output or ""
+        except Exception as e:
+            logging.exception(f"{' '.join(argv)} failed")
+            return 1, str(e)
+        finally:
+            if self.after_command is not None:
+                self.after_command()
+
+
+class BigQueryServeAction(Action):
+    def __init__(self, bigquery_client: BigQueryClient):
+        super().__init__()
+        self.bigquery_client = bigquery_client
+
+    def run(self, args: argparse.Namespace):
+        path = args.socket or default_socket_path()
+        prepare_socket_path(path)
+
+        # everything a fresh process pays for on its first command
+        self.bigquery_client.google_client
+
+        def after_command() -> None:
+            # the server outlives many commands, so the metrics and the
+            # metadata cache files are kept current instead of written at exit
+            metrics = get_instrumentation()
+            if args.metrics_file is not None and isinstance(metrics, MetricsCollector):
+                metrics.export(args.metrics_file, args.metrics_format)
+            if self.bigquery_client.metadata_cache is not None:
+                self.bigquery_client.metadata_cache.flush()
+
+        server = CommandServer(path, args.command_parser, after_command)
+        signal.signal(
+            signal.SIGTERM,
+            lambda *_: threading.Thread(target=server.shutdown).start(),
+        )
+        logging.info(f"serving on {path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.unlink(path)
+        return f"stopped serving on {path}"
+
+
+def prepare_socket_path(path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            logging.info(f"removing stale socket {path}")
+            os.unlink(path)
+            return
+    raise RuntimeError(f"a server is already listening on {path}")
@@ -0,0 +1,178 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+METRIC_PREFIX = "bigquery_utils"
+METRICS_FORMATS = ("json", "prometheus")
+
+
+@dataclass
+class CallRecord:
+    method: str
+    target: str
+    duration: float
+    queue_wait: float = 0.0
+    retries: int = 0
+    job_id: Optional[str] = None
+    bytes: Optional[int] = None
+    error: Optional[str] = None
+
+
+class Instrumentation:
+    def record_call(self, record: CallRecord) -> None:
+        pass
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        yield
+
+
+class MetricsCollector(Instrumentation):
+    def __init__(self):
+        self.calls: List[CallRecord] = []
+        self.phases: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def record_call(self, record: CallRecord) -> None:
+        with self._lock:
+            self.calls.append(record)
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] += time.monotonic() - started
+
+    def summary(self) -> dict:
+        with self._lock:
+            calls = list(self.calls)
+            phases = dict(self.phases)
+
+        methods = defaultdict(list)
+        for record in calls:
+            methods[record.method].append(record)
+
+        return {
+            "calls": {
+                method: _summarize(records)
+                for method, records in sorted(methods.items())
+            },
+            "phases": phases,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.summary(), indent=2, sort_keys=True)
+
+    def to_prometheus(self) -> str:
+        summary = self.summary()
+        metrics = [
+            ("calls_total", "counter", "BigQuery client calls", "count"),
+            ("call_errors_total", "counter", "failed BigQuery client calls", "errors"),
+            ("call_retries_total", "counter", "retried BigQuery client calls", "retries"),
+            (
+                "call_duration_seconds_sum",
+                "counter",
+                "time spent in BigQuery client calls",
+                "duration_seconds",
+            ),
+            (
+                "call_duration_seconds_max",
+                "gauge",
+                "slowest BigQuery client call",
+                "max_duration_seconds",
+            ),
+            (
+                "call_queue_wait_seconds_sum",
+                "counter",
+                "time calls waited for the rate limiter",
+                "queue_wait_seconds",
+            ),
+            ("bytes_total", "counter", "bytes copied or processed by jobs", "bytes"),
+        ]
+        lines = []
+        for name, metric_type, description, key in metrics:
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {description}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {metric_type}")
+            for method, values in summary["calls"].items():
+                lines.append(
+                    f'{METRIC_PREFIX}_{name}{{method="{method}"}} {values[key]}'
+                )
+        lines.append(
+            f"# HELP {METRIC_PREFIX}_phase_duration_seconds time spent per phase"
+        )
+        lines.append(f"# TYPE {METRIC_PREFIX}_phase_duration_seconds gauge")
+        for phase, seconds in sorted(summary["phases"].items()):
+            lines.append(
+                f'{METRIC_PREFIX}_phase_duration_seconds{{phase="{phase}"}} {seconds}'
+            )
+        return "\n".join(lines) + "\n"
+
+    def profile(self) -> str:
+        summary = self.summary()
+        phases = summary["phases"]
+        total = sum(phases.values()) or 1.0
+        lines = [
+            f"{phase:<20}  {seconds:8.3f}s  {100 * seconds / total:5.1f}%"
+            for phase, seconds in sorted(phases.items(), key=lambda item: -item[1])
+        ]
+        lines.extend(
+            f"{method:<20}  {values['duration_seconds']:8.3f}s  "
+            f"{values['count']} calls, p95 {values['p95_duration_seconds']:.3f}s, "
+            f"{values['retries']} retries, {values['queue_wait_seconds']:.3f}s queued"
+            for method, values in summary["calls"].items()
+        )
+        return "\n".join(lines)
+
+    def export(self, path: str, metrics_format: str) -> None:
+        if metrics_format == "prometheus":
+            content = self.to_prometheus()
+        else:
+            content = self.to_json()
+        # textfile collectors may read at any time, so the file is replaced atomically
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(descriptor, "w") as metrics_file:
+            metrics_file.write(content)
+        os.replace(temporary_path, path)
+
+
+def _summarize(records: List[CallRecord]) -> dict:
+    durations = sorted(record.duration for record in records)
+    return {
+        "count": len(records),
+        "errors": sum(1 for record in records if record.error is not None),
+        "retries": sum(record.retries for record in records),
+        "duration_seconds": sum(durations),
+        "max_duration_seconds": durations[-1],
+        "p50_duration_seconds": _percentile(durations, 0.50),
+        "p95_duration_seconds": _percentile(durations, 0.95),
+        "queue_wait_seconds": sum(record.queue_wait for record in records),
+        "bytes": sum(record.bytes or 0 for record in records),
+        "job_ids": [record.job_id for record in records if record.job_id is not None],
+    }
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+_instrumentation: Instrumentation = Instrumentation()
+
+
+def get_instrumentation() -> Instrumentation:
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation: Instrumentation) -> None:
+    global _instrumentation
+    _instrumentation = instrumentation
@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict
+from typing import Set
+
+from source.partition_executor import PartitionResult
+
+
+def journal_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "bigquery_utils", "journals")
+
+
+def default_journal_path(*parts: str) -> str:
+    name = "-".join(part.replace(os.sep, "_") for part in parts)
+    return os.path.join(journal_dir(), f"{name}.jsonl")
+
+
+class Journal:
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.resume = resume
+        self._lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self) -> "Journal":
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a" if self.resume else "w")
+        if self._file.tell() > 0 and not _ends_with_newline(self.path):
+            self._file.write("\n")
+        _fsync_directory(directory)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._file.close()
+        self._file = None
+
+    def completed(self) -> Set[str]:
+        if not self.resume or not os.path.exists(self.path):
+            return set()
+
+        completed = set()
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a crash can leave the last line half written
+                    logging.warning(f"ignoring corrupted journal line: {line!r}")
+                    continue
+                if record.get("status") == "succeeded":
+                    completed.add(record["partition"])
+        return completed
+
+    def record(self, result: PartitionResult) -> None:
+        line = json.dumps(asdict(result)) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as journal_file:
+        journal_file.seek(-1, os.SEEK_END)
+        return journal_file.read(1) == b"\n"
+
+
+def _fsync_directory(directory: str) -> None:
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
@@ -0,0 +1,50 @@
+from collections import Counter
+from dataclasses import dataclass
+from typing import List
+
+
+@dataclass(frozen=True)
+class ViewReference:
+    project_id: str
+    dataset_id: str
+    view: str
+
+    def __str__(self) -> str:
+        return f"{self.project_id}.{self.dataset_id}.{self.view}"
+
+
+def load_manifest(
+    path: str, default_project_id: str, default_dataset_id: str
+) -> List[ViewReference]:
+    import yaml
+
+    with open(path) as manifest_file:
+        content = yaml.safe_load(manifest_file)
+
+    if isinstance(content, dict):
+        default_project_id = content.get("project_id", default_project_id)
+        default_dataset_id = content.get("dataset_id", default_dataset_id)
+        content = content.get("views")
+
+    if not isinstance(content, list) or not content:
+        raise ValueError(f"manifest {path} does not contain a list of views")
+
+    views = []
+    for entry in content:
+        if isinstance(entry, str):
+            entry = {"view": entry}
+        if not isinstance(entry, dict) or "view" not in entry:
+            raise ValueError(f"invalid view entry in manifest {path}: {entry}")
+        views.append(
+            ViewReference(
+                entry.get("project_id", default_project_id),
+                entry.get("dataset_id", default_dataset_id),
+                entry["view"],
+            )
+        )
+
+    duplicates = {str(view) for view, count in Counter(views).items() if count > 1}
+    if duplicates:
+        raise ValueError(f"views listed more than once in manifest {path}: {duplicates}")
+
+    return views
@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+DEFAULT_TTL = 300.0
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def default_cache_path() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "bigquery_utils", "metadata.json")
+
+
+@dataclass
+class CacheEntry:
+    stored_at: float
+    resource: dict
+
+
+# table and view resources keyed by fully qualified ID, kept in memory and
+# merged into a file shared by the runs that follow; writes made through
+# the client invalidate their table, the TTL bounds what other writers
+# can leave stale
+class MetadataCache:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._invalidated: Dict[str, float] = {}
+        self._loaded = path is None
+        # whether anything was put or invalidated since the last flush
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def get(self, table_id: str) -> Optional[dict]:
+        with self._lock:
+            self._load()
+            entry = self._entries.get(table_id)
+            if entry is None:
+                return None
+            if self._clock() - entry.stored_at > self.ttl:
+                del self._entries[table_id]
+                return None
+            self._entries.move_to_end(table_id)
+            return entry.resource
+
+    def put(self, table_id: str, resource: dict) -> None:
+        with self._lock:
+            self._load()
+            self._entries[table_id] = CacheEntry(self._clock(), resource)
+            self._entries.move_to_end(table_id)
+            self._evict()
+            self._dirty = True
+
+    def invalidate(self, table_id: str) -> None:
+        # a partition decorator changes the metadata of the whole table
+        table_id = table_id.split("$")[0]
+        with self._lock:
+            self._entries.pop(table_id, None)
+            self._invalidated[table_id] = self._clock()
+            self._dirty = True
+
+    def flush(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            # a run that only read cached entries leaves the file as it is
+            if not self._dirty:
+                return
+            self._load()
+            # another run may have written the file since it was read, its
+            # entries are kept unless they are older than an invalidation
+            merged = OrderedDict()
+            for table_id, entry in self._read().items():
+                if entry.stored_at > self._invalidated.get(table_id, float("-inf")):
+                    merged[table_id] = entry
+            for table_id, entry in self._entries.items():
+                current = merged.pop(table_id, None)
+                merged[table_id] = (
+                    current if current and current.stored_at > entry.stored_at else entry
+                )
+            now = self._clock()
+            self._entries = OrderedDict(
+                (table_id, entry)
+                for table_id, entry in merged.items()
+                if now - entry.stored_at <= self.ttl
+            )
+            self._evict()
+            self._write()
+            self._dirty = False
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        self._entries.update(self._read())
+        self._evict()
+
+    def _read(self) -> "OrderedDict[str, CacheEntry]":
+        entries = OrderedDict()
+        try:
+            with open(self.path) as cache_file:
+                content = json.load(cache_file)
+        except FileNotFoundError:
+            return entries
+        except ValueError:
+            logging.warning(f"ignoring corrupted metadata cache {self.path}")
+            return entries
+        for entry in content.get("entries", []):
+            entries[entry["id"]] = CacheEntry(entry["stored_at"], entry["resource"])
+        return entries
+
+    def _write(self) -> None:
+        content = {
+            "entries": [
+                {"id": table_id, "stored_at": entry.stored_at, "resource": entry.resource}
+                for table_id, entry in self._entries.items()
+            ]
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # concurrent runs read the file at any time, so it is replaced atomically
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(descriptor, "w") as cache_file:
+            json.dump(content, cache_file, default=str)
+        os.replace(temporary_path, self.path)
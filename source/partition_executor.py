@@ -0,0 +1,345 @@
+import logging
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+)
+
+from source.bigquery_utils import job_bytes
+from source.instrumentation import CallRecord, get_instrumentation
+from source.rate_limiter import is_retryable
+
+T = TypeVar("T")
+
+DEFAULT_PARALLELISM = 8
+DEFAULT_POLL_INTERVAL = 1.0
+# consecutive failed polls after which a job is given up on, its outcome
+# unknown
+DEFAULT_MAX_POLL_FAILURES = 5
+# threads sending the submit and poll calls of a JobPoller
+DEFAULT_POLL_WORKERS = 8
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+@dataclass
+class PartitionTask:
+    partition: str
+    operation: Callable[[], Any]
+    target: Optional[str] = None
+
+
+@dataclass
+class JobTask:
+    partition: str
+    submit: Callable[[], Any]
+    target: Optional[str] = None
+
+
+@dataclass
+class PartitionResult:
+    partition: str
+    status: str
+    duration: float
+    error: Optional[str] = None
+    job_id: Optional[str] = None
+    bytes: Optional[int] = None
+    target: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.status == SUCCEEDED
+
+    def to_record(self, operation: str) -> dict:
+        return {"type": "partition", "operation": operation, **asdict(self)}
+
+
+@dataclass
+class RunSummary:
+    operation: str
+    results: List[PartitionResult] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    target: Optional[str] = None
+
+    @property
+    def succeeded(self) -> List[PartitionResult]:
+        return [result for result in self.results if result.succeeded]
+
+    @property
+    def failed(self) -> List[PartitionResult]:
+        return [result for result in self.results if not result.succeeded]
+
+    def to_record(self) -> dict:
+        return {
+            "type": "summary",
+            "operation": self.operation,
+            "target": self.target,
+            "succeeded": len(self.succeeded),
+            "failed": len(self.failed),
+            "skipped": len(self.skipped),
+        }
+
+    def __str__(self) -> str:
+        operation = self.operation
+        if self.target is not None:
+            operation += f" to {self.target}"
+        line = f"{operation}: {len(self.succeeded)} succeeded, {len(self.failed)} failed"
+        if self.skipped:
+            line += f", {len(self.skipped)} skipped"
+        lines = [line]
+        for result in sorted(self.failed, key=lambda r: r.partition):
+            lines.append(f"  {result.partition}: {result.error}")
+        return "\n".join(lines)
+
+
+class PartitionsFailed(Exception):
+    # the run went to the end but some partitions failed; the report is still
+    # output, the command only exits with an error status
+    def __init__(self, summaries: List[RunSummary], output: Optional[str]):
+        super().__init__(
+            output
+            or f"{sum(len(summary.failed) for summary in summaries)} partitions failed"
+        )
+        self.summaries = summaries
+        self.output = output
+
+
+def check_summaries(summaries: List[RunSummary], output: Optional[str]) -> None:
+    if any(summary.failed for summary in summaries):
+        raise PartitionsFailed(summaries, output)
+
+
+class FairQueue(Generic[T]):
+    # tasks of several targets are taken in turn, so one large table does not
+    # hold back the others, and at most max_per_target tasks of a target run
+    # at once; streams are keyed by the target of their tasks, the executors
+    # release a target when one of its tasks finishes
+    def __init__(
+        self,
+        streams: Dict[Optional[str], Iterable[T]],
+        max_per_target: Optional[int] = None,
+    ):
+        if max_per_target is not None and max_per_target < 1:
+            raise ValueError(f"max_per_target must be at least 1: {max_per_target}")
+        self.max_per_target = max_per_target
+        self._streams = OrderedDict((target, iter(tasks)) for target, tasks in streams.items())
+        self._running = Counter()
+
+    def take(self) -> Optional[T]:
+        for target, tasks in list(self._streams.items()):
+            if (
+                self.max_per_target is not None
+                and self._running[target] >= self.max_per_target
+            ):
+                continue
+            task = next(tasks, None)
+            if task is None:
+                del self._streams[target]
+                continue
+            self._streams.move_to_end(target)
+            self._running[target] += 1
+            return task
+        # either every stream is exhausted or every remaining one is at its
+        # cap, and then a running task releases a slot when it finishes
+        return None
+
+    def release(self, target: Optional[str]) -> None:
+        self._running[target] -= 1
+
+
+def task_queue(tasks: Iterable[T]) -> FairQueue[T]:
+    if isinstance(tasks, FairQueue):
+        return tasks
+    return FairQueue({None: tasks})
+
+
+class PartitionExecutor:
+    def __init__(self, parallelism: int = DEFAULT_PARALLELISM):
+        if parallelism < 1:
+            raise ValueError(f"parallelism must be at least 1: {parallelism}")
+        self.parallelism = parallelism
+
+    def run(self, tasks: Iterable[PartitionTask]) -> Iterator[PartitionResult]:
+        queue = task_queue(tasks)
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            pending = set()
+            while True:
+                while len(pending) < self.parallelism:
+                    task = queue.take()
+                    if task is None:
+                        break
+                    pending.add(pool.submit(_execute, task))
+                if not pending:
+                    return
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    queue.release(result.target)
+                    yield result
+
+
+class JobPoller:
+    # the jobs run server-side, the threads only carry the submit and poll
+    # calls, so each round of them is sent at once instead of one after the
+    # other; the fair queue caps and max_in_flight bound what is in flight
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_PARALLELISM,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        max_poll_failures: int = DEFAULT_MAX_POLL_FAILURES,
+        workers: int = DEFAULT_POLL_WORKERS,
+    ):
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1: {max_in_flight}")
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1: {workers}")
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.max_poll_failures = max_poll_failures
+        self.workers = min(workers, max_in_flight)
+
+    def run(self, tasks: Iterable[JobTask]) -> Iterator[PartitionResult]:
+        queue = task_queue(tasks)
+        in_flight = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                submitted = []
+                while len(in_flight) + len(submitted) < self.max_in_flight:
+                    task = queue.take()
+                    if task is None:
+                        break
+                    submitted.append((task, time.monotonic(), pool.submit(task.submit)))
+                for task, started, submission in submitted:
+                    try:
+                        in_flight.append((task, submission.result(), started, 0))
+                    except Exception as e:
+                        logging.error(f"submitting job for {task.partition} failed: {e}")
+                        queue.release(task.target)
+                        yield PartitionResult(
+                            task.partition,
+                            FAILED,
+                            time.monotonic() - started,
+                            error=str(e),
+                            target=task.target,
+                        )
+
+                if not in_flight:
+                    # failed submissions freed their slots for the next tasks
+                    if submitted:
+                        continue
+                    return
+
+                polls = [pool.submit(job.done) for _, job, _, _ in in_flight]
+                still_running = []
+                for (task, job, started, failures), poll in zip(in_flight, polls):
+                    try:
+                        done = poll.result()
+                    except Exception as e:
+                        failures += 1
+                        if not is_retryable(e) or failures >= self.max_poll_failures:
+                            logging.error(
+                                f"polling job {job.job_id} for {task.partition} failed: {e}"
+                            )
+                            queue.release(task.target)
+                            yield _record_job(
+                                task,
+                                PartitionResult(
+                                    task.partition,
+                                    FAILED,
+                                    time.monotonic() - started,
+                                    error=f"polling the job failed: {e}",
+                                    job_id=job.job_id,
+                                    target=task.target,
+                                ),
+                            )
+                            continue
+                        logging.warning(f"polling job {job.job_id} failed: {e}")
+                        still_running.append((task, job, started, failures))
+                        continue
+                    if done:
+                        queue.release(task.target)
+                        yield _job_result(task, job, started)
+                    else:
+                        still_running.append((task, job, started, 0))
+
+                if len(still_running) == len(in_flight):
+                    time.sleep(self.poll_interval)
+                in_flight = still_running
+
+
+def round_robin(iterables: Iterable[Iterable[T]]) -> Iterator[T]:
+    iterators = [iter(iterable) for iterable in iterables]
+    while iterators:
+        for iterator in list(iterators):
+            try:
+                yield next(iterator)
+            except StopIteration:
+                iterators.remove(iterator)
+
+
+def _job_result(task: JobTask, job, started: float) -> PartitionResult:
+    try:
+        job.result()
+    except Exception as e:
+        logging.error(f"job {job.job_id} for {task.partition} failed: {e}")
+        result = PartitionResult(
+            task.partition,
+            FAILED,
+            time.monotonic() - started,
+            error=str(e),
+            job_id=job.job_id,
+            target=task.target,
+        )
+    else:
+        result = PartitionResult(
+            task.partition,
+            SUCCEEDED,
+            time.monotonic() - started,
+            job_id=job.job_id,
+            bytes=job_bytes(job),
+            target=task.target,
+        )
+    return _record_job(task, result)
+
+
+def _record_job(task: JobTask, result: PartitionResult) -> PartitionResult:
+    get_instrumentation().record_call(
+        CallRecord(
+            "job",
+            task.partition,
+            result.duration,
+            job_id=result.job_id,
+            bytes=result.bytes,
+            error=result.error,
+        )
+    )
+    return result
+
+
+def _execute(task: PartitionTask) -> PartitionResult:
+    started = time.monotonic()
+    try:
+        task.operation()
+    except Exception as e:
+        logging.error(f"operation on {task.partition} failed: {e}")
+        return PartitionResult(
+            task.partition,
+            FAILED,
+            time.monotonic() - started,
+            error=str(e),
+            target=task.target,
+        )
+    return PartitionResult(
+        task.partition, SUCCEEDED, time.monotonic() - started, target=task.target
+    )
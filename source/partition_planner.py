@@ -0,0 +1,128 @@
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from source.bigquery_utils import PartitionMetadata
+
+WHOLE_TABLE = "*"
+
+
+@dataclass
+class PartitionPlan:
+    partitions: Sequence[str]
+    skipped: List[str] = field(default_factory=list)
+    whole_table: bool = False
+    metadata: Dict[str, PartitionMetadata] = field(default_factory=dict)
+
+
+def unplanned(requested: Sequence[str]) -> PartitionPlan:
+    return PartitionPlan(requested)
+
+
+def without_completed(plan: PartitionPlan, completed: Set[str]) -> PartitionPlan:
+    if not completed:
+        return plan
+    if WHOLE_TABLE in completed:
+        return PartitionPlan(
+            [], sorted([*plan.skipped, *plan.partitions]), metadata=plan.metadata
+        )
+    return PartitionPlan(
+        [partition_id for partition_id in plan.partitions if partition_id not in completed],
+        sorted(
+            plan.skipped
+            + [partition_id for partition_id in plan.partitions if partition_id in completed]
+        ),
+        plan.whole_table and not completed.intersection(plan.partitions),
+        plan.metadata,
+    )
+
+
+def largest_first(plan: PartitionPlan) -> PartitionPlan:
+    # a large partition started last keeps the run waiting on a single job,
+    # started first it runs while the smaller ones share the other workers
+    if not plan.metadata:
+        return plan
+    return replace(
+        plan,
+        partitions=sorted(
+            plan.partitions,
+            key=lambda partition_id: getattr(
+                plan.metadata.get(partition_id), "total_logical_bytes", 0
+            ),
+            reverse=True,
+        ),
+    )
+
+
+def plan_partitions(
+    requested: Iterable[str],
+    existing: Dict[str, PartitionMetadata],
+    destination: Optional[Dict[str, PartitionMetadata]] = None,
+) -> PartitionPlan:
+    partitions = []
+    skipped = []
+    for partition_id in requested:
+        metadata = existing.get(partition_id)
+        # copying an empty source partition still truncates the destination one
+        kept = getattr((destination or {}).get(partition_id), "total_rows", 0) > 0
+        if (metadata is None or metadata.total_rows == 0) and not kept:
+            skipped.append(partition_id)
+        else:
+            partitions.append(partition_id)
+
+    planned = set(partitions)
+    # special partitions such as __NULL__ or __STREAMING_UNPARTITIONED__ are
+    # never addressed by a range, so a table holding them is never covered
+    whole_table = (
+        bool(partitions)
+        and all(
+            partition_id in planned
+            for partition_id, metadata in existing.items()
+            if partition_id.startswith("__") or metadata.total_rows > 0
+        )
+        and all(partition_id in planned for partition_id in destination or {})
+    )
+    return PartitionPlan(partitions, skipped, whole_table, existing)
+
+
+def plan_incremental_copy(
+    requested: Iterable[str],
+    source: Dict[str, PartitionMetadata],
+    destination: Dict[str, PartitionMetadata],
+) -> PartitionPlan:
+    requested = list(requested)
+    plan = plan_partitions(requested, source, destination)
+    planned = set(plan.partitions)
+    # a partition emptied or dropped in the source since the last copy is
+    # changed too, copying it clears the rows left in the destination
+    changed = [
+        partition_id
+        for partition_id in requested
+        if _is_changed(
+            source.get(partition_id) if partition_id in planned else None,
+            destination.get(partition_id),
+        )
+    ]
+    unchanged = set(requested) - set(changed)
+    return PartitionPlan(
+        changed,
+        sorted(unchanged),
+        plan.whole_table and not unchanged.intersection(planned),
+        source,
+    )
+
+
+def _is_changed(
+    source: Optional[PartitionMetadata], destination: Optional[PartitionMetadata]
+) -> bool:
+    if source is None:
+        return destination is not None and destination.total_rows > 0
+    if destination is None:
+        return True
+    if (
+        source.total_rows != destination.total_rows
+        or source.total_logical_bytes != destination.total_logical_bytes
+    ):
+        return True
+    if source.last_modified_time is None or destination.last_modified_time is None:
+        return True
+    return source.last_modified_time > destination.last_modified_time
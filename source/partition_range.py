@@ -0,0 +1,99 @@
+import datetime
+from typing import Iterator, Optional, Sequence, Union
+
+HOUR = "hour"
+DAY = "day"
+MONTH = "month"
+YEAR = "year"
+INTEGER = "integer"
+GRANULARITIES = (HOUR, DAY, MONTH, YEAR, INTEGER)
+
+_FORMATS = {HOUR: "%Y%m%d%H", DAY: "%Y%m%d", MONTH: "%Y%m", YEAR: "%Y"}
+_GRANULARITY_BY_LENGTH = {10: HOUR, 8: DAY, 6: MONTH, 4: YEAR}
+
+
+class PartitionRange(Sequence[str]):
+    # like range(), the IDs are computed on demand so a multi-year hourly
+    # range costs the same memory as a single day
+    def __init__(
+        self,
+        start: str,
+        end: str,
+        granularity: Optional[str] = None,
+        interval: int = 1,
+    ):
+        self.granularity = granularity or _infer_granularity(start, end)
+        if self.granularity not in GRANULARITIES:
+            raise ValueError(f"unknown partition granularity: {self.granularity}")
+        if interval < 1:
+            raise ValueError(f"interval must be at least 1: {interval}")
+        self.start = start
+        self.end = end
+        self.interval = interval
+
+        if self.granularity == INTEGER:
+            self._start, last = int(start), int(end)
+            self._length = (last - self._start) // interval + 1
+        else:
+            date_format = _FORMATS[self.granularity]
+            self._start = datetime.datetime.strptime(start, date_format)
+            last = datetime.datetime.strptime(end, date_format)
+            self._length = self._steps(self._start, last) + 1
+        if self._length <= 0:
+            raise ValueError(f"start {start} is after end {end}")
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(f"partition range index out of range: {index}")
+        return self._partition_id(index)
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(self._length):
+            yield self._partition_id(index)
+
+    def __repr__(self) -> str:
+        return f"PartitionRange({self.start}..{self.end}, {self.granularity})"
+
+    def _partition_id(self, index: int) -> str:
+        if self.granularity == INTEGER:
+            return str(self._start + index * self.interval)
+        if self.granularity == HOUR:
+            value = self._start + datetime.timedelta(hours=index)
+        elif self.granularity == DAY:
+            value = self._start + datetime.timedelta(days=index)
+        elif self.granularity == MONTH:
+            months = self._start.month - 1 + index
+            value = self._start.replace(
+                year=self._start.year + months // 12, month=months % 12 + 1
+            )
+        else:
+            value = self._start.replace(year=self._start.year + index)
+        return value.strftime(_FORMATS[self.granularity])
+
+    def _steps(self, start: datetime.datetime, end: datetime.datetime) -> int:
+        if self.granularity == HOUR:
+            return int((end - start).total_seconds()) // 3600
+        if self.granularity == DAY:
+            return (end - start).days
+        if self.granularity == MONTH:
+            return (end.year - start.year) * 12 + end.month - start.month
+        return end.year - start.year
+
+
+def _infer_granularity(start: str, end: str) -> str:
+    if len(start) != len(end):
+        raise ValueError(f"start {start} and end {end} have different granularities")
+    granularity = _GRANULARITY_BY_LENGTH.get(len(start))
+    if granularity is None or not start.isdigit():
+        raise ValueError(
+            f"cannot infer the granularity of {start}, expected YYYYMMDDHH, "
+            "YYYYMMDD, YYYYMM or YYYY"
+        )
+    return granularity
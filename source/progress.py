@@ -0,0 +1,29 @@
+import argparse
+import json
+import sys
+import threading
+from typing import Optional, TextIO
+
+TEXT = "text"
+NDJSON = "ndjson"
+OUTPUTS = (TEXT, NDJSON)
+
+
+class NdjsonWriter:
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, default=str)
+        # one flush per record, a consumer acts on a partition as soon as
+        # its line arrives instead of when the buffer fills
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def progress_writer(args: argparse.Namespace) -> Optional[NdjsonWriter]:
+    if args.output != NDJSON:
+        return None
+    return NdjsonWriter(args.stdout or sys.stdout)
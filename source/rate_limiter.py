@@ -0,0 +1,226 @@
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_TABLE_RATE = 5.0
+DEFAULT_PROJECT_RATE = 50.0
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BASE_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 60.0
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_REASONS = {"rateLimitExceeded", "backendError", "internalError"}
+THROTTLED_STATUS_CODE = 429
+THROTTLED_REASON = "rateLimitExceeded"
+
+
+@dataclass
+class CallStats:
+    retries: int = 0
+    queue_wait: float = 0.0
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            self._sleep(wait)
+
+    def try_acquire(self) -> float:
+        # takes a token and returns 0, or returns how long to wait for one
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+class AdaptiveConcurrency:
+    # threads wait on the condition, callers that cannot block, such as
+    # coroutines, take a slot with try_enter and register a listener called
+    # whenever one may have freed
+    def __init__(self, maximum: int = DEFAULT_MAX_CONCURRENCY, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = maximum
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+        self._listeners: List[Callable[[], None]] = []
+
+    def __enter__(self) -> "AdaptiveConcurrency":
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+        self._notify_listeners()
+
+    def try_enter(self) -> bool:
+        with self._condition:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        with self._condition:
+            self._listeners.append(listener)
+
+    def on_success(self) -> None:
+        with self._condition:
+            self._successes += 1
+            if self._successes < self.limit or self.limit >= self.maximum:
+                return
+            self.limit += 1
+            self._successes = 0
+            self._condition.notify()
+        self._notify_listeners()
+
+    def on_throttle(self) -> None:
+        with self._condition:
+            # halve what was actually running, not the configured ceiling
+            self.limit = max(self.minimum, min(self.limit, self.in_flight + 1) // 2)
+            self._successes = 0
+            logging.info(f"throttled by BigQuery, concurrency lowered to {self.limit}")
+
+    def _notify_listeners(self) -> None:
+        for listener in list(self._listeners):
+            listener()
+
+
+def is_retryable(error: Exception) -> bool:
+    code = getattr(error, "code", None)
+    if code in RETRYABLE_STATUS_CODES:
+        return True
+    reasons = {
+        detail.get("reason")
+        for detail in getattr(error, "errors", None) or []
+        if isinstance(detail, dict)
+    }
+    return bool(reasons & RETRYABLE_REASONS)
+
+
+def is_rejected(error: Exception) -> bool:
+    # a request creating a job is only sent again when BigQuery refused it,
+    # after a server error the job may exist and a second one would run
+    return is_throttled(error)
+
+
+def is_throttled(error: Exception) -> bool:
+    # a server error says nothing about the load, only a rate limit does
+    if getattr(error, "code", None) == THROTTLED_STATUS_CODE:
+        return True
+    return any(
+        isinstance(detail, dict) and detail.get("reason") == THROTTLED_REASON
+        for detail in getattr(error, "errors", None) or []
+    )
+
+
+class RateLimiter:
+    # google-cloud-bigquery already retries each API request with its
+    # DEFAULT_RETRY, so the errors reaching this layer are the ones it gave up
+    # on or never retries, such as failed jobs; the retries here are few and
+    # spaced by the backoff, and a rate limit also lowers the concurrency
+    def __init__(
+        self,
+        table_rate: float = DEFAULT_TABLE_RATE,
+        project_rate: float = DEFAULT_PROJECT_RATE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_backoff: float = DEFAULT_BASE_BACKOFF,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.table_rate = table_rate
+        self.project_rate = project_rate
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self._sleep = sleep
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+
+    def call(
+        self,
+        project_id: str,
+        table_id: Optional[str],
+        operation: Callable[[], T],
+        stats: Optional[CallStats] = None,
+        retryable: Callable[[Exception], bool] = is_retryable,
+    ) -> T:
+        stats = stats or CallStats()
+        attempt = 0
+        while True:
+            queued = time.monotonic()
+            # tokens are waited for outside the concurrency slots, a call
+            # waiting on its table would otherwise hold a slot from the others
+            self._bucket(f"project:{project_id}", self.project_rate).acquire()
+            if table_id is not None:
+                table_key = table_id.split("$")[0]
+                self._bucket(f"table:{table_key}", self.table_rate).acquire()
+            with self.concurrency:
+                stats.queue_wait += time.monotonic() - queued
+                try:
+                    result = operation()
+                except Exception as e:
+                    if not retryable(e) or attempt >= self.max_retries:
+                        raise
+                    if is_throttled(e):
+                        self.concurrency.on_throttle()
+                    error = e
+                else:
+                    self.concurrency.on_success()
+                    return result
+
+            backoff = self.backoff(attempt)
+            logging.warning(
+                f"retrying {table_id or project_id} in {backoff:.1f}s after: {error}"
+            )
+            self._sleep(backoff)
+            attempt += 1
+            stats.retries = attempt
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def _bucket(self, key: str, rate: float) -> TokenBucket:
+        with self._buckets_lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, sleep=self._sleep)
+            return bucket
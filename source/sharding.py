@@ -0,0 +1,93 @@
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from source.partition_executor import PartitionResult, RunSummary
+from source.partition_planner import WHOLE_TABLE
+from source.partition_range import PartitionRange
+
+MERGED = "merged"
+
+
+@dataclass(frozen=True)
+class Shard:
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        index, separator, count = value.partition("/")
+        if not separator or not index.isdigit() or not count.isdigit():
+            raise ValueError(f"expected INDEX/COUNT, got {value}")
+        shard = cls(int(index), int(count))
+        if not 0 <= shard.index < shard.count:
+            raise ValueError(f"shard index must be between 0 and {shard.count - 1}: {value}")
+        return shard
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+
+def shard_partitions(partitions: PartitionRange, shard: Optional[Shard]) -> Sequence[str]:
+    if shard is None:
+        return partitions
+    # contiguous slices depend only on the range and the shard count, so
+    # every worker computes the same split without coordinating, and each
+    # slice stays a single range condition for the bulk strategy
+    start = len(partitions) * shard.index // shard.count
+    end = len(partitions) * (shard.index + 1) // shard.count
+    logging.info(f"shard {shard} takes {end - start} of {len(partitions)} partitions")
+    if start == end:
+        return []
+    return PartitionRange(
+        partitions[start], partitions[end - 1], partitions.granularity, partitions.interval
+    )
+
+
+def load_results(path: str) -> Iterable[Tuple[Optional[str], PartitionResult]]:
+    # journals hold bare results, --output ndjson files add the record type
+    # and operation; summary records are recomputed from the results
+    with open(path) as results_file:
+        for line in results_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logging.warning(f"ignoring corrupted line in {path}: {line!r}")
+                continue
+            if record.pop("type", "partition") != "partition":
+                continue
+            operation = record.pop("operation", None)
+            yield operation, PartitionResult(**record)
+
+
+def merge_results(paths: Iterable[str]) -> List[RunSummary]:
+    latest: Dict[tuple, PartitionResult] = {}
+    # journals do not record the operation, ndjson outputs do
+    operations: Dict[Optional[str], str] = {}
+    for path in paths:
+        for operation, result in load_results(path):
+            # a bulk statement covers only its own shard, so whole table
+            # results of different files are distinct runs
+            key = (
+                result.target,
+                (path, WHOLE_TABLE) if result.partition == WHOLE_TABLE else result.partition,
+            )
+            previous = latest.get(key)
+            # a resumed run appends the retry after the failure, and a
+            # success anywhere settles the partition
+            if previous is None or not previous.succeeded or result.succeeded:
+                latest[key] = result
+            if operation is not None:
+                operations[result.target] = operation
+
+    summaries: Dict[Optional[str], RunSummary] = {}
+    for (target, _), result in latest.items():
+        if target not in summaries:
+            summaries[target] = RunSummary(
+                operations.get(target, MERGED), target=target
+            )
+        summaries[target].results.append(result)
+    for summary in summaries.values():
+        summary.results.sort(key=lambda result: result.partition)
+    return list(summaries.values())
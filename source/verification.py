@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from source.bigquery_utils import Partitioning
+from source.bulk_strategy import range_condition
+
+MISSING_IN_DESTINATION = "missing in destination"
+MISSING_IN_SOURCE = "missing in source"
+ROW_COUNT_DIFFERS = "row count differs"
+CONTENT_DIFFERS = "content differs"
+
+_PARTITION_ID_FORMATS = {
+    "HOUR": "%Y%m%d%H",
+    "DAY": "%Y%m%d",
+    "MONTH": "%Y%m",
+    "YEAR": "%Y",
+}
+
+
+@dataclass(frozen=True)
+class PartitionFingerprint:
+    partition_id: str
+    row_count: int
+    fingerprint: str
+
+
+@dataclass(frozen=True)
+class Mismatch:
+    partition_id: str
+    reason: str
+    source: Optional[PartitionFingerprint] = None
+    destination: Optional[PartitionFingerprint] = None
+
+    def __str__(self) -> str:
+        if self.reason == ROW_COUNT_DIFFERS:
+            return (
+                f"{self.partition_id}: {self.reason}, "
+                f"{self.source.row_count} != {self.destination.row_count}"
+            )
+        return f"{self.partition_id}: {self.reason}"
+
+
+def fingerprint_query(
+    table_id: str, partitioning: Partitioning, partition_ids: List[str]
+) -> str:
+    if partitioning.column is None:
+        column = "_PARTITIONTIME"
+    elif partitioning.column_type == "TIMESTAMP":
+        # TIMESTAMP() only converts strings, dates and datetimes
+        column = f"t.`{partitioning.column}`"
+    else:
+        column = f"TIMESTAMP(t.`{partitioning.column}`)"
+    partition_id = (
+        f"FORMAT_TIMESTAMP('{_PARTITION_ID_FORMATS[partitioning.granularity]}', "
+        f"TIMESTAMP_TRUNC({column}, {partitioning.granularity}))"
+    )
+    # a sum of row hashes does not depend on the row order and, unlike a
+    # XOR, does not cancel out duplicated rows; NUMERIC cannot overflow here
+    return (
+        f"SELECT {partition_id} AS partition_id, COUNT(*) AS row_count, "
+        "SUM(CAST(FARM_FINGERPRINT(TO_JSON_STRING(t)) AS NUMERIC)) AS fingerprint "
+        f"FROM `{table_id}` AS t "
+        f"WHERE {range_condition(partitioning, partition_ids)} "
+        "GROUP BY partition_id"
+    )
+
+
+def parse_fingerprints(rows: Iterable) -> Dict[str, PartitionFingerprint]:
+    return {
+        row.partition_id: PartitionFingerprint(
+            row.partition_id, row.row_count, str(row.fingerprint)
+        )
+        for row in rows
+    }
+
+
+def diff_fingerprints(
+    source: Dict[str, PartitionFingerprint],
+    destination: Dict[str, PartitionFingerprint],
+) -> List[Mismatch]:
+    mismatches = []
+    for partition_id in sorted(set(source) | set(destination)):
+        source_fingerprint = source.get(partition_id)
+        destination_fingerprint = destination.get(partition_id)
+        if destination_fingerprint is None:
+            reason = MISSING_IN_DESTINATION
+        elif source_fingerprint is None:
+            reason = MISSING_IN_SOURCE
+        elif source_fingerprint.row_count != destination_fingerprint.row_count:
+            reason = ROW_COUNT_DIFFERS
+        elif source_fingerprint.fingerprint != destination_fingerprint.fingerprint:
+            reason = CONTENT_DIFFERS
+        else:
+            continue
+        mismatches.append(
+            Mismatch(partition_id, reason, source_fingerprint, destination_fingerprint)
+        )
+    return mismatches
@@ -0,0 +1,180 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+BLUE = "blue"
+GREEN = "green"
+
+# strings and comments are matched whole, so a table name inside them is
+# neither reported nor rewritten; a path is a run of dotted identifiers,
+# each backquoted or bare
+_TOKENS = re.compile(
+    r"""
+    (?P<skip>
+        --[^\n]* | \#[^\n]* | /\*.*?(?:\*/|\Z)
+      | [rRbB]{0,2}(?:'''.*?''' | \"\"\".*?\"\"\" | '(?:\\.|[^'\\\n])*' | "(?:\\.|[^"\\\n])*")
+    )
+  | (?P<path>
+        (?:`[^`]*`|[A-Za-z_]\w*(?:-\w+)*)
+        (?:\s*\.\s*(?:`[^`]*`|[A-Za-z_]\w*(?:-\w+)*))*
+    )
+  | (?P<punctuation>[(),;])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+_QUOTES_AND_SPACES = re.compile(r"[`\s]")
+_COLOR_SUFFIX = re.compile(r"_(blue|green)(`?)$")
+
+# keywords ending a FROM list, anything else after a table is an alias or
+# a modifier of the table
+_CLAUSE_KEYWORDS = {
+    "WHERE",
+    "GROUP",
+    "ORDER",
+    "HAVING",
+    "LIMIT",
+    "ON",
+    "USING",
+    "UNION",
+    "EXCEPT",
+    "INTERSECT",
+    "WINDOW",
+    "QUALIFY",
+    "SELECT",
+    "LEFT",
+    "RIGHT",
+    "INNER",
+    "FULL",
+    "CROSS",
+    "OUTER",
+}
+
+# words that may follow a FROM item without being its alias
+_ITEM_KEYWORDS = _CLAUSE_KEYWORDS | {
+    "JOIN",
+    "FOR",
+    "TABLESAMPLE",
+    "WITH",
+    "PIVOT",
+    "UNPIVOT",
+}
+
+
+
+@dataclass(frozen=True)
+class TableReference:
+    table: str
+    color: str
+
+    @property
+    def project_id(self) -> Optional[str]:
+        # None when the query leaves the project to the one of the view
+        parts = self.table.split(".")
+        return parts[-3] if len(parts) > 2 else None
+
+    @property
+    def dataset_id(self) -> str:
+        return self.table.split(".")[-2]
+
+    @property
+    def table_name_only(self) -> str:
+        return self.table.split(".")[-1]
+
+    @property
+    def switched_table(self) -> str:
+        return f"{self.table[: -len(self.color)]}{switch_color(self.color)}"
+
+    @property
+    def non_production_table_name_only(self) -> str:
+        return self.switched_table.split(".")[-1]
+
+
+def switch_color(current_color: str) -> str:
+    return {BLUE: GREEN, GREEN: BLUE}.get(current_color, current_color)
+
+
+def rewrite_view_query(query: str) -> Tuple[List[TableReference], str]:
+    # one scan finds the colored tables in FROM and JOIN positions and joins
+    # the untouched spans between them with their switched names, so the
+    # cost stays linear in the query whatever the number of tables
+    references = {}
+    pieces = []
+    position = 0
+    expect_table = False
+    in_from_list = False
+    # after a FROM item, the next bare name is its alias
+    expect_alias = False
+    previous_keyword = None
+    # whether each open parenthesis was opened inside a FROM list
+    parentheses = []
+    # per open parenthesis, whether it holds a SELECT, a FROM in one that
+    # does not belongs to a function call such as EXTRACT(YEAR FROM ts)
+    selects = [True]
+    # per open parenthesis, the aliases declared in it; a path starting with
+    # one of them is a column or an array of that item, not a table
+    aliases = [set()]
+    for token in _TOKENS.finditer(query):
+        kind = token.lastgroup
+        text = token.group()
+        if kind == "skip":
+            continue
+        if kind == "punctuation":
+            expect_alias = False
+            if text == "(":
+                parentheses.append(expect_table or in_from_list)
+                selects.append(False)
+                aliases.append(set())
+                in_from_list = False
+            elif text == ")":
+                in_from_list = parentheses.pop() if parentheses else False
+                if len(selects) > 1:
+                    selects.pop()
+                    aliases.pop()
+                expect_alias = in_from_list
+            elif text == ";":
+                in_from_list = False
+            expect_table = text == "," and in_from_list
+            previous_keyword = None
+            continue
+
+        keyword = text.upper()
+        if expect_alias:
+            expect_alias = keyword == "AS"
+            if not expect_alias and keyword not in _ITEM_KEYWORDS and "." not in text:
+                aliases[-1].add(_QUOTES_AND_SPACES.sub("", text).lower())
+                previous_keyword = None
+                continue
+        if keyword == "SELECT":
+            selects[-1] = True
+        if keyword == "JOIN" or (
+            keyword == "FROM" and selects[-1] and previous_keyword != "DISTINCT"
+        ):
+            expect_table, in_from_list = True, False
+            previous_keyword = keyword
+            continue
+        previous_keyword = keyword
+        if not expect_table:
+            if keyword in _CLAUSE_KEYWORDS:
+                in_from_list = False
+            continue
+
+        expect_table, in_from_list, expect_alias = False, True, True
+        table = _QUOTES_AND_SPACES.sub("", text)
+        segments = table.split(".")
+        correlated = len(segments) > 1 and any(
+            segments[0].lower() in scope for scope in aliases
+        )
+        # an item is also known by its last name when it has no alias
+        aliases[-1].add(segments[-1].lower())
+        color = _COLOR_SUFFIX.search(table)
+        # a bare name is a CTE or a table of the default dataset, never one
+        # of the colored versions
+        if correlated or color is None or len(segments) == 1:
+            continue
+        reference = references.setdefault(table, TableReference(table, color.group(1)))
+        suffix = _COLOR_SUFFIX.search(text)
+        pieces.append(query[position : token.start() + suffix.start()])
+        pieces.append(f"_{switch_color(reference.color)}{suffix.group(2)}")
+        position = token.end()
+    pieces.append(query[position:])
+    return list(references.values()), "".join(pieces)
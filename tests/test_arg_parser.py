@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import Mock
 
 from source.arg_parser import ArgumentParser
+from source.sharding import Shard
 
 
 class TestMain(unittest.TestCase):
@@ -33,8 +34,43 @@ class TestMain(unittest.TestCase):
         self.assertEqual("project_id", parser.project_id)
         self.assertEqual("dataset_id", parser.dataset_id)
         self.assertEqual("view", parser.view)
+        self.assertFalse(parser.all)
+        self.assertEqual("text", parser.output)
         self.assertEqual(self.display_mock.run, parser.func)
 
+    def test_parse_args_for_display_all(self):
+        parser = self.sut.build_parser(
+            [
+                "display",
+                "--project-id=project_id",
+                "--dataset-id=dataset_id",
+                "--all",
+                "--filter=revenues_*",
+                "--filter=*_campaigns",
+                "--output=ndjson",
+            ]
+        )
+        self.assertTrue(parser.all)
+        self.assertIsNone(parser.view)
+        self.assertEqual(["revenues_*", "*_campaigns"], parser.filter)
+        self.assertEqual("ndjson", parser.output)
+
+    def test_parse_args_for_display_requires_view_or_all(self):
+        with self.assertRaises(SystemExit):
+            self.sut.build_parser(
+                ["display", "--project-id=project_id", "--dataset-id=dataset_id"]
+            )
+        with self.assertRaises(SystemExit):
+            self.sut.build_parser(
+                [
+                    "display",
+                    "--project-id=project_id",
+                    "--dataset-id=dataset_id",
+                    "--view=view",
+                    "--all",
+                ]
+            )
+
     def test_parse_args_for_switch_color(self):
         parser = self.sut.build_parser(
             [
@@ -65,6 +101,33 @@ class TestMain(unittest.TestCase):
         self.assertEqual("view", parser.view)
         self.assertEqual(self.switch_mock.run, parser.func)
         self.assertTrue(parser.rebuild)
+        self.assertEqual("copy", parser.rebuild_strategy)
+
+    def test_parse_args_for_switch_rebuild_strategy(self):
+        parser = self.sut.build_parser(
+            [
+                "switch-color",
+                "--project-id=project_id",
+                "--dataset-id=dataset_id",
+                "--view=view",
+                "--rebuild",
+                "--rebuild-strategy=clone",
+            ]
+        )
+        self.assertEqual("clone", parser.rebuild_strategy)
+
+    def test_parse_args_for_switch_color_with_manifest(self):
+        parser = self.sut.build_parser(
+            [
+                "switch-color",
+                "--project-id=project_id",
+                "--dataset-id=dataset_id",
+                "--manifest=views.yaml",
+            ]
+        )
+        self.assertEqual("views.yaml", parser.manifest)
+        self.assertIsNone(parser.view)
+        self.assertEqual(self.switch_mock.run, parser.func)
 
     def test_parse_args_for_delete_action(self):
         parser = self.sut.build_parser(
@@ -79,11 +142,65 @@ class TestMain(unittest.TestCase):
         )
         self.assertEqual("project_id", parser.project_id)
         self.assertEqual("dataset_id", parser.dataset_id)
-        self.assertEqual("a_table", parser.table)
+        self.assertEqual(["a_table"], parser.table)
         self.assertEqual("2021-10-01", parser.start_date)
         self.assertEqual("2021-10-10", parser.end_date)
+        self.assertEqual(8, parser.parallelism)
+        self.assertTrue(parser.plan)
         self.assertEqual(self.delete_mock.run, parser.func)
 
+    def test_parse_args_for_delete_action_with_parallelism(self):
+        parser = self.sut.build_parser(
+            [
+                "delete-partitions",
+                "--project-id=project_id",
+                "--dataset-id=dataset_id",
+                "--table=a_table",
+                "--start-date=2021-10-01",
+                "--end-date=2021-10-10",
+                "--parallelism=32",
+                "--max-per-table=4",
+                "--no-plan",
+                "--dry-run",
+            ]
+        )
+        self.assertEqual(4, parser.max_per_table)
+        self.assertEqual(32, parser.parallelism)
+        self.assertFalse(parser.plan)
+        self.assertTrue(parser.dry_run)
+
+    def test_parse_args_for_delete_action_rejects_zero_parallelism(self):
+        with self.assertRaises(SystemExit):
+            self.sut.build_parser(
+                [
+                    "delete-partitions",
+                    "--project-id=project_id",
+                    "--dataset-id=dataset_id",
+                    "--table=a_table",
+                    "--start-date=2021-10-01",
+                    "--end-date=2021-10-10",
+                    "--parallelism=0",
+                ]
+            )
+
+    def test_parse_args_for_several_tables(self):
+        parser = self.sut.build_parser(
+            [
+                "copy-partitions",
+                "--dst-project-id=dst_project_id",
+                "--src-project-id=src_project_id",
+                "--dataset-id=dataset_id",
+                "--table",
+                "events_*",
+                "users",
+                "@tables.txt",
+                "--start-date=2021-10-01",
+                "--end-date=2021-10-10",
+            ]
+        )
+        self.assertEqual(["events_*", "users", "@tables.txt"], parser.table)
+        self.assertIsNone(parser.max_per_table)
+
     def test_parse_args_for_copy_action(self):
         parser = self.sut.build_parser(
             [
@@ -97,13 +214,125 @@ class TestMain(unittest.TestCase):
             ]
         )
         self.assertEqual("src_project_id", parser.src_project_id)
-        self.assertEqual("dst_project_id", parser.dst_project_id)
+        self.assertEqual(["dst_project_id"], parser.dst_project_id)
         self.assertEqual("dataset_id", parser.dataset_id)
-        self.assertEqual("a_table", parser.table)
+        self.assertEqual(["a_table"], parser.table)
         self.assertEqual("2021-10-01", parser.start_date)
         self.assertEqual("2021-10-10", parser.end_date)
+        self.assertEqual(8, parser.parallelism)
+        self.assertFalse(parser.incremental)
+        self.assertFalse(parser.dry_run)
+        self.assertIsNone(parser.granularity)
+        self.assertEqual(1, parser.interval)
+        self.assertEqual("text", parser.output)
+        self.assertIsNone(parser.stdout)
         self.assertEqual(self.copy_mock.run, parser.func)
 
+    def test_parse_integer_range_for_delete_action(self):
+        parser = self.sut.build_parser(
+            [
+                "delete-partitions",
+                "--project-id=project_id",
+                "--dataset-id=dataset_id",
+                "--table=a_table",
+                "--start-date=0",
+                "--end-date=1000",
+                "--granularity=integer",
+                "--interval=100",
+            ]
+        )
+        self.assertEqual("integer", parser.granularity)
+        self.assertEqual(100, parser.interval)
+
+    def test_parse_metrics_args(self):
+        parser = self.sut.build_parser(
+            [
+                "--metrics-file=metrics.prom",
+                "--metrics-format=prometheus",
+                "--profile",
+                "display",
+                "--project-id=project_id",
+                "--dataset-id=dataset_id",
+                "--view=view",
+            ]
+        )
+        self.assertEqual("metrics.prom", parser.metrics_file)
+        self.assertEqual("prometheus", parser.metrics_format)
+        self.assertTrue(parser.profile)
+
+    def test_metrics_are_disabled_by_default(self):
+        parser = self.sut.build_parser(
+            [
+                "display",
+                "--project-id=project_id",
+                "--dataset-id=dataset_id",
+                "--view=view",
+            ]
+        )
+        self.assertIsNone(parser.metrics_file)
+        self.assertEqual("json", parser.metrics_format)
+        self.assertFalse(parser.profile)
+        self.assertTrue(parser.cache)
+
+    def test_serve_is_only_available_with_a_serve_action(self):
+        with self.assertRaises(SystemExit):
+            self.sut.build_parser(["serve"])
+
+        serve_mock = Mock()
+        sut = ArgumentParser(
+            display_action=self.display_mock,
+            switch_action=self.switch_mock,
+            delete_partitions_action=self.delete_mock,
+            copy_partitions=self.copy_mock,
+            serve_action=serve_mock,
+        )
+        parser = sut.build_parser(["--socket=/tmp/bigquery_utils.sock", "serve"])
+        self.assertEqual("/tmp/bigquery_utils.sock", parser.socket)
+        self.assertEqual(serve_mock.run, parser.func)
+        self.assertIs(sut, parser.command_parser)
+
+    def test_parse_args_with_shard(self):
+        arguments = [
+            "delete-partitions",
+            "--project-id=project_id",
+            "--dataset-id=dataset_id",
+            "--table=table",
+            "--start-date=20200101",
+            "--end-date=20200131",
+        ]
+        self.assertIsNone(self.sut.build_parser(arguments).shard)
+        self.assertEqual(Shard(2, 4), self.sut.build_parser(arguments + ["--shard=2/4"]).shard)
+        for invalid in ("4/4", "2", "a/4"):
+            with self.subTest(invalid), self.assertRaises(SystemExit):
+                self.sut.build_parser(arguments + [f"--shard={invalid}"])
+
+    def test_parse_args_for_verify_partitions(self):
+        verify_mock = Mock()
+        sut = ArgumentParser(
+            display_action=self.display_mock,
+            switch_action=self.switch_mock,
+            delete_partitions_action=self.delete_mock,
+            copy_partitions=self.copy_mock,
+            verify_partitions_action=verify_mock,
+        )
+        parser = sut.build_parser(
+            [
+                "verify-partitions",
+                "--src-project-id=src",
+                "--dst-project-id",
+                "eu",
+                "us",
+                "--dataset-id=dataset_id",
+                "--table=table",
+                "--start-date=20200101",
+                "--end-date=20200131",
+                "--recopy",
+            ]
+        )
+        self.assertEqual(["eu", "us"], parser.dst_project_id)
+        self.assertTrue(parser.recopy)
+        self.assertEqual(verify_mock.run, parser.func)
+
     def test_all(self):
         parser = self.sut.build_parser(
             "display --project-id=jobrapido-sandbox --dataset-id=core --view=enriched_revenues".split(
@@ -0,0 +1,288 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from google.api_core.exceptions import BadRequest, ServiceUnavailable, TooManyRequests
+
+from benchmarks.fake_bigquery import FakeBigQueryClient, FakeGoogleClient
+from source.async_bigquery import AsyncPartitionExecutor, AsyncRateLimiter
+from source.bigquery_actions import (
+    BigQueryCopyPartitionsAction,
+    BigQueryDeletePartitionsAction,
+    generate_range,
+)
+from source.metadata_cache import MetadataCache
+from source.partition_executor import FAILED, SUCCEEDED, PartitionTask, PartitionsFailed
+from source.rate_limiter import RateLimiter
+
+
+def fast_client(fake: FakeGoogleClient) -> FakeBigQueryClient:
+    return FakeBigQueryClient(
+        fake, RateLimiter(table_rate=1e9, project_rate=1e9, sleep=lambda seconds: None)
+    )
+
+
+class TestAsyncBigQueryClient(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake = FakeGoogleClient()
+        self.fake.add_table("project.dataset.table", generate_range("20200101", "20200103"))
+        self.fake.add_view("project.dataset.view", "SELECT * FROM `p.d.t_blue`")
+        self.sut = fast_client(self.fake).async_client
+
+    def run_with_client(self, operation):
+        async def run():
+            async with self.sut:
+                return await operation()
+
+        return asyncio.run(run())
+
+    def test_extract_view_info(self):
+        view = self.run_with_client(
+            lambda: self.sut.extract_view_info("project", "dataset", "view")
+        )
+
+        self.assertEqual("SELECT * FROM `p.d.t_blue`", view.view_query)
+
+    def test_update_view(self):
+        self.run_with_client(
+            lambda: self.sut.update_view(
+                "project", "dataset", "view", "SELECT * FROM `p.d.t_green`"
+            )
+        )
+
+        self.assertEqual(
+            "SELECT * FROM `p.d.t_green`", self.fake.tables["project.dataset.view"].view_query
+        )
+
+    def test_metadata_cache_is_shared_with_the_client(self):
+        client = fast_client(self.fake)
+        client.metadata_cache = MetadataCache()
+        self.sut = client.async_client
+        client.extract_view_info("project", "dataset", "view")
+
+        self.run_with_client(lambda: self.sut.extract_view_info("project", "dataset", "view"))
+        self.assertEqual(0, self.fake.calls["rest_get"])
+
+        self.run_with_client(
+            lambda: self.sut.update_view("project", "dataset", "view", "SELECT 1")
+        )
+        self.assertEqual(
+            "SELECT 1", client.extract_view_info("project", "dataset", "view").view_query
+        )
+
+    def test_delete_missing_partition_is_ignored(self):
+        self.run_with_client(
+            lambda: self.sut.delete_table("project", "dataset", "missing$20200101")
+        )
+
+    def test_copy_table_waits_for_the_job(self):
+        self.fake.job_duration = 0.02
+
+        job = self.run_with_client(
+            lambda: self.sut.copy_table(
+                "project", "dataset", "table$20200102", "table$20200102", "other"
+            )
+        )
+
+        self.assertEqual(
+            str(1024 ** 2), job._properties["statistics"]["copy"]["copiedLogicalBytes"]
+        )
+        self.assertEqual(["20200102"], list(self.fake.tables["other.dataset.table"].partitions))
+
+    def test_failed_job_raises(self):
+        self.fake.failing_tables.add("other.dataset.table")
+
+        with self.assertRaises(BadRequest):
+            self.run_with_client(
+                lambda: self.sut.copy_table(
+                    "project", "dataset", "table$20200102", "table$20200102", "other"
+                )
+            )
+
+    def test_requests_need_an_open_client(self):
+        with self.assertRaises(RuntimeError):
+            asyncio.run(self.sut.delete_table("project", "dataset", "table$20200101"))
+
+
+class TestAsyncRateLimiter(unittest.TestCase):
+    def test_retries_retryable_errors(self):
+        sut = AsyncRateLimiter(table_rate=1e9, project_rate=1e9, base_backoff=0)
+        operation = Mock(side_effect=[ServiceUnavailable("busy"), "done"])
+
+        async def call():
+            return operation()
+
+        self.assertEqual("done", asyncio.run(sut.call_async("project", "table", call)))
+        self.assertEqual(2, operation.call_count)
+
+    def test_bounds_concurrency(self):
+        sut = AsyncRateLimiter(table_rate=1e9, project_rate=1e9, max_concurrency=3)
+        in_flight = []
+        peak = []
+
+        async def call():
+            in_flight.append(None)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+        async def run():
+            await asyncio.gather(*(sut.call_async("project", None, call) for _ in range(10)))
+
+        asyncio.run(run())
+        self.assertEqual(3, max(peak))
+
+    def test_like_shares_the_buckets_and_the_concurrency(self):
+        shared = RateLimiter(table_rate=1e9, project_rate=1e9, max_concurrency=4)
+        sut = AsyncRateLimiter.like(shared)
+        throttled = Mock(side_effect=[TooManyRequests("slow down"), "done"])
+
+        async def call():
+            return throttled()
+
+        shared.call("project", "p.d.t", lambda: None)
+        self.assertIs(shared.concurrency, sut.concurrency)
+        self.assertIn("table:p.d.t", sut._buckets)
+
+        sut.base_backoff = 0
+        asyncio.run(sut.call_async("project", "p.d.t", call))
+        self.assertLess(shared.concurrency.limit, 4)
+
+    def test_waits_for_slots_held_by_threads(self):
+        shared = RateLimiter(table_rate=1e9, project_rate=1e9, max_concurrency=1)
+        sut = AsyncRateLimiter.like(shared)
+        started, release = threading.Event(), threading.Event()
+        order = []
+
+        def hold_slot():
+            def operation():
+                started.set()
+                release.wait(5)
+                order.append("thread")
+
+            shared.call("project", None, operation)
+
+        async def call():
+            order.append("coroutine")
+
+        thread = threading.Thread(target=hold_slot)
+        thread.start()
+        started.wait(5)
+
+        async def run():
+            waiting = asyncio.ensure_future(sut.call_async("project", None, call))
+            await asyncio.sleep(0.05)
+            self.assertFalse(waiting.done())
+            release.set()
+            await asyncio.wait_for(waiting, 5)
+
+        asyncio.run(run())
+        thread.join()
+        self.assertEqual(["thread", "coroutine"], order)
+
+
+class TestAsyncPartitionExecutor(unittest.TestCase):
+    def test_runs_coroutines_and_callables(self):
+        threads = set()
+
+        async def coroutine():
+            threads.add(threading.current_thread().name)
+
+        def failing():
+            raise ValueError("boom")
+
+        results = list(
+            AsyncPartitionExecutor(2).run(
+                [
+                    PartitionTask("20200101", coroutine, "eu"),
+                    PartitionTask("20200102", failing),
+                ]
+            )
+        )
+
+        self.assertEqual(
+            {("20200101", SUCCEEDED, "eu"), ("20200102", FAILED, None)},
+            {(result.partition, result.status, result.target) for result in results},
+        )
+        self.assertEqual({"asyncio"}, threads)
+
+    def test_multiplexes_operations_on_one_loop(self):
+        async def wait():
+            await asyncio.sleep(0.05)
+
+        started = time.monotonic()
+        results = list(
+            AsyncPartitionExecutor(500).run(
+                PartitionTask(str(index), wait) for index in range(500)
+            )
+        )
+
+        self.assertEqual(500, len(results))
+        self.assertLess(time.monotonic() - started, 2)
+
+
+class TestAsyncActions(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.journal = os.path.join(directory.name, "journal.jsonl")
+        self.fake = FakeGoogleClient(job_duration=0.01)
+        self.client = fast_client(self.fake)
+
+    def args(self, **values) -> Mock:
+        args = Mock()
+        args.dataset_id = "dataset"
+        args.table = ["table"]
+        args.start_date = "20200101"
+        args.end_date = "20200110"
+        args.granularity = None
+        args.interval = 1
+        args.parallelism = 100
+        args.plan = False
+        args.journal = self.journal
+        args.resume = False
+        args.strategy = "per-partition"
+        args.shard = None
+        args.max_per_table = None
+        args.dry_run = False
+        args.output = "text"
+        args.asyncio = True
+        for name, value in values.items():
+            setattr(args, name, value)
+        return args
+
+    def test_delete_partitions(self):
+        self.fake.add_table("project.dataset.table", generate_range("20200101", "20200112"))
+
+        summary = BigQueryDeletePartitionsAction(self.client).run(
+            self.args(project_id="project")
+        )
+
+        self.assertEqual(10, len(summary.succeeded))
+        self.assertEqual(
+            ["20200111", "20200112"], sorted(self.fake.tables["project.dataset.table"].partitions)
+        )
+        self.assertEqual(0, self.fake.calls["delete_table"])
+
+    def test_copy_partitions_to_several_destinations(self):
+        self.fake.add_table("src.dataset.table", generate_range("20200101", "20200110"))
+        self.fake.failing_tables.add("us.dataset.table")
+
+        with self.assertRaises(PartitionsFailed) as failure:
+            BigQueryCopyPartitionsAction(self.client).run(
+                self.args(src_project_id="src", dst_project_id=["eu", "us"], incremental=False)
+            )
+
+        result = failure.exception.output
+
+        self.assertEqual(
+            generate_range("20200101", "20200110"),
+            sorted(self.fake.tables["eu.dataset.table"].partitions),
+        )
+        self.assertIn("copy-partitions to eu: 10 succeeded, 0 failed", result)
+        self.assertIn("copy-partitions to us: 0 succeeded, 10 failed", result)
+        self.assertEqual(0, self.fake.calls["copy_table"])
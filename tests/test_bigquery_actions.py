@@ -1,13 +1,36 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import tempfile
 import unittest
-from unittest.mock import Mock, call
+from unittest.mock import ANY, Mock, call
 
+from benchmarks.fake_bigquery import FakeBigQueryClient, FakeGoogleClient
+from source.bigquery_utils import PartitionMetadata, Partitioning
 from source.bigquery_actions import (
     BigQuerySwitchAction,
     BigQueryDisplayAction,
     BigQueryDeletePartitionsAction,
     generate_range,
+    requested_partitions,
     BigQueryCopyPartitionsAction,
+    BigQueryVerifyPartitionsAction,
+    TableTarget,
+    requested_tables,
 )
+from source.partition_executor import PartitionsFailed
+from source.partition_planner import unplanned
+from source.partition_range import PartitionRange
+from source.rate_limiter import RateLimiter
+from source.sharding import Shard
+
+
+def temporary_journal(test: unittest.TestCase) -> str:
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    return os.path.join(directory.name, "journal.jsonl")
 
 
 class TestBigQueryActionModule(unittest.TestCase):
@@ -29,11 +52,36 @@ class TestBigQueryActionModule(unittest.TestCase):
         actual = "20211014"
         current_date = "20211014"
 
-        with self.assertRaises(ValueError):
-            generate_range(actual, current_date)
+        self.assertEqual(["20211014"], generate_range(actual, current_date))
 
 
 class TestBigQueryDisplayAction(unittest.TestCase):
+    def setUp(self) -> None:
+        args = Mock()
+        args.project_id = "project_id"
+        args.dataset_id = "dataset_id"
+        args.all = True
+        args.filter = []
+        args.output = "text"
+        args.parallelism = 4
+
+        queries = {
+            "revenues": "SELECT * FROM `project_id.dataset_id_versions.revenues_green`",
+            "campaigns": "SELECT * FROM `project_id.dataset_id_versions.campaigns_blue`",
+            "joined": "SELECT * FROM `p.d.a_blue` JOIN `p.d.b_green` USING (id)",
+        }
+
+        def extract_view_info(project_id, dataset, view, use_cache=True):
+            response = Mock()
+            response.view_query = queries[view]
+            return response
+
+        self.bigquery_client = Mock()
+        self.bigquery_client.list_views.return_value = list(queries)
+        self.bigquery_client.extract_view_info.side_effect = extract_view_info
+        self.args = args
+        self.sut = BigQueryDisplayAction(self.bigquery_client)
+
     def test_run(self):
         args = Mock()
         args.project_id = "project_id"
@@ -49,6 +97,79 @@ class TestBigQueryDisplayAction(unittest.TestCase):
         sut = BigQueryDisplayAction(bigquery_client)
 
         self.assertEqual("green", sut.run(args))
+        bigquery_client.extract_view_info.assert_called_once_with(
+            "project_id", "dataset_id", args.view, use_cache=False
+        )
+
+    def test_run_reports_each_joined_table(self):
+        self.args.all = False
+        self.args.view = "joined"
+
+        self.assertEqual("p.d.a_blue: blue\np.d.b_green: green", self.sut.run(self.args))
+
+    def test_run_as_ndjson(self):
+        self.args.all = False
+        self.args.view = "joined"
+        self.args.output = "ndjson"
+        self.args.stdout = io.StringIO()
+
+        self.assertIsNone(self.sut.run(self.args))
+
+        self.assertEqual(
+            [
+                {"view": "joined", "table": "p.d.a_blue", "color": "blue", "error": None},
+                {"view": "joined", "table": "p.d.b_green", "color": "green", "error": None},
+            ],
+            [json.loads(line) for line in self.args.stdout.getvalue().splitlines()],
+        )
+
+    def test_run_all_as_table(self):
+        self.args.filter = ["revenues", "camp*"]
+
+        expected = (
+            "VIEW       TABLE                                          COLOR\n"
+            "campaigns  project_id.dataset_id_versions.campaigns_blue  blue\n"
+            "revenues   project_id.dataset_id_versions.revenues_green  green"
+        )
+        self.assertEqual(expected, self.sut.run(self.args))
+        self.bigquery_client.list_views.assert_called_once_with(
+            "project_id", "dataset_id"
+        )
+        self.assertEqual(2, self.bigquery_client.extract_view_info.call_count)
+        self.bigquery_client.extract_view_info.assert_called_with(
+            "project_id", "dataset_id", ANY, use_cache=False
+        )
+
+    def test_run_all_as_table_lists_each_joined_table(self):
+        self.args.filter = ["joined"]
+
+        expected = (
+            "VIEW    TABLE        COLOR\n"
+            "joined  p.d.a_blue   blue\n"
+            "joined  p.d.b_green  green"
+        )
+        self.assertEqual(expected, self.sut.run(self.args))
+
+    def test_run_all_as_ndjson(self):
+        self.args.output = "ndjson"
+        self.args.stdout = io.StringIO()
+
+        self.assertIsNone(self.sut.run(self.args))
+
+        lines = sorted(
+            (json.loads(line) for line in self.args.stdout.getvalue().splitlines()),
+            key=lambda line: line["view"],
+        )
+
+        self.assertEqual(
+            ["campaigns", "joined", "joined", "revenues"], [l["view"] for l in lines]
+        )
+        self.assertEqual("blue", lines[0]["color"])
+        self.assertIsNone(lines[0]["error"])
+        self.assertEqual(
+            {("p.d.a_blue", "blue"), ("p.d.b_green", "green")},
+            {(l["table"], l["color"]) for l in lines[1:3]},
+        )
 
 
 class TestBigQuerySwitchAction(unittest.TestCase):
@@ -57,11 +178,13 @@ class TestBigQuerySwitchAction(unittest.TestCase):
         args.project_id = "project_id"
         args.dataset_id = "dataset_id"
         args.view = "view"
+        args.manifest = None
+        args.rebuild_strategy = "copy"
 
         mock_response = Mock()
 
         bigquery_client = Mock()
-        # bigquery_client.extract_view_info.return_value = mock_response
+        bigquery_client.extract_view_info.return_value = mock_response
 
         self.args = args
         self.bigquery_client = bigquery_client
@@ -93,11 +216,13 @@ class TestBigQuerySwitchAction(unittest.TestCase):
 
         self.assertEqual(expected_query, result)
 
+        self.bigquery_client.extract_view_info.assert_called_once_with(
+            "project_id", "dataset_id", "view", use_cache=False
+        )
         self.bigquery_client.update_view.assert_called_once_with(
             "project_id", "dataset_id", "view", expected_query
         )
-        self.bigquery_client.delete_table.assert_not_called()
-        self.bigquery_client.copy_table.assert_not_called()
+        self.bigquery_client.rebuild_table.assert_not_called()
 
     def test_run_with_rebuild(self):
         self.args.rebuild = True
@@ -114,15 +239,238 @@ class TestBigQuerySwitchAction(unittest.TestCase):
         self.bigquery_client.update_view.assert_called_once_with(
             "project_id", "dataset_id", "view", expected_query
         )
-        self.bigquery_client.delete_table.assert_called_once_with(
-            "project_id", "dataset_id_versions", "enriched_revenues_blue"
-        )
-        self.bigquery_client.copy_table.assert_called_once_with(
-            "project_id",
-            "dataset_id_versions",
+        self.bigquery_client.rebuild_table.assert_called_once_with(
+            "jobrapido-sandbox",
+            "core_versions",
             "enriched_revenues_green",
             "enriched_revenues_blue",
+            "copy",
+        )
+
+    def test_run_with_rebuild_switches_every_joined_table(self):
+        self.args.rebuild = True
+        self.mock_response.view_query = (
+            "SELECT * FROM `p.core_versions.revenues_green` r "
+            "JOIN `p.core_versions.campaigns_green` c ON r.campaign = c.id"
+        )
+
+        result = self.sut.run(self.args)
+
+        self.assertEqual(
+            "SELECT * FROM `p.core_versions.revenues_blue` r "
+            "JOIN `p.core_versions.campaigns_blue` c ON r.campaign = c.id",
+            result,
+        )
+        self.assertEqual(
+            [
+                call("p", "core_versions", "revenues_green", "revenues_blue", "copy"),
+                call("p", "core_versions", "campaigns_green", "campaigns_blue", "copy"),
+            ],
+            self.bigquery_client.rebuild_table.call_args_list,
+        )
+
+    def test_run_with_rebuild_strategy(self):
+        self.args.rebuild = True
+        self.args.rebuild_strategy = "clone"
+        self.mock_response.view_query = "SELECT * FROM `jobrapido-sandbox.core_versions.enriched_revenues_blue`"
+
+        self.sut.run(self.args)
+
+        self.bigquery_client.rebuild_table.assert_called_once_with(
+            "jobrapido-sandbox",
+            "core_versions",
+            "enriched_revenues_blue",
+            "enriched_revenues_green",
+            "clone",
+        )
+
+    def test_run_with_rebuild_defaults_to_the_project_of_the_view(self):
+        self.args.rebuild = True
+        self.mock_response.view_query = "SELECT * FROM `core_versions.revenues_blue`"
+
+        self.sut.run(self.args)
+
+        self.bigquery_client.rebuild_table.assert_called_once_with(
+            "project_id", "core_versions", "revenues_blue", "revenues_green", "copy"
+        )
+
+    def test_run_refuses_views_mixing_colors(self):
+        self.args.rebuild = True
+        self.mock_response.view_query = (
+            "SELECT * FROM `p.core_versions.revenues_green` r "
+            "JOIN `p.core_versions.campaigns_blue` c ON r.campaign = c.id"
+        )
+
+        with self.assertRaisesRegex(ValueError, "both colors"):
+            self.sut.run(self.args)
+
+        self.bigquery_client.rebuild_table.assert_not_called()
+        self.bigquery_client.update_view.assert_not_called()
+
+
+class TestBigQuerySwitchActionWithManifest(unittest.TestCase):
+    def setUp(self) -> None:
+        manifest = tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False)
+        self.addCleanup(os.remove, manifest.name)
+        with manifest:
+            manifest.write("- revenues\n- campaigns\n- clicks\n")
+
+        args = Mock()
+        args.project_id = "project_id"
+        args.dataset_id = "dataset_id"
+        args.manifest = manifest.name
+        args.rebuild = False
+        args.rebuild_strategy = "snapshot"
+        args.parallelism = 4
+
+        self.queries = {
+            "revenues": "SELECT * FROM `project_id.dataset_id_versions.revenues_green`",
+            "campaigns": "SELECT * FROM `project_id.dataset_id_versions.campaigns_blue`",
+            "clicks": "SELECT * FROM `project_id.dataset_id_versions.revenues_green` WHERE click",
+        }
+
+        def extract_view_info(project_id, dataset, view, use_cache=True):
+            response = Mock()
+            response.view_query = self.queries[view]
+            return response
+
+        self.bigquery_client = Mock()
+        self.bigquery_client.extract_view_info.side_effect = extract_view_info
+        self.args = args
+        self.sut = BigQuerySwitchAction(self.bigquery_client)
+
+    def test_run(self):
+        result = self.sut.run(self.args)
+
+        self.assertEqual(
+            "project_id.dataset_id.revenues: green -> blue\n"
+            "project_id.dataset_id.campaigns: blue -> green\n"
+            "project_id.dataset_id.clicks: green -> blue",
+            result,
+        )
+        self.bigquery_client.update_view.assert_has_calls(
+            [
+                call(
+                    "project_id",
+                    "dataset_id",
+                    "revenues",
+                    "SELECT * FROM `project_id.dataset_id_versions.revenues_blue`",
+                ),
+                call(
+                    "project_id",
+                    "dataset_id",
+                    "campaigns",
+                    "SELECT * FROM `project_id.dataset_id_versions.campaigns_green`",
+                ),
+                call(
+                    "project_id",
+                    "dataset_id",
+                    "clicks",
+                    "SELECT * FROM `project_id.dataset_id_versions.revenues_blue` WHERE click",
+                ),
+            ],
+            any_order=True,
+        )
+        self.bigquery_client.rebuild_table.assert_not_called()
+
+    def test_run_as_ndjson(self):
+        self.args.output = "ndjson"
+        self.args.stdout = io.StringIO()
+
+        self.assertIsNone(self.sut.run(self.args))
+
+        records = [json.loads(line) for line in self.args.stdout.getvalue().splitlines()]
+        self.assertEqual(
+            {
+                "type": "view",
+                "view": "project_id.dataset_id.revenues",
+                "from": "green",
+                "to": "blue",
+                "status": "succeeded",
+                "error": None,
+            },
+            records[0],
+        )
+        self.assertEqual(3, len(records))
+
+    def test_run_with_rebuild_rebuilds_each_table_once(self):
+        self.args.rebuild = True
+
+        self.sut.run(self.args)
+
+        self.bigquery_client.rebuild_table.assert_has_calls(
+            [
+                call(
+                    "project_id",
+                    "dataset_id_versions",
+                    "revenues_green",
+                    "revenues_blue",
+                    "snapshot",
+                ),
+                call(
+                    "project_id",
+                    "dataset_id_versions",
+                    "campaigns_blue",
+                    "campaigns_green",
+                    "snapshot",
+                ),
+            ],
+            any_order=True,
+        )
+        self.assertEqual(2, self.bigquery_client.rebuild_table.call_count)
+        self.assertEqual(3, self.bigquery_client.update_view.call_count)
+
+    def test_run_with_rebuild_refuses_both_colors_of_a_table(self):
+        self.args.rebuild = True
+        self.queries["clicks"] = "SELECT * FROM `project_id.dataset_id_versions.revenues_blue`"
+
+        with self.assertRaisesRegex(ValueError, "project_id.dataset_id_versions.revenues"):
+            self.sut.run(self.args)
+
+        self.bigquery_client.rebuild_table.assert_not_called()
+        self.bigquery_client.update_view.assert_not_called()
+
+    def test_run_does_not_switch_when_a_rebuild_fails(self):
+        self.args.rebuild = True
+        self.bigquery_client.rebuild_table.side_effect = RuntimeError("copy failed")
+
+        with self.assertRaises(RuntimeError):
+            self.sut.run(self.args)
+
+        self.bigquery_client.update_view.assert_not_called()
+
+    def test_run_refuses_a_manifest_with_a_view_mixing_colors(self):
+        self.args.rebuild = True
+        self.queries["clicks"] = (
+            "SELECT * FROM `project_id.dataset_id_versions.revenues_green` "
+            "JOIN `project_id.dataset_id_versions.campaigns_blue` USING (id)"
+        )
+
+        with self.assertRaisesRegex(ValueError, "project_id.dataset_id.clicks"):
+            self.sut.run(self.args)
+
+        self.bigquery_client.rebuild_table.assert_not_called()
+        self.bigquery_client.update_view.assert_not_called()
+
+    def test_run_rolls_back_switched_views_when_an_update_fails(self):
+        def update_view(project_id, dataset, view, query):
+            if view == "campaigns" and "campaigns_green" in query:
+                raise RuntimeError("update failed")
+
+        self.bigquery_client.update_view.side_effect = update_view
+
+        with self.assertRaises(RuntimeError) as error:
+            self.sut.run(self.args)
+
+        self.assertIn("project_id.dataset_id.campaigns", str(error.exception))
+        self.bigquery_client.update_view.assert_has_calls(
+            [
+                call("project_id", "dataset_id", "revenues", self.queries["revenues"]),
+                call("project_id", "dataset_id", "clicks", self.queries["clicks"]),
+            ],
+            any_order=True,
         )
+        self.assertEqual(5, self.bigquery_client.update_view.call_count)
 
 
 class TestBigQueryDeletePartitionsAction(unittest.TestCase):
@@ -130,9 +478,20 @@ class TestBigQueryDeletePartitionsAction(unittest.TestCase):
         args = Mock()
         args.project_id = "project_id"
         args.dataset_id = "dataset_id"
-        args.table = "table"
+        args.table = ["table"]
         args.start_date = "20211010"
         args.end_date = "20211014"
+        args.parallelism = 4
+        args.plan = False
+        args.journal = temporary_journal(self)
+        args.resume = False
+        args.strategy = "auto"
+        args.granularity = None
+        args.interval = 1
+        args.shard = None
+        args.max_per_table = None
+        args.dry_run = False
+        args.asyncio = False
 
         self.args = args
         self.bigquery_client = Mock()
@@ -140,7 +499,7 @@ class TestBigQueryDeletePartitionsAction(unittest.TestCase):
         self.sut = BigQueryDeletePartitionsAction(self.bigquery_client)
 
     def test_run(self):
-        self.sut.run(self.args)
+        summary = self.sut.run(self.args)
 
         calls = [
             call("project_id", "dataset_id", "table$20211010"),
@@ -150,26 +509,287 @@ class TestBigQueryDeletePartitionsAction(unittest.TestCase):
             call("project_id", "dataset_id", "table$20211014"),
         ]
 
-        self.bigquery_client.delete_table.assert_has_calls(calls)
+        self.bigquery_client.delete_table.assert_has_calls(calls, any_order=True)
+        self.assertEqual(5, self.bigquery_client.delete_table.call_count)
+        self.assertEqual(5, len(summary.succeeded))
+        self.assertEqual([], summary.failed)
+
+    def test_run_hourly_partitions(self):
+        self.args.start_date = "2021101023"
+        self.args.end_date = "2021101100"
+
+        self.sut.run(self.args)
+
+        self.assertCountEqual(
+            [
+                call("project_id", "dataset_id", "table$2021101023"),
+                call("project_id", "dataset_id", "table$2021101100"),
+            ],
+            self.bigquery_client.delete_table.call_args_list,
+        )
+
+    def test_run_one_shard(self):
+        self.args.shard = Shard(1, 2)
+
+        self.sut.run(self.args)
+
+        self.assertCountEqual(
+            [
+                call("project_id", "dataset_id", "table$20211012"),
+                call("project_id", "dataset_id", "table$20211013"),
+                call("project_id", "dataset_id", "table$20211014"),
+            ],
+            self.bigquery_client.delete_table.call_args_list,
+        )
+
+    def test_run_integer_range_partitions_one_by_one(self):
+        self.args.start_date = "0"
+        self.args.end_date = "400"
+        self.args.granularity = "integer"
+        self.args.interval = 100
+
+        summary = self.sut.run(self.args)
+
+        self.assertEqual(5, len(summary.succeeded))
+        self.bigquery_client.run_query.assert_not_called()
+
+    def test_run_integer_range_partitions_in_bulk_is_rejected(self):
+        self.args.start_date = "0"
+        self.args.end_date = "400"
+        self.args.granularity = "integer"
+        self.args.strategy = "bulk"
+
+        with self.assertRaises(ValueError):
+            self.sut.run(self.args)
+
+    def test_tasks_stream_long_ranges(self):
+        # ten years of hourly partitions; with bulk disabled the first
+        # deletions run before the rest of the range is produced
+        self.args.start_date = "2012010100"
+        self.args.end_date = "2021123123"
+        self.args.strategy = "per-partition"
+        self.args.parallelism = 1
+        tasks = self.sut._tasks(
+            self.args, TableTarget("table", None), unplanned(requested_partitions(self.args))
+        )
+
+        first = next(iter(tasks))
+
+        self.assertEqual("2012010100", first.partition)
+        self.assertIsInstance(unplanned(requested_partitions(self.args)).partitions, PartitionRange)
+
+    def test_run_collects_failures_without_stopping(self):
+        def delete_table(project_id, dataset, table):
+            if table == "table$20211012":
+                raise RuntimeError("boom")
+
+        self.bigquery_client.delete_table.side_effect = delete_table
+
+        with self.assertRaises(PartitionsFailed) as failure:
+            self.sut.run(self.args)
+
+        [summary] = failure.exception.summaries
+        self.assertEqual(5, self.bigquery_client.delete_table.call_count)
+        self.assertEqual(4, len(summary.succeeded))
+        self.assertEqual(["20211012"], [r.partition for r in summary.failed])
+        self.assertEqual("boom", summary.failed[0].error)
+
+    def test_run_as_ndjson_writes_a_record_per_partition(self):
+        self.args.output = "ndjson"
+        self.args.stdout = io.StringIO()
+
+        self.assertIsNone(self.sut.run(self.args))
+
+        records = [json.loads(line) for line in self.args.stdout.getvalue().splitlines()]
+        self.assertEqual(
+            generate_range("20211010", "20211014"),
+            sorted(record["partition"] for record in records[:-1]),
+        )
+        self.assertEqual(
+            {"type": "partition", "operation": "delete-partitions", "status": "succeeded"},
+            {key: records[0][key] for key in ("type", "operation", "status")},
+        )
+        self.assertEqual(
+            {
+                "type": "summary",
+                "operation": "delete-partitions",
+                "target": None,
+                "succeeded": 5,
+                "failed": 0,
+                "skipped": 0,
+            },
+            records[-1],
+        )
+
+    def test_run_as_ndjson_fails_after_writing_the_summary(self):
+        self.args.output = "ndjson"
+        self.args.stdout = io.StringIO()
+        self.bigquery_client.delete_table.side_effect = RuntimeError("boom")
+
+        with self.assertRaises(PartitionsFailed):
+            self.sut.run(self.args)
+
+        records = [json.loads(line) for line in self.args.stdout.getvalue().splitlines()]
+        self.assertEqual(("summary", 5), (records[-1]["type"], records[-1]["failed"]))
+
+    def test_run_records_finished_partitions_in_the_journal(self):
+        def delete_table(project_id, dataset, table):
+            if table == "table$20211013":
+                raise RuntimeError("interrupted")
+
+        self.bigquery_client.delete_table.side_effect = delete_table
+
+        with self.assertRaises(PartitionsFailed):
+            self.sut.run(self.args)
+
+        with open(self.args.journal) as journal:
+            records = [json.loads(line) for line in journal]
+        self.assertEqual(
+            {"20211010", "20211011", "20211012", "20211014"},
+            {r["partition"] for r in records if r["status"] == "succeeded"},
+        )
+
+    def test_run_with_resume_skips_finished_partitions(self):
+        with open(self.args.journal, "w") as journal:
+            journal.write('{"partition": "20211010", "status": "succeeded"}\n')
+            journal.write('{"partition": "20211011", "status": "failed"}\n')
+            journal.write('{"partition": "20211012", "status": "succ')
+        self.args.resume = True
+
+        summary = self.sut.run(self.args)
+
+        self.assertEqual(4, self.bigquery_client.delete_table.call_count)
+        self.assertEqual(["20211010"], summary.skipped)
+        with open(self.args.journal) as journal:
+            lines = journal.read().splitlines()
+        self.assertEqual(7, len(lines))
+        self.assertEqual("20211011", json.loads(lines[1])["partition"])
+
+    def test_run_with_plan_skips_missing_and_empty_partitions(self):
+        self.args.plan = True
+        self.bigquery_client.list_partitions.return_value = {
+            "20211001": PartitionMetadata("20211001", 10, 100),
+            "20211011": PartitionMetadata("20211011", 10, 100),
+            "20211012": PartitionMetadata("20211012", 0, 0),
+            "20211014": PartitionMetadata("20211014", 10, 100),
+        }
+
+        summary = self.sut.run(self.args)
+
+        self.bigquery_client.list_partitions.assert_called_once_with(
+            "project_id", "dataset_id", "table"
+        )
+        self.bigquery_client.delete_table.assert_has_calls(
+            [
+                call("project_id", "dataset_id", "table$20211011"),
+                call("project_id", "dataset_id", "table$20211014"),
+            ],
+            any_order=True,
+        )
+        self.assertEqual(2, self.bigquery_client.delete_table.call_count)
+        self.assertEqual(["20211010", "20211012", "20211013"], summary.skipped)
+
+    def test_run_with_bulk_strategy(self):
+        self.args.strategy = "bulk"
+        self.bigquery_client.get_partitioning.return_value = Partitioning(
+            "day", "DATE", "DAY"
+        )
+
+        summary = self.sut.run(self.args)
+
+        self.bigquery_client.run_query.assert_called_once_with(
+            "project_id",
+            "project_id.dataset_id.table",
+            "DELETE FROM `project_id.dataset_id.table` WHERE "
+            "(`day` >= DATE '2021-10-10' AND `day` < DATE '2021-10-15')",
+        )
+        self.bigquery_client.delete_table.assert_not_called()
+        self.assertEqual(["*"], [r.partition for r in summary.succeeded])
+        self.bigquery_client.get_partitioning.assert_called_once_with(
+            "project_id", "dataset_id", "table", use_cache=False
+        )
+
+    def test_run_with_auto_strategy_deletes_partition_by_partition(self):
+        self.args.start_date = "20210101"
+        self.args.end_date = "20211231"
+
+        self.sut.run(self.args)
+
+        self.bigquery_client.run_query.assert_not_called()
+        self.assertEqual(365, self.bigquery_client.delete_table.call_count)
+
+    def test_run_with_plan_truncates_when_the_range_covers_the_table(self):
+        self.args.plan = True
+        self.bigquery_client.list_partitions.return_value = {
+            "20211011": PartitionMetadata("20211011", 10, 100),
+            "20211012": PartitionMetadata("20211012", 10, 100),
+        }
+
+        summary = self.sut.run(self.args)
+
+        self.bigquery_client.truncate_table.assert_called_once_with(
+            "project_id", "dataset_id", "table"
+        )
+        self.bigquery_client.delete_table.assert_not_called()
+        self.assertEqual(["*"], [r.partition for r in summary.succeeded])
+
+
+    def test_dry_run_reports_the_plan_without_deleting(self):
+        self.args.plan = True
+        self.args.resume = True
+        self.args.strategy = "per-partition"
+        self.bigquery_client.rate_limiter.table_rate = 10
+        self.bigquery_client.list_partitions.return_value = {
+            "20211011": PartitionMetadata("20211011", 10, 100),
+            "20211014": PartitionMetadata("20211014", 20, 2048),
+        }
+        self.args.dry_run = True
+        with open(self.args.journal, "w") as journal:
+            journal.write('{"partition": "20211014", "status": "succeeded"}\n')
+
+        output = self.sut.run(self.args)
+
+        self.bigquery_client.delete_table.assert_not_called()
+        self.assertEqual(
+            "delete-partitions (dry run): 1 delete, 100 B, 10 rows, 4 skipped\n"
+            "  20211011     delete            100 B        10 rows\n"
+            "estimated duration: 0s with parallelism 4",
+            output,
+        )
+        with open(self.args.journal) as journal:
+            self.assertEqual(1, len(journal.readlines()))
 
 
 class TestBigQueryCopyPartitionsAction(unittest.TestCase):
     def setUp(self) -> None:
         args = Mock()
-        args.dst_project_id = "dst_project_id"
+        args.dst_project_id = ["dst_project_id"]
         args.dataset_id = "dataset_id"
         args.src_project_id = "src_project_id"
-        args.table = "table"
+        args.table = ["table"]
         args.start_date = "20211010"
         args.end_date = "20211014"
+        args.parallelism = 2
+        args.plan = False
+        args.journal = temporary_journal(self)
+        args.resume = False
+        args.strategy = "auto"
+        args.granularity = None
+        args.interval = 1
+        args.shard = None
+        args.max_per_table = None
+        args.dry_run = False
+        args.asyncio = False
+        args.incremental = False
 
         self.args = args
         self.bigquery_client = Mock()
+        self.bigquery_client.submit_copy_table.return_value = Mock(job_id="job_id")
         self.mock_response = Mock()
         self.sut = BigQueryCopyPartitionsAction(self.bigquery_client)
 
     def test_run(self):
-        self.sut.run(self.args)
+        summary = self.sut.run(self.args)
 
         calls = [call(dataset='dataset_id', dst_project_id='dst_project_id', dst_table='table$20211010',
                       src_project_id='src_project_id', start_table='table$20211010'),
@@ -182,4 +802,589 @@ class TestBigQueryCopyPartitionsAction(unittest.TestCase):
                  call(dataset='dataset_id', dst_project_id='dst_project_id', dst_table='table$20211014',
                       src_project_id='src_project_id', start_table='table$20211014')]
 
-        self.bigquery_client.copy_table.assert_has_calls(calls)
+        self.assertEqual(calls, self.bigquery_client.submit_copy_table.call_args_list)
+        self.bigquery_client.copy_table.assert_not_called()
+        self.assertEqual(5, len(summary.succeeded))
+
+    def test_run_as_ndjson_reports_jobs(self):
+        self.args.output = "ndjson"
+        self.args.stdout = io.StringIO()
+        self.bigquery_client.submit_copy_table.return_value = Mock(
+            job_id="job_id",
+            _properties={"statistics": {"copy": {"copiedLogicalBytes": "512"}}},
+        )
+
+        self.sut.run(self.args)
+
+        records = [json.loads(line) for line in self.args.stdout.getvalue().splitlines()]
+        self.assertEqual(6, len(records))
+        self.assertEqual("job_id", records[0]["job_id"])
+        self.assertEqual(512, records[0]["bytes"])
+        self.assertIn("duration", records[0])
+        self.assertEqual("summary", records[-1]["type"])
+
+    def test_run_reports_failed_jobs(self):
+        failed_job = Mock(job_id="failed_job_id")
+        failed_job.done.return_value = True
+        failed_job.result.side_effect = RuntimeError("quota exceeded")
+        self.bigquery_client.submit_copy_table.side_effect = (
+            lambda **kwargs: failed_job if kwargs["start_table"] == "table$20211011" else Mock(job_id="job_id")
+        )
+
+        with self.assertRaises(PartitionsFailed) as failure:
+            self.sut.run(self.args)
+
+        [summary] = failure.exception.summaries
+        self.assertEqual(4, len(summary.succeeded))
+        self.assertEqual(["20211011"], [r.partition for r in summary.failed])
+        self.assertEqual("quota exceeded", summary.failed[0].error)
+
+    def test_run_with_bulk_strategy(self):
+        self.args.strategy = "bulk"
+        self.bigquery_client.get_partitioning.return_value = Partitioning(
+            "day", "DATE", "DAY"
+        )
+        self.bigquery_client.get_columns.return_value = ["id", "day"]
+        self.bigquery_client.submit_query.return_value = Mock(job_id="bulk_job")
+
+        summary = self.sut.run(self.args)
+
+        project_id, table_id, query = self.bigquery_client.submit_query.call_args.args
+        self.assertEqual("dst_project_id", project_id)
+        self.assertEqual("dst_project_id.dataset_id.table", table_id)
+        self.assertIn(
+            "INSERT INTO `dst_project_id.dataset_id.table` (`id`, `day`) "
+            "SELECT `id`, `day` FROM `src_project_id.dataset_id.table`",
+            query,
+        )
+        self.bigquery_client.submit_copy_table.assert_not_called()
+        self.assertEqual("bulk_job", summary.succeeded[0].job_id)
+        # the INSERT is built on the live schema, not a cached one
+        self.bigquery_client.get_columns.assert_called_once_with(
+            "src_project_id", "dataset_id", "table", use_cache=False
+        )
+
+    def test_run_with_auto_strategy_keeps_copy_jobs_for_ingestion_time_tables(self):
+        self.args.plan = True
+        partitions = {
+            date: PartitionMetadata(date, 1, 10)
+            for date in generate_range("20210101", "20210430")
+        }
+        partitions["__NULL__"] = PartitionMetadata("__NULL__", 1, 10)
+        self.bigquery_client.list_partitions.return_value = partitions
+        self.bigquery_client.get_partitioning.return_value = Partitioning(
+            None, "TIMESTAMP", "DAY"
+        )
+        self.args.start_date = "20210101"
+        self.args.end_date = "20210430"
+
+        self.sut.run(self.args)
+
+        self.bigquery_client.submit_query.assert_not_called()
+        self.assertEqual(120, self.bigquery_client.submit_copy_table.call_count)
+
+    def test_run_with_resume_skips_finished_partitions(self):
+        with open(self.args.journal, "w") as journal:
+            for partition in ("20211010", "20211011"):
+                journal.write(json.dumps({"partition": partition, "status": "succeeded"}) + "\n")
+        self.args.resume = True
+
+        summary = self.sut.run(self.args)
+
+        self.assertEqual(3, self.bigquery_client.submit_copy_table.call_count)
+        self.assertEqual(["20211010", "20211011"], summary.skipped)
+
+    def test_run_without_resume_starts_a_new_journal(self):
+        with open(self.args.journal, "w") as journal:
+            journal.write(json.dumps({"partition": "20211010", "status": "succeeded"}) + "\n")
+
+        self.sut.run(self.args)
+
+        self.assertEqual(5, self.bigquery_client.submit_copy_table.call_count)
+        with open(self.args.journal) as journal:
+            self.assertEqual(5, len(journal.readlines()))
+
+    def test_run_with_plan_skips_missing_partitions(self):
+        self.args.plan = True
+        self.bigquery_client.list_partitions.side_effect = lambda project, *_: {
+            "src_project_id": {
+                "20211001": PartitionMetadata("20211001", 10, 100),
+                "20211012": PartitionMetadata("20211012", 10, 100),
+            },
+            "dst_project_id": {},
+        }[project]
+
+        summary = self.sut.run(self.args)
+
+        self.bigquery_client.list_partitions.assert_any_call(
+            "src_project_id", "dataset_id", "table"
+        )
+        self.assertEqual(
+            [call(dataset='dataset_id', dst_project_id='dst_project_id', dst_table='table$20211012',
+                  src_project_id='src_project_id', start_table='table$20211012')],
+            self.bigquery_client.submit_copy_table.call_args_list,
+        )
+        self.assertEqual(4, len(summary.skipped))
+
+    def test_run_with_plan_clears_destination_partitions_missing_in_source(self):
+        self.args.plan = True
+        self.bigquery_client.list_partitions.side_effect = lambda project, *_: {
+            "src_project_id": {"20211012": PartitionMetadata("20211012", 10, 100)},
+            "dst_project_id": {
+                "20211010": PartitionMetadata("20211010", 10, 100),
+                "20211011": PartitionMetadata("20211011", 0, 0),
+            },
+        }[project]
+
+        summary = self.sut.run(self.args)
+
+        self.assertEqual(
+            ["table$20211010", "table$20211012"],
+            sorted(
+                copy.kwargs["start_table"]
+                for copy in self.bigquery_client.submit_copy_table.call_args_list
+            ),
+        )
+        self.assertEqual(3, len(summary.skipped))
+
+    def test_run_with_plan_submits_the_largest_partitions_first(self):
+        self.args.plan = True
+        self.bigquery_client.list_partitions.return_value = {
+            "20211009": PartitionMetadata("20211009", 10, 100),
+            "20211010": PartitionMetadata("20211010", 10, 100),
+            "20211012": PartitionMetadata("20211012", 10, 5000),
+            "20211013": PartitionMetadata("20211013", 10, 900),
+        }
+
+        self.sut.run(self.args)
+
+        self.assertEqual(
+            ["table$20211012", "table$20211013", "table$20211010"],
+            [
+                kwargs["start_table"]
+                for _, kwargs in self.bigquery_client.submit_copy_table.call_args_list
+            ],
+        )
+
+    def test_dry_run_as_ndjson_reports_each_destination(self):
+        self.args.plan = True
+        self.args.dry_run = True
+        self.args.dst_project_id = ["eu", "us"]
+        self.args.output = "ndjson"
+        self.args.stdout = io.StringIO()
+        self.bigquery_client.rate_limiter.table_rate = 10
+        self.bigquery_client.list_partitions.return_value = {
+            "20211009": PartitionMetadata("20211009", 10, 100),
+            "20211010": PartitionMetadata("20211010", 10, 100),
+            "20211012": PartitionMetadata("20211012", 20, 5000),
+        }
+
+        self.assertIsNone(self.sut.run(self.args))
+
+        self.bigquery_client.submit_copy_table.assert_not_called()
+        records = [json.loads(line) for line in self.args.stdout.getvalue().splitlines()]
+        self.assertEqual(
+            [("planned", "eu", "20211012", 5000), ("planned", "eu", "20211010", 100)],
+            [(r["type"], r["target"], r["partition"], r["bytes"]) for r in records[:2]],
+        )
+        summaries = [r for r in records if r["type"] == "dry_run"]
+        self.assertEqual(["eu", "us"], [r["target"] for r in summaries])
+        self.assertEqual([5100, 5100], [r["bytes"] for r in summaries])
+        self.assertGreater(summaries[0]["estimated_seconds"], 0)
+        self.assertEqual([], os.listdir(os.path.dirname(self.args.journal)))
+
+    def test_run_with_plan_copies_the_whole_table_when_equivalent(self):
+        self.args.plan = True
+        partitions = {
+            "20211011": PartitionMetadata("20211011", 10, 100),
+            "20211012": PartitionMetadata("20211012", 10, 100),
+        }
+        self.bigquery_client.list_partitions.return_value = partitions
+
+        self.sut.run(self.args)
+
+        self.bigquery_client.list_partitions.assert_has_calls(
+            [
+                call("src_project_id", "dataset_id", "table"),
+                call("dst_project_id", "dataset_id", "table"),
+            ]
+        )
+        self.assertEqual(
+            [call(dataset='dataset_id', dst_project_id='dst_project_id', dst_table='table',
+                  src_project_id='src_project_id', start_table='table')],
+            self.bigquery_client.submit_copy_table.call_args_list,
+        )
+
+    def test_run_incremental_copies_only_changed_partitions(self):
+        self.args.incremental = True
+        source = {
+            "20211011": PartitionMetadata("20211011", 10, 100, datetime.datetime(2021, 10, 12)),
+            "20211012": PartitionMetadata("20211012", 10, 100, datetime.datetime(2021, 10, 15)),
+        }
+        destination = {
+            "20211011": PartitionMetadata("20211011", 10, 100, datetime.datetime(2021, 10, 13)),
+            "20211012": PartitionMetadata("20211012", 10, 100, datetime.datetime(2021, 10, 13)),
+        }
+        self.bigquery_client.list_partitions.side_effect = (
+            lambda project_id, dataset, table: source
+            if project_id == "src_project_id"
+            else destination
+        )
+
+        summary = self.sut.run(self.args)
+
+        self.assertEqual(
+            [call(dataset='dataset_id', dst_project_id='dst_project_id', dst_table='table$20211012',
+                  src_project_id='src_project_id', start_table='table$20211012')],
+            self.bigquery_client.submit_copy_table.call_args_list,
+        )
+        self.assertEqual(["20211010", "20211011", "20211013", "20211014"], summary.skipped)
+
+    def test_run_fans_out_to_every_destination(self):
+        self.args.dst_project_id = ["eu_project", "us_project"]
+        self.args.journal = None
+        self.args.end_date = "20211011"
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+
+        with unittest.mock.patch.dict(os.environ, {"XDG_CACHE_HOME": journal_dir.name}):
+            result = self.sut.run(self.args)
+
+        self.assertEqual(
+            [
+                ("eu_project", "table$20211010"),
+                ("us_project", "table$20211010"),
+                ("eu_project", "table$20211011"),
+                ("us_project", "table$20211011"),
+            ],
+            [
+                (kwargs["dst_project_id"], kwargs["start_table"])
+                for _, kwargs in self.bigquery_client.submit_copy_table.call_args_list
+            ],
+        )
+        self.assertEqual(
+            "copy-partitions to eu_project: 2 succeeded, 0 failed\n"
+            "copy-partitions to us_project: 2 succeeded, 0 failed",
+            result,
+        )
+
+    def test_run_fans_out_with_one_journal_per_destination(self):
+        self.args.dst_project_id = ["eu_project", "us_project"]
+        root, _ = os.path.splitext(self.args.journal)
+
+        self.sut.run(self.args)
+
+        for destination in ("eu_project", "us_project"):
+            with open(f"{root}.{destination}.jsonl") as journal:
+                records = [json.loads(line) for line in journal]
+            self.assertEqual(5, len(records))
+            self.assertEqual({destination}, {record["target"] for record in records})
+
+    def test_run_fans_out_with_a_single_source_listing(self):
+        self.args.plan = True
+        self.args.dst_project_id = ["eu_project", "us_project"]
+        source = {"20211011": PartitionMetadata("20211011", 10, 100)}
+        self.bigquery_client.list_partitions.side_effect = (
+            lambda project_id, dataset, table: source if project_id == "src_project_id" else {}
+        )
+
+        self.sut.run(self.args)
+
+        self.assertCountEqual(
+            [
+                call("src_project_id", "dataset_id", "table"),
+                call("eu_project", "dataset_id", "table"),
+                call("us_project", "dataset_id", "table"),
+            ],
+            self.bigquery_client.list_partitions.call_args_list,
+        )
+        self.assertEqual(
+            [
+                call(src_project_id="src_project_id", dataset="dataset_id", start_table="table",
+                     dst_table="table", dst_project_id=destination)
+                for destination in ("eu_project", "us_project")
+            ],
+            self.bigquery_client.submit_copy_table.call_args_list,
+        )
+
+    def test_run_with_plan_copies_partitions_when_destination_has_more(self):
+        self.args.plan = True
+        source = {"20211011": PartitionMetadata("20211011", 10, 100)}
+        destination = {
+            "20211011": PartitionMetadata("20211011", 10, 100),
+            "20211001": PartitionMetadata("20211001", 10, 100),
+        }
+        self.bigquery_client.list_partitions.side_effect = [source, destination]
+
+        self.sut.run(self.args)
+
+        self.assertEqual(
+            [call(dataset='dataset_id', dst_project_id='dst_project_id', dst_table='table$20211011',
+                  src_project_id='src_project_id', start_table='table$20211011')],
+            self.bigquery_client.submit_copy_table.call_args_list,
+        )
+
+
+class TestMultiTablePartitionActions(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake = FakeGoogleClient()
+        for table in ("events_a", "events_b", "users"):
+            self.fake.add_table(f"src.dataset.{table}", generate_range("20200101", "20200104"))
+        self.fake.add_view("src.dataset.events_view", "SELECT * FROM `src.dataset.events_a`")
+        self.client = FakeBigQueryClient(
+            self.fake,
+            RateLimiter(table_rate=1e9, project_rate=1e9, sleep=lambda seconds: None),
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def args(self, *tables: str, **values) -> argparse.Namespace:
+        args = argparse.Namespace(
+            dataset_id="dataset",
+            table=list(tables),
+            start_date="20200102",
+            end_date="20200103",
+            granularity=None,
+            interval=1,
+            parallelism=4,
+            max_per_table=1,
+            plan=True,
+            incremental=False,
+            strategy="per-partition",
+            asyncio=False,
+            shard=None,
+            journal=os.path.join(self.directory, "journal.jsonl"),
+            resume=False,
+            dry_run=False,
+            output="text",
+            stdout=None,
+        )
+        for name, value in values.items():
+            setattr(args, name, value)
+        return args
+
+    def test_requested_tables_expands_globs_and_files(self):
+        tables_file = os.path.join(self.directory, "tables.txt")
+        with open(tables_file, "w") as tables:
+            tables.write("# retention\nusers\n\nevents_a\n")
+
+        self.assertEqual(
+            ["events_a", "events_b", "users"],
+            requested_tables(self.args("events_*", f"@{tables_file}"), "src", self.client),
+        )
+
+    def test_requested_tables_rejects_globs_matching_nothing(self):
+        with self.assertRaises(ValueError):
+            requested_tables(self.args("missing_*"), "src", self.client)
+
+    def test_delete_several_tables_in_one_report(self):
+        result = BigQueryDeletePartitionsAction(self.client).run(
+            self.args("events_*", "users", project_id="src")
+        )
+
+        self.assertEqual(
+            "delete-partitions to src.dataset.events_a: 2 succeeded, 0 failed\n"
+            "delete-partitions to src.dataset.events_b: 2 succeeded, 0 failed\n"
+            "delete-partitions to src.dataset.users: 2 succeeded, 0 failed",
+            result,
+        )
+        for table in ("events_a", "events_b", "users"):
+            self.assertEqual(
+                ["20200101", "20200104"],
+                sorted(self.fake.tables[f"src.dataset.{table}"].partitions),
+            )
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, "journal.src.dataset.users.jsonl"))
+        )
+
+    def test_copy_several_tables_to_several_destinations(self):
+        self.fake.failing_tables.add("us.dataset.users")
+
+        with self.assertRaises(PartitionsFailed) as failure:
+            BigQueryCopyPartitionsAction(self.client).run(
+                self.args(
+                    "events_a", "users", src_project_id="src", dst_project_id=["eu", "us"]
+                )
+            )
+
+        result = failure.exception.output
+
+        self.assertEqual(
+            "copy-partitions to eu.dataset.events_a: 2 succeeded, 0 failed\n"
+            "copy-partitions to us.dataset.events_a: 2 succeeded, 0 failed\n"
+            "copy-partitions to eu.dataset.users: 2 succeeded, 0 failed\n"
+            "copy-partitions to us.dataset.users: 0 succeeded, 2 failed",
+            result.split("\n  ")[0],
+        )
+        self.assertEqual(
+            ["20200102", "20200103"], sorted(self.fake.tables["eu.dataset.users"].partitions)
+        )
+
+    def test_auto_strategy_copies_partition_by_partition_to_a_missing_table(self):
+        dates = generate_range("20200101", "20200529")
+        # partitions left out of the range keep it from being a table copy
+        self.fake.add_table("src.dataset.events", generate_range("20200101", "20200601"))
+        args = self.args(
+            "events",
+            src_project_id="src",
+            dst_project_id=["dst"],
+            start_date=dates[0],
+            end_date=dates[-1],
+            strategy="auto",
+        )
+
+        summary = BigQueryCopyPartitionsAction(self.client).run(args)
+
+        self.assertEqual(150, len(summary.succeeded))
+        self.assertEqual(dates, sorted(self.fake.tables["dst.dataset.events"].partitions))
+
+        # once the table exists the same copy runs as a single query
+        self.fake.calls.clear()
+        BigQueryCopyPartitionsAction(self.client).run(args)
+        self.assertEqual(0, self.fake.calls["copy_table"])
+
+    def test_bulk_strategy_fails_on_a_missing_table(self):
+        dates = generate_range("20200101", "20200529")
+        self.fake.add_table("src.dataset.events", generate_range("20200101", "20200601"))
+
+        with self.assertRaises(PartitionsFailed) as failure:
+            BigQueryCopyPartitionsAction(self.client).run(
+                self.args(
+                    "events",
+                    src_project_id="src",
+                    dst_project_id=["dst"],
+                    start_date=dates[0],
+                    end_date=dates[-1],
+                    strategy="bulk",
+                )
+            )
+
+        self.assertIn("Not found: Table dst.dataset.events", failure.exception.output)
+
+
+class TestBigQueryVerifyPartitionsAction(unittest.TestCase):
+    def setUp(self) -> None:
+        args = Mock()
+        args.src_project_id = "src"
+        args.dst_project_id = ["eu", "us"]
+        args.dataset_id = "dataset"
+        args.table = "table"
+        args.start_date = "20200101"
+        args.end_date = "20200105"
+        args.granularity = None
+        args.interval = 1
+        args.parallelism = 2
+        args.recopy = False
+        args.output = "text"
+
+        self.args = args
+        self.fake = FakeGoogleClient()
+        partitions = generate_range("20200101", "20200105")
+        self.fake.add_table("src.dataset.table", partitions)
+        self.fake.add_table("eu.dataset.table", partitions)
+        self.fake.add_table("us.dataset.table", partitions[:3], rows_per_partition=999)
+        self.fake.tables["us.dataset.table"].partitions["20200104"] = PartitionMetadata(
+            "20200104", 1000, 1
+        )
+        self.sut = BigQueryVerifyPartitionsAction(
+            FakeBigQueryClient(
+                self.fake,
+                RateLimiter(table_rate=1e9, project_rate=1e9, sleep=lambda seconds: None),
+            )
+        )
+
+    def test_run(self):
+        with self.assertRaises(PartitionsFailed) as failure:
+            self.sut.run(self.args)
+
+        self.assertEqual(
+            "verify-partitions to eu: 5 partitions match, 0 mismatched\n"
+            "verify-partitions to us: 0 partitions match, 5 mismatched\n"
+            "  20200101: row count differs, 1000 != 999\n"
+            "  20200102: row count differs, 1000 != 999\n"
+            "  20200103: row count differs, 1000 != 999\n"
+            "  20200104: content differs\n"
+            "  20200105: missing in destination",
+            failure.exception.output,
+        )
+        self.assertEqual(
+            [("us", 5)],
+            [(summary.target, len(summary.failed)) for summary in failure.exception.summaries],
+        )
+        self.assertEqual(3, self.fake.calls["query"])
+
+    def test_run_when_every_partition_matches(self):
+        self.args.dst_project_id = ["eu"]
+
+        self.assertEqual(
+            "verify-partitions to eu: 5 partitions match, 0 mismatched",
+            self.sut.run(self.args),
+        )
+
+    def test_run_with_recopy_fails_on_partitions_missing_in_source(self):
+        self.args.recopy = True
+        self.fake.tables["eu.dataset.table"].partitions["20200106"] = PartitionMetadata(
+            "20200106", 1000, 1
+        )
+        self.args.end_date = "20200106"
+
+        with self.assertRaises(PartitionsFailed) as failure:
+            self.sut.run(self.args)
+
+        self.assertEqual(
+            [("eu", 0), ("us", 0), ("eu", 1)],
+            [(summary.target, len(summary.failed)) for summary in failure.exception.summaries],
+        )
+        self.assertEqual("missing in source", failure.exception.summaries[-1].failed[0].error)
+
+    def test_run_with_recopy(self):
+        self.args.recopy = True
+
+        result = self.sut.run(self.args)
+
+        self.assertTrue(result.endswith("recopy-partitions to us: 5 succeeded, 0 failed"))
+        self.assertEqual(
+            [],
+            [line for line in self.sut.run(self.args).splitlines() if "differs" in line],
+        )
+
+    def test_run_with_recopy_fails_when_a_copy_fails(self):
+        self.args.recopy = True
+        self.sut.bigquery_client.submit_copy_table = Mock(
+            side_effect=RuntimeError("quota exceeded")
+        )
+
+        with self.assertRaises(PartitionsFailed) as failure:
+            self.sut.run(self.args)
+
+        self.assertTrue(
+            failure.exception.output.startswith("verify-partitions to eu: 5 partitions match")
+        )
+        self.assertEqual(
+            [("eu", 0), ("us", 5)],
+            [(summary.target, len(summary.failed)) for summary in failure.exception.summaries],
+        )
+
+    def test_run_with_ndjson_output(self):
+        self.args.output = "ndjson"
+        self.args.stdout = io.StringIO()
+
+        with self.assertRaises(PartitionsFailed) as failure:
+            self.sut.run(self.args)
+
+        self.assertIsNone(failure.exception.output)
+        records = [json.loads(line) for line in self.args.stdout.getvalue().splitlines()]
+        self.assertEqual(
+            {"type": "mismatch", "target": "us", "partition": "20200105",
+             "reason": "missing in destination", "source_rows": 1000, "destination_rows": None},
+            records[5],
+        )
+        self.assertEqual(
+            [("eu", 5, 0), ("us", 0, 5)],
+            [
+                (record["target"], record["matched"], record["mismatched"])
+                for record in records
+                if record["type"] == "summary"
+            ],
+        )
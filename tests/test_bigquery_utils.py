@@ -1,11 +1,21 @@
+import datetime
 import unittest
-from unittest.mock import patch, ANY
+from unittest.mock import patch, ANY, Mock
 
+from google.api_core.exceptions import ServiceUnavailable, TooManyRequests
+
+from source import bigquery_utils
+from source.instrumentation import Instrumentation, MetricsCollector, set_instrumentation
+from source.rate_limiter import RateLimiter
 from source.bigquery_utils import (
+    analyze_view_query,
     extract_production_table_color,
     extract_table_from_query_name_only,
     extract_table_from_query,
     BigQueryClient,
+    PartitionMetadata,
+    Partitioning,
+    job_bytes,
 )
 
 
@@ -14,7 +24,7 @@ class TestBigQueryUtils(unittest.TestCase):
         query = "SELECT date(utcInstant) as utcDate, * FROM `jobrapido-sandbox.core_versions.enriched_revenues_green`"
         self.assertEqual("green", extract_production_table_color(query))
 
-    def test_extract_query_info_should_throw_exception_for_too_much_tables(self):
+    def test_extract_query_info_ignores_tables_without_color(self):
         query = """SELECT
                       jr.*
                     FROM
@@ -25,8 +35,14 @@ class TestBigQueryUtils(unittest.TestCase):
                       jr.jobRevenueUuid =jr1.jobRevenueUuid
                     """
 
+        self.assertEqual("green", extract_production_table_color(query))
+
+    def test_extract_table_from_query_with_several_colored_tables(self):
+        query = "SELECT * FROM `p.d.a_blue` JOIN `p.d.b_blue` USING (id)"
+
+        self.assertEqual("blue", extract_production_table_color(query))
         with self.assertRaises(ValueError):
-            extract_production_table_color(query)
+            extract_table_from_query(query)
 
     def test_extract_color_with_none_query(self):
         with self.assertRaises(ValueError):
@@ -44,8 +60,78 @@ class TestBigQueryUtils(unittest.TestCase):
         self.assertEqual("campaign_registry_blue", actual)
 
 
+class TestViewQueryAnalysis(unittest.TestCase):
+    def setUp(self) -> None:
+        bigquery_utils._analysis_cache.clear()
+
+    def test_analyze_view_query(self):
+        query = "SELECT date(utcInstant) as utcDate, * FROM `jobrapido-sandbox.core_versions.enriched_revenues_green`"
+
+        analysis = analyze_view_query(query)
+        [reference] = analysis.references
+
+        self.assertEqual(
+            "jobrapido-sandbox.core_versions.enriched_revenues_green", reference.table
+        )
+        self.assertEqual("enriched_revenues_green", reference.table_name_only)
+        self.assertEqual("green", analysis.color)
+        self.assertEqual(
+            "enriched_revenues_blue", reference.non_production_table_name_only
+        )
+        self.assertEqual(
+            "SELECT date(utcInstant) as utcDate, * FROM `jobrapido-sandbox.core_versions.enriched_revenues_blue`",
+            analysis.switched_query,
+        )
+
+    def test_views_joining_tables_of_both_colors_are_mixed(self):
+        query = "SELECT * FROM `p.d.a_blue` JOIN `p.d.b_green` USING (id)"
+
+        analysis = analyze_view_query(query)
+
+        self.assertEqual("mixed", analysis.color)
+        self.assertEqual(
+            "SELECT * FROM `p.d.a_green` JOIN `p.d.b_blue` USING (id)", analysis.switched_query
+        )
+
+    def test_views_without_colored_tables_are_rejected(self):
+        with self.assertRaises(ValueError):
+            analyze_view_query("SELECT * FROM `project.dataset.table`")
+
+    @patch(
+        "source.bigquery_utils.rewrite_view_query", wraps=bigquery_utils.rewrite_view_query
+    )
+    def test_analysis_is_memoized(self, mocked_rewrite):
+        query = "SELECT * FROM `project.dataset.table_green` WHERE a = 1"
+
+        first = analyze_view_query(query)
+        second = analyze_view_query(query)
+
+        self.assertIs(first, second)
+        self.assertEqual("green", extract_production_table_color(query))
+        self.assertEqual("project.dataset.table_green", extract_table_from_query(query))
+        mocked_rewrite.assert_called_once_with(query)
+
+    def test_cache_is_bounded(self):
+        for i in range(bigquery_utils.ANALYSIS_CACHE_SIZE + 10):
+            analyze_view_query(f"SELECT {i} FROM `project.dataset.table_green`")
+
+        self.assertEqual(
+            bigquery_utils.ANALYSIS_CACHE_SIZE, len(bigquery_utils._analysis_cache)
+        )
+
+
 class TestBigQueryClient(unittest.TestCase):
-    @patch("source.bigquery_utils.bigquery.Client")
+    @patch("google.cloud.bigquery.Client")
+    def test_google_client_is_created_lazily_once(self, mocked_client):
+        sut = BigQueryClient()
+        mocked_client.assert_not_called()
+
+        sut.delete_table("project", "dataset", "table")
+        sut.delete_table("project", "dataset", "other_table")
+
+        mocked_client.assert_called_once_with()
+
+    @patch("google.cloud.bigquery.Client")
     def test_copy_table(self, mocked_client):
         sut = BigQueryClient()
         sut.copy_table(
@@ -60,7 +146,7 @@ class TestBigQueryClient(unittest.TestCase):
             "src_project.dataset.start_table", "dst_project.dataset.dst_table", job_config=ANY
         )
 
-    @patch("source.bigquery_utils.bigquery.Client")
+    @patch("google.cloud.bigquery.Client")
     def test_copy_table_with_same_project(self, mocked_client):
         sut = BigQueryClient()
         sut.copy_table(
@@ -73,3 +159,286 @@ class TestBigQueryClient(unittest.TestCase):
         mocked_client().copy_table.assert_called_with(
             "src_project.dataset.start_table", "src_project.dataset.dst_table", job_config=ANY
         )
+
+    @patch("google.cloud.bigquery.Client")
+    def test_copy_table_waits_for_the_job(self, mocked_client):
+        sut = BigQueryClient()
+        sut.copy_table("src_project", "dataset", "start_table", "dst_table")
+
+        mocked_client().copy_table().result.assert_called_once_with()
+
+    @patch("google.cloud.bigquery.Client")
+    def test_submit_copy_table_does_not_wait_for_the_job(self, mocked_client):
+        sut = BigQueryClient()
+        job = sut.submit_copy_table("src_project", "dataset", "start_table", "dst_table")
+
+        self.assertEqual(mocked_client().copy_table(), job)
+        job.result.assert_not_called()
+
+    @patch("google.cloud.bigquery.Client")
+    def test_rebuild_with_copy_truncates_the_table(self, mocked_client):
+        mocked_client().get_table.return_value = Mock(table_type="TABLE")
+
+        BigQueryClient().rebuild_table("project", "dataset", "table_blue", "table_green")
+
+        mocked_client().delete_table.assert_not_called()
+        mocked_client().copy_table.assert_called_with(
+            "project.dataset.table_blue", "project.dataset.table_green", job_config=ANY
+        )
+
+    @patch("google.cloud.bigquery.Client")
+    def test_rebuild_with_copy_replaces_a_snapshot(self, mocked_client):
+        mocked_client().get_table.return_value = Mock(table_type="SNAPSHOT")
+
+        BigQueryClient().rebuild_table("project", "dataset", "table_blue", "table_green")
+
+        mocked_client().delete_table.assert_called_once_with(
+            "project.dataset.table_green", not_found_ok=True
+        )
+        mocked_client().copy_table.assert_called_with(
+            "project.dataset.table_blue", "project.dataset.table_green", job_config=ANY
+        )
+
+    @patch("google.cloud.bigquery.Client")
+    def test_list_views(self, mocked_client):
+        view = Mock(table_id="a_view", table_type="VIEW")
+        table = Mock(table_id="a_table", table_type="TABLE")
+        mocked_client().list_tables.return_value = [view, table]
+
+        sut = BigQueryClient()
+
+        self.assertEqual(["a_view"], sut.list_views("project", "dataset"))
+        mocked_client().list_tables.assert_called_with("project.dataset")
+
+    @patch("google.cloud.bigquery.Client")
+    def test_list_tables(self, mocked_client):
+        view = Mock(table_id="a_view", table_type="VIEW")
+        table = Mock(table_id="a_table", table_type="TABLE")
+        mocked_client().list_tables.return_value = [view, table]
+
+        sut = BigQueryClient()
+
+        self.assertEqual(["a_table"], sut.list_tables("project", "dataset"))
+        mocked_client().list_tables.assert_called_with("project.dataset")
+
+    @patch("google.cloud.bigquery.Client")
+    def test_rebuild_table_with_copy_does_not_delete(self, mocked_client):
+        sut = BigQueryClient()
+        sut.rebuild_table("project", "dataset", "table_green", "table_blue", "copy")
+
+        mocked_client().delete_table.assert_not_called()
+        mocked_client().copy_table.assert_called_with(
+            "project.dataset.table_green", "project.dataset.table_blue", job_config=ANY
+        )
+        job_config = mocked_client().copy_table.call_args.kwargs["job_config"]
+        self.assertEqual("WRITE_TRUNCATE", job_config.write_disposition)
+        mocked_client().copy_table().result.assert_called_once_with()
+
+    @patch("google.cloud.bigquery.Client")
+    def test_rebuild_table_with_clone(self, mocked_client):
+        sut = BigQueryClient()
+        sut.rebuild_table("project", "dataset", "table_green", "table_blue", "clone")
+
+        mocked_client().delete_table.assert_called_once_with(
+            "project.dataset.table_blue", not_found_ok=True
+        )
+        job_config = mocked_client().copy_table.call_args.kwargs["job_config"]
+        self.assertEqual("CLONE", job_config.operation_type)
+        self.assertEqual("WRITE_EMPTY", job_config.write_disposition)
+        mocked_client().copy_table().result.assert_called_once_with()
+
+    @patch("google.cloud.bigquery.Client")
+    def test_rebuild_table_with_snapshot(self, mocked_client):
+        sut = BigQueryClient()
+        sut.rebuild_table("project", "dataset", "table_green", "table_blue", "snapshot")
+
+        job_config = mocked_client().copy_table.call_args.kwargs["job_config"]
+        self.assertEqual("SNAPSHOT", job_config.operation_type)
+
+    def test_rebuild_table_with_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            BigQueryClient().rebuild_table("p", "d", "a", "b", "move")
+
+    @patch("google.cloud.bigquery.Client")
+    def test_truncate_table(self, mocked_client):
+        mocked_client().get_dataset.return_value = Mock(location="EU")
+
+        BigQueryClient().truncate_table("project", "dataset", "table")
+
+        mocked_client().query.assert_called_once_with(
+            "TRUNCATE TABLE `project.dataset.table`", project="project", location="EU"
+        )
+        mocked_client().query().result.assert_called_once_with()
+
+    @patch("google.cloud.bigquery.Client")
+    def test_list_partitions(self, mocked_client):
+        modified = datetime.datetime(2021, 10, 10, tzinfo=datetime.timezone.utc)
+        mocked_client().query().result.return_value = [
+            Mock(partition_id="20211010", total_rows=3, total_logical_bytes=30, last_modified_time=modified),
+            Mock(partition_id="20211011", total_rows=None, total_logical_bytes=None, last_modified_time=None),
+            Mock(partition_id=None, total_rows=5, total_logical_bytes=50, last_modified_time=None),
+        ]
+
+        partitions = BigQueryClient().list_partitions("project", "dataset", "table")
+
+        self.assertEqual(
+            {
+                "20211010": PartitionMetadata("20211010", 3, 30, modified),
+                "20211011": PartitionMetadata("20211011", 0, 0, None),
+            },
+            partitions,
+        )
+        query = mocked_client().query.call_args.args[0]
+        self.assertIn("`project.dataset.INFORMATION_SCHEMA.PARTITIONS`", query)
+        job_config = mocked_client().query.call_args.kwargs["job_config"]
+        self.assertEqual("table", job_config.query_parameters[0].value)
+        self.assertEqual("project", mocked_client().query.call_args.kwargs["project"])
+        mocked_client().get_dataset.assert_called_once_with("project.dataset")
+
+    @patch("google.cloud.bigquery.Client")
+    def test_calls_are_retried_when_throttled(self, mocked_client):
+        mocked_client().delete_table.side_effect = [TooManyRequests("slow down"), None]
+        sleeps = []
+
+        sut = BigQueryClient(RateLimiter(sleep=sleeps.append))
+        sut.delete_table("project", "dataset", "table$20211010")
+
+        self.assertEqual(2, mocked_client().delete_table.call_count)
+        self.assertEqual(1, len(sleeps))
+
+    @patch("google.cloud.bigquery.Client")
+    def test_jobs_are_submitted_again_only_when_rejected(self, mocked_client):
+        mocked_client().copy_table.side_effect = [TooManyRequests("slow down"), Mock()]
+        sut = BigQueryClient(RateLimiter(sleep=lambda seconds: None))
+
+        sut.submit_copy_table("src_project", "dataset", "start_table", "dst_table")
+        self.assertEqual(2, mocked_client().copy_table.call_count)
+
+        # the job may have been created before the server error
+        mocked_client().query.side_effect = ServiceUnavailable("backend error")
+        with self.assertRaises(ServiceUnavailable):
+            sut.submit_query("project", "project.dataset.table", "INSERT INTO t SELECT 1")
+        self.assertEqual(1, mocked_client().query.call_count)
+
+    @patch("google.cloud.bigquery.Client")
+    def test_get_partitioning(self, mocked_client):
+        from google.cloud.bigquery import SchemaField, Table, TimePartitioning
+
+        table = Table(
+            "project.dataset.table",
+            schema=[SchemaField("id", "STRING"), SchemaField("day", "DATE")],
+        )
+        table.time_partitioning = TimePartitioning(field="day")
+        mocked_client().get_table.return_value = table
+
+        self.assertEqual(
+            Partitioning("day", "DATE", "DAY"),
+            BigQueryClient().get_partitioning("project", "dataset", "table"),
+        )
+
+    @patch("google.cloud.bigquery.Client")
+    def test_get_columns(self, mocked_client):
+        from google.cloud.bigquery import SchemaField, Table
+
+        mocked_client().get_table.return_value = Table(
+            "project.dataset.table",
+            schema=[SchemaField("id", "STRING"), SchemaField("day", "DATE")],
+        )
+
+        self.assertEqual(
+            ["id", "day"], BigQueryClient().get_columns("project", "dataset", "table")
+        )
+
+    @patch("google.cloud.bigquery.Client")
+    def test_get_partitioning_on_ingestion_time(self, mocked_client):
+        from google.cloud.bigquery import Table, TimePartitioning
+
+        table = Table("project.dataset.table")
+        table.time_partitioning = TimePartitioning(type_="HOUR")
+        mocked_client().get_table.return_value = table
+
+        self.assertEqual(
+            Partitioning(None, "TIMESTAMP", "HOUR"),
+            BigQueryClient().get_partitioning("project", "dataset", "table"),
+        )
+
+    @patch("google.cloud.bigquery.Client")
+    def test_get_partitioning_of_an_unpartitioned_table(self, mocked_client):
+        from google.cloud.bigquery import Table
+
+        mocked_client().get_table.return_value = Table("project.dataset.table")
+
+        with self.assertRaises(ValueError):
+            BigQueryClient().get_partitioning("project", "dataset", "table")
+
+    @patch("google.cloud.bigquery.Client")
+    def test_run_query(self, mocked_client):
+        mocked_client().get_dataset.return_value = Mock(location="EU")
+
+        BigQueryClient().run_query("project", "project.dataset.table", "DELETE ...")
+
+        mocked_client().query.assert_called_with("DELETE ...", project="project", location="EU")
+        mocked_client().query().result.assert_called_once_with()
+
+    @patch("google.cloud.bigquery.Client")
+    def test_dataset_location_is_looked_up_once(self, mocked_client):
+        mocked_client().get_dataset.return_value = Mock(location="EU")
+        sut = BigQueryClient()
+
+        sut.submit_query("project", "project.dataset.table$20200101", "DELETE ...")
+        sut.query_rows("project", "project.dataset.other", "SELECT 1")
+
+        mocked_client().get_dataset.assert_called_once_with("project.dataset")
+        mocked_client().query.assert_called_with("SELECT 1", project="project", location="EU")
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self) -> None:
+        self.metrics = MetricsCollector()
+        set_instrumentation(self.metrics)
+
+    def tearDown(self) -> None:
+        set_instrumentation(Instrumentation())
+
+    @patch("google.cloud.bigquery.Client")
+    def test_calls_are_recorded(self, mocked_client):
+        mocked_client().query.return_value = Mock(job_id="job_1")
+
+        BigQueryClient().submit_query("project", "project.dataset.table", "SELECT 1")
+
+        [record] = [call for call in self.metrics.calls if call.method == "submit_query"]
+        self.assertEqual("project.dataset.table", record.target)
+        self.assertEqual("job_1", record.job_id)
+        self.assertIsNone(record.error)
+
+    @patch("google.cloud.bigquery.Client")
+    def test_failed_calls_are_recorded(self, mocked_client):
+        mocked_client().delete_table.side_effect = ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            BigQueryClient().delete_table("project", "dataset", "table$20200101")
+
+        [record] = self.metrics.calls
+        self.assertEqual("delete_table", record.method)
+        self.assertEqual("boom", record.error)
+
+    @patch("google.cloud.bigquery.Client")
+    def test_copy_table_records_copied_bytes(self, mocked_client):
+        mocked_client().copy_table.return_value = Mock(
+            job_id="job_1",
+            _properties={"statistics": {"copy": {"copiedLogicalBytes": "2048"}}},
+        )
+
+        BigQueryClient().copy_table("src_project", "dataset", "start_table", "dst_table")
+
+        self.assertEqual(
+            ["submit_copy_table", "job"],
+            [record.method for record in self.metrics.calls],
+        )
+        self.assertEqual(2048, self.metrics.calls[-1].bytes)
+
+    def test_job_bytes_of_a_query(self):
+        job = Mock(_properties={"statistics": {"query": {"totalBytesProcessed": "10"}}})
+
+        self.assertEqual(10, job_bytes(job))
+        self.assertIsNone(job_bytes(Mock()))
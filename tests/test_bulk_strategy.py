@@ -0,0 +1,134 @@
+import datetime
+import unittest
+
+from source.bigquery_utils import PartitionMetadata, Partitioning
+from source.bulk_strategy import (
+    BULK,
+    BULK_COPY_MAX_BYTES,
+    BULK_MIN_PARTITIONS,
+    PER_PARTITION,
+    bulk_copy_query,
+    bulk_delete_query,
+    choose_strategy,
+    contiguous_ranges,
+    partition_bounds,
+)
+from source.partition_planner import PartitionPlan
+
+
+def plan_with(count: int, partition_bytes: int = 0) -> PartitionPlan:
+    partitions = [f"p{i}" for i in range(count)]
+    return PartitionPlan(
+        partitions,
+        metadata={p: PartitionMetadata(p, 1, partition_bytes) for p in partitions},
+    )
+
+
+class TestChooseStrategy(unittest.TestCase):
+    def test_explicit_strategy_wins(self):
+        self.assertEqual(BULK, choose_strategy(BULK, plan_with(1)))
+        self.assertEqual(PER_PARTITION, choose_strategy(PER_PARTITION, plan_with(5000)))
+
+    def test_few_partitions_are_processed_one_by_one(self):
+        self.assertEqual(
+            PER_PARTITION, choose_strategy("auto", plan_with(BULK_MIN_PARTITIONS - 1))
+        )
+
+    def test_bulk_copies_are_limited_by_size(self):
+        small = BULK_COPY_MAX_BYTES // (2 * BULK_MIN_PARTITIONS)
+        large = BULK_COPY_MAX_BYTES // BULK_MIN_PARTITIONS + 1
+
+        self.assertEqual(BULK, choose_strategy("auto", plan_with(BULK_MIN_PARTITIONS, small)))
+        self.assertEqual(
+            PER_PARTITION, choose_strategy("auto", plan_with(BULK_MIN_PARTITIONS, large))
+        )
+
+    def test_copies_without_sizes_are_processed_one_by_one(self):
+        plan = PartitionPlan([f"p{i}" for i in range(BULK_MIN_PARTITIONS)])
+
+        self.assertEqual(PER_PARTITION, choose_strategy("auto", plan))
+
+
+class TestRanges(unittest.TestCase):
+    def test_partition_bounds(self):
+        self.assertEqual(
+            (datetime.datetime(2021, 10, 10, 23), datetime.datetime(2021, 10, 11)),
+            partition_bounds("2021101023"),
+        )
+        self.assertEqual(
+            (datetime.datetime(2021, 12, 31), datetime.datetime(2022, 1, 1)),
+            partition_bounds("20211231"),
+        )
+        self.assertEqual(
+            (datetime.datetime(2021, 12, 1), datetime.datetime(2022, 1, 1)),
+            partition_bounds("202112"),
+        )
+        self.assertEqual(
+            (datetime.datetime(2021, 1, 1), datetime.datetime(2022, 1, 1)),
+            partition_bounds("2021"),
+        )
+        with self.assertRaises(ValueError):
+            partition_bounds("__NULL__")
+
+    def test_contiguous_ranges(self):
+        self.assertEqual(
+            [
+                (datetime.datetime(2021, 10, 10), datetime.datetime(2021, 10, 12)),
+                (datetime.datetime(2021, 10, 14), datetime.datetime(2021, 10, 15)),
+            ],
+            contiguous_ranges(["20211011", "20211010", "20211014"]),
+        )
+
+
+class TestQueries(unittest.TestCase):
+    def test_bulk_delete_query_on_date_column(self):
+        self.assertEqual(
+            "DELETE FROM `p.d.t` WHERE "
+            "(`day` >= DATE '2021-10-10' AND `day` < DATE '2021-10-12') OR "
+            "(`day` >= DATE '2021-10-14' AND `day` < DATE '2021-10-15')",
+            bulk_delete_query(
+                "p.d.t",
+                Partitioning("day", "DATE", "DAY"),
+                ["20211010", "20211011", "20211014"],
+            ),
+        )
+
+    def test_bulk_delete_query_on_ingestion_time(self):
+        self.assertEqual(
+            "DELETE FROM `p.d.t` WHERE "
+            "(_PARTITIONTIME >= TIMESTAMP '2021-10-10 00:00:00' "
+            "AND _PARTITIONTIME < TIMESTAMP '2021-10-11 00:00:00')",
+            bulk_delete_query(
+                "p.d.t", Partitioning(None, "TIMESTAMP", "DAY"), ["20211010"]
+            ),
+        )
+
+    def test_bulk_copy_query(self):
+        condition = (
+            "(`created` >= DATETIME '2021-10-10 00:00:00' "
+            "AND `created` < DATETIME '2021-10-11 00:00:00')"
+        )
+        self.assertEqual(
+            "BEGIN TRANSACTION;\n"
+            f"DELETE FROM `dst.d.t` WHERE {condition};\n"
+            "INSERT INTO `dst.d.t` (`id`, `created`) "
+            f"SELECT `id`, `created` FROM `src.d.t` WHERE {condition};\n"
+            "COMMIT TRANSACTION;",
+            bulk_copy_query(
+                "src.d.t",
+                "dst.d.t",
+                Partitioning("created", "DATETIME", "DAY"),
+                ["20211010"],
+                ["id", "created"],
+            ),
+        )
+
+    def test_bulk_copy_query_needs_a_column(self):
+        with self.assertRaises(ValueError):
+            bulk_copy_query(
+                "src.d.t",
+                "dst.d.t",
+                Partitioning(None, "TIMESTAMP", "DAY"),
+                ["20211010"],
+                ["id"],
+            )
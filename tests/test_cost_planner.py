@@ -0,0 +1,123 @@
+import unittest
+
+from source.bigquery_utils import PartitionMetadata
+from source.cost_planner import (
+    API_CALL_SECONDS,
+    COPY,
+    DELETE,
+    JOB_OVERHEAD_SECONDS,
+    TRUNCATE,
+    DryRun,
+    PlannedOperation,
+    estimate_seconds,
+    format_duration,
+    planned_operations,
+)
+
+GIB = 1024 ** 3
+
+
+class TestPlannedOperations(unittest.TestCase):
+    def test_partition_sizes_come_from_the_metadata(self):
+        metadata = {"20211010": PartitionMetadata("20211010", 10, 100)}
+
+        operations = planned_operations(["20211010", "20211011"], COPY, metadata, target="eu")
+
+        self.assertEqual(
+            [
+                PlannedOperation("20211010", COPY, 10, 100, "eu"),
+                PlannedOperation("20211011", COPY, None, None, "eu"),
+            ],
+            operations,
+        )
+
+    def test_whole_table_operation_sums_the_covered_partitions(self):
+        metadata = {
+            "20211010": PartitionMetadata("20211010", 10, 100),
+            "20211011": PartitionMetadata("20211011", 5, 50),
+        }
+
+        operations = planned_operations(["*"], TRUNCATE, metadata, ["20211010", "20211011"])
+
+        self.assertEqual([PlannedOperation("*", TRUNCATE, 15, 150)], operations)
+
+
+class TestEstimateSeconds(unittest.TestCase):
+    def test_jobs_are_spread_largest_first_over_the_workers(self):
+        operations = [
+            PlannedOperation(str(index), COPY, bytes=size * GIB, target=str(index))
+            for index, size in enumerate([8, 4, 4])
+        ]
+
+        seconds = estimate_seconds(operations, parallelism=2, calls_per_second=100)
+
+        self.assertAlmostEqual(2 * JOB_OVERHEAD_SECONDS + 8, seconds)
+
+    def test_calls_on_one_table_are_bound_by_its_rate(self):
+        operations = [PlannedOperation(str(index), DELETE) for index in range(100)]
+
+        seconds = estimate_seconds(operations, parallelism=100, calls_per_second=10)
+
+        self.assertEqual(10, seconds)
+        self.assertLess(API_CALL_SECONDS, seconds)
+
+    def test_nothing_to_do(self):
+        self.assertEqual(0, estimate_seconds([], parallelism=4, calls_per_second=10))
+
+    def test_format_duration(self):
+        self.assertEqual("42s", format_duration(42.2))
+        self.assertEqual("2m05s", format_duration(125))
+        self.assertEqual("3h07m", format_duration(3 * 3600 + 7 * 60 + 30))
+
+
+class TestDryRun(unittest.TestCase):
+    def test_str(self):
+        report = DryRun(
+            "copy-partitions",
+            [
+                PlannedOperation("20211011", COPY, 1200, 3 * GIB, "eu"),
+                PlannedOperation("20211010", COPY, 10, 512, "eu"),
+            ],
+            ["20211012"],
+            "eu",
+        )
+
+        self.assertEqual(
+            "copy-partitions to eu (dry run): 2 copy, 3.0 GiB, 1,210 rows, 1 skipped\n"
+            "  20211011     copy            3.0 GiB     1,200 rows\n"
+            "  20211010     copy              512 B        10 rows",
+            str(report),
+        )
+
+    def test_unknown_sizes(self):
+        report = DryRun("copy-partitions", [PlannedOperation("20211011", COPY)])
+
+        self.assertIsNone(report.bytes)
+        self.assertIsNone(report.to_record()["rows"])
+        self.assertEqual(
+            "copy-partitions (dry run): 1 copy, ? bytes, ? rows\n"
+            "  20211011     copy            ? bytes         ? rows",
+            str(report),
+        )
+
+    def test_nothing_to_do_moves_nothing(self):
+        self.assertEqual(
+            "delete-partitions (dry run): nothing to do, 0 B, 0 rows",
+            str(DryRun("delete-partitions")),
+        )
+
+    def test_to_record(self):
+        report = DryRun("delete-partitions", [PlannedOperation("*", TRUNCATE, 15, 150)])
+
+        self.assertEqual(
+            {
+                "type": "dry_run",
+                "operation": "delete-partitions",
+                "target": None,
+                "operations": 1,
+                "bytes": 150,
+                "rows": 15,
+                "skipped": 0,
+            },
+            report.to_record(),
+        )
@@ -0,0 +1,192 @@
+import io
+import os
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+from benchmarks.fake_bigquery import FakeBigQueryClient, FakeGoogleClient
+from source.arg_parser import ArgumentParser
+from source.bigquery_actions import BigQueryCopyPartitionsAction
+from source.daemon import (
+    BigQueryServeAction,
+    CommandServer,
+    default_socket_path,
+    forward,
+    prepare_socket_path,
+)
+from source.rate_limiter import RateLimiter
+
+DISPLAY_ARGV = ["display", "--project-id=p", "--dataset-id=d", "--view=v"]
+
+
+class TestCommandServer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "bigquery_utils.sock")
+        self.display_mock = Mock()
+        self.display_mock.run.return_value = "blue"
+        self.after_command = Mock()
+        self.parser = ArgumentParser(
+            switch_action=Mock(),
+            display_action=self.display_mock,
+            delete_partitions_action=Mock(),
+            copy_partitions=Mock(),
+            serve_action=BigQueryServeAction(Mock()),
+        )
+        self.server = CommandServer(self.path, self.parser, self.after_command)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.01}
+        )
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.directory.cleanup()
+
+    def test_forwarded_command_runs_on_the_server(self):
+        self.assertEqual((0, "blue"), forward(self.path, DISPLAY_ARGV))
+
+        [(args,), _] = self.display_mock.run.call_args
+        self.assertEqual("v", args.view)
+        self.after_command.assert_called_once_with()
+
+    def test_socket_is_only_accessible_to_its_owner(self):
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(self.path).st_mode))
+
+    def test_relative_paths_are_resolved_in_the_client_directory(self):
+        switch_mock = self.parser.switch_action
+        switch_mock.run.return_value = "switched"
+
+        forward(
+            self.path,
+            ["switch-color", "--project-id=p", "--dataset-id=d", "--manifest=views.yaml"],
+            cwd="/work",
+        )
+
+        [(args,), _] = switch_mock.run.call_args
+        self.assertEqual("/work/views.yaml", args.manifest)
+
+    def test_table_files_are_resolved_in_the_client_directory(self):
+        delete_mock = self.parser.delete_partitions_action
+
+        forward(
+            self.path,
+            [
+                "delete-partitions",
+                "--project-id=p",
+                "--dataset-id=d",
+                "--table",
+                "events_*",
+                "@tables.txt",
+                "--start-date=20211010",
+                "--end-date=20211011",
+            ],
+            cwd="/work",
+        )
+
+        [(args,), _] = delete_mock.run.call_args
+        self.assertEqual(["events_*", "@/work/tables.txt"], args.table)
+
+    def test_streamed_output_is_relayed(self):
+        def display(args):
+            args.stdout.write('{"view": "a"}\n')
+            args.stdout.flush()
+            args.stdout.write('{"view": "b"}\n')
+
+        self.display_mock.run.side_effect = display
+        stdout = io.StringIO()
+
+        self.assertEqual((0, ""), forward(self.path, DISPLAY_ARGV, stdout=stdout))
+        self.assertEqual('{"view": "a"}\n{"view": "b"}\n', stdout.getvalue())
+
+    def test_failures_are_returned(self):
+        self.display_mock.run.side_effect = ValueError("no such view")
+
+        self.assertEqual((1, "no such view"), forward(self.path, DISPLAY_ARGV))
+
+    def test_failed_partitions_exit_with_an_error_status(self):
+        fake = FakeGoogleClient(failing_tables={"dst.d.t"})
+        fake.add_table("src.d.t", ["20211010", "20211011"])
+        self.parser.copy_partitions_action = BigQueryCopyPartitionsAction(
+            FakeBigQueryClient(
+                fake, RateLimiter(table_rate=1e9, project_rate=1e9, sleep=lambda seconds: None)
+            )
+        )
+
+        status, output = forward(
+            self.path,
+            [
+                "copy-partitions",
+                "--src-project-id=src",
+                "--dst-project-id=dst",
+                "--dataset-id=d",
+                "--table=t",
+                "--start-date=20211010",
+                "--end-date=20211011",
+                "--journal=journal.jsonl",
+                "--no-plan",
+            ],
+            cwd=self.directory.name,
+        )
+
+        self.assertEqual(1, status)
+        self.assertTrue(output.startswith("copy-partitions to dst: 0 succeeded, 2 failed"))
+
+    def test_invalid_arguments_are_rejected(self):
+        status, _ = forward(self.path, ["display", "--project-id=p"])
+
+        self.assertEqual(2, status)
+
+    def test_serve_is_not_forwarded(self):
+        status, _ = forward(self.path, ["serve"])
+
+        self.assertEqual(2, status)
+
+    def test_concurrent_commands(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(forward(self.path, DISPLAY_ARGV)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([(0, "blue")] * 8, results)
+
+
+class TestSocketPath(unittest.TestCase):
+    def test_default_socket_path_uses_the_runtime_directory(self):
+        with patch.dict(os.environ, {"XDG_RUNTIME_DIR": "/run/user/1"}):
+            self.assertEqual("/run/user/1/bigquery_utils.sock", default_socket_path())
+
+    def test_stale_socket_is_removed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stale.sock")
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(path)
+            stale.close()
+
+            prepare_socket_path(path)
+
+            self.assertFalse(os.path.exists(path))
+
+    def test_live_socket_is_kept(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "live.sock")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as live:
+                live.bind(path)
+                live.listen()
+
+                with self.assertRaises(RuntimeError):
+                    prepare_socket_path(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+
+from google.api_core.exceptions import TooManyRequests
+
+from benchmarks import actions
+from benchmarks.fake_bigquery import FakeBigQueryClient, FakeGoogleClient
+from source.bigquery_actions import generate_range
+from source.bigquery_utils import Partitioning
+from source.metadata_cache import MetadataCache
+from source.rate_limiter import RateLimiter
+
+
+def fast_rate_limiter() -> RateLimiter:
+    return RateLimiter(table_rate=1e9, project_rate=1e9, sleep=lambda seconds: None)
+
+
+class TestFakeBigQueryClient(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake = FakeGoogleClient()
+        self.fake.add_table("project.dataset.table", generate_range("20200101", "20200110"))
+        self.sut = FakeBigQueryClient(self.fake, fast_rate_limiter())
+
+    def test_list_partitions(self):
+        partitions = self.sut.list_partitions("project", "dataset", "table")
+
+        self.assertEqual(generate_range("20200101", "20200110"), sorted(partitions))
+        self.assertEqual(1000, partitions["20200101"].total_rows)
+
+    def test_get_partitioning(self):
+        self.assertEqual(
+            Partitioning("day", "DATE", "DAY"),
+            self.sut.get_partitioning("project", "dataset", "table"),
+        )
+
+    def test_delete_partition(self):
+        self.sut.delete_table("project", "dataset", "table$20200101")
+
+        self.assertNotIn("20200101", self.fake.tables["project.dataset.table"].partitions)
+
+    def test_copy_partition_to_another_project(self):
+        self.sut.copy_table("project", "dataset", "table$20200102", "table$20200102", "other")
+
+        self.assertEqual(["20200102"], list(self.fake.tables["other.dataset.table"].partitions))
+
+    def test_bulk_delete_query(self):
+        self.sut.run_query(
+            "project",
+            "project.dataset.table",
+            "DELETE FROM `project.dataset.table` WHERE "
+            "(`day` >= DATE '2020-01-02' AND `day` < DATE '2020-01-04')",
+        )
+
+        self.assertEqual(
+            ["20200101"] + generate_range("20200104", "20200110"),
+            sorted(self.fake.tables["project.dataset.table"].partitions),
+        )
+
+    def test_update_view(self):
+        self.fake.add_view("project.dataset.view", "SELECT * FROM `p.d.t_blue`")
+
+        self.sut.update_view("project", "dataset", "view", "SELECT * FROM `p.d.t_green`")
+
+        self.assertEqual(
+            "SELECT * FROM `p.d.t_green`",
+            self.sut.extract_view_info("project", "dataset", "view").view_query,
+        )
+        self.assertEqual(["view"], self.sut.list_views("project", "dataset"))
+
+    def test_metadata_cache(self):
+        self.sut.metadata_cache = MetadataCache()
+        self.fake.add_view("project.dataset.view", "SELECT * FROM `p.d.t_blue`")
+
+        for _ in range(3):
+            self.sut.extract_view_info("project", "dataset", "view")
+            self.sut.get_partitioning("project", "dataset", "table")
+        self.assertEqual(2, self.fake.calls["get_table"])
+
+        self.sut.update_view("project", "dataset", "view", "SELECT * FROM `p.d.t_green`")
+        self.sut.delete_table("project", "dataset", "table$20200101")
+        self.assertEqual(
+            "SELECT * FROM `p.d.t_green`",
+            self.sut.extract_view_info("project", "dataset", "view").view_query,
+        )
+        self.sut.get_partitioning("project", "dataset", "table")
+        self.assertEqual(4, self.fake.calls["get_table"])
+
+    def test_metadata_cache_is_bypassed_on_request(self):
+        self.sut.metadata_cache = MetadataCache()
+        self.fake.add_view("project.dataset.view", "SELECT * FROM `p.d.t_blue`")
+        self.sut.extract_view_info("project", "dataset", "view")
+        # another process switched the view behind the cache
+        self.fake.add_view("project.dataset.view", "SELECT * FROM `p.d.t_green`")
+
+        self.assertEqual(
+            "SELECT * FROM `p.d.t_green`",
+            self.sut.extract_view_info(
+                "project", "dataset", "view", use_cache=False
+            ).view_query,
+        )
+        self.assertEqual(
+            "SELECT * FROM `p.d.t_green`",
+            self.sut.extract_view_info("project", "dataset", "view").view_query,
+        )
+
+    def test_injected_failures_are_retried(self):
+        self.fake.failure_rate = 0.5
+
+        for _ in range(10):
+            self.sut.list_partitions("project", "dataset", "table")
+
+        self.assertGreater(self.fake.calls["query"], 10)
+
+    def test_quota_is_enforced_per_table(self):
+        self.fake.quota_per_second = 1
+        self.fake.get_table("project.dataset.table")
+
+        with self.assertRaises(TooManyRequests):
+            self.fake.get_table("project.dataset.table")
+
+    def test_jobs_on_failing_tables_fail(self):
+        self.fake.failing_tables.add("other.dataset.table")
+        job = self.sut.submit_copy_table(
+            "project", "dataset", "table$20200101", "table$20200101", "other"
+        )
+
+        with self.assertRaises(Exception):
+            job.result()
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_every_scenario_runs(self):
+        results = actions.main(["--sizes", "10", "--latency", "0"])
+
+        self.assertEqual(
+            ["copy-partitions"] * 3 + ["delete-partitions"] * 3 + ["switch-color"],
+            [result.scenario for result in results],
+        )
+        self.assertTrue(all(result.api_calls > 0 for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+import unittest
+
+from source.instrumentation import (
+    CallRecord,
+    Instrumentation,
+    MetricsCollector,
+    get_instrumentation,
+    set_instrumentation,
+)
+
+
+class TestMetricsCollector(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sut = MetricsCollector()
+        self.sut.record_call(CallRecord("delete_table", "t$20200101", 0.1))
+        self.sut.record_call(
+            CallRecord("delete_table", "t$20200102", 0.3, queue_wait=0.2, retries=2)
+        )
+        self.sut.record_call(
+            CallRecord("job", "20200101", 2.0, job_id="job_1", bytes=1024)
+        )
+        self.sut.record_call(CallRecord("job", "20200102", 1.0, error="boom"))
+
+    def test_summary_aggregates_per_method(self):
+        calls = self.sut.summary()["calls"]
+
+        self.assertEqual(2, calls["delete_table"]["count"])
+        self.assertEqual(2, calls["delete_table"]["retries"])
+        self.assertAlmostEqual(0.4, calls["delete_table"]["duration_seconds"])
+        self.assertAlmostEqual(0.3, calls["delete_table"]["max_duration_seconds"])
+        self.assertAlmostEqual(0.2, calls["delete_table"]["queue_wait_seconds"])
+        self.assertEqual(1, calls["job"]["errors"])
+        self.assertEqual(1024, calls["job"]["bytes"])
+        self.assertEqual(["job_1"], calls["job"]["job_ids"])
+
+    def test_phase_accumulates_time_even_on_errors(self):
+        with self.sut.phase("plan"):
+            pass
+        with self.assertRaises(ValueError):
+            with self.sut.phase("plan"):
+                raise ValueError()
+
+        self.assertIn("plan", self.sut.summary()["phases"])
+
+    def test_to_prometheus(self):
+        with self.sut.phase("execute"):
+            pass
+
+        exposition = self.sut.to_prometheus()
+
+        self.assertIn("# TYPE bigquery_utils_calls_total counter", exposition)
+        self.assertIn('bigquery_utils_calls_total{method="delete_table"} 2', exposition)
+        self.assertIn('bigquery_utils_bytes_total{method="job"} 1024', exposition)
+        self.assertIn('bigquery_utils_phase_duration_seconds{phase="execute"}', exposition)
+
+    def test_export_writes_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+
+            self.sut.export(path, "json")
+
+            with open(path) as metrics_file:
+                exported = json.load(metrics_file)
+            self.assertEqual([], [f for f in os.listdir(directory) if f != "metrics.json"])
+        self.assertEqual(2, exported["calls"]["job"]["count"])
+
+    def test_profile_lists_phases_and_methods(self):
+        with self.sut.phase("execute"):
+            pass
+
+        profile = self.sut.profile()
+
+        self.assertIn("execute", profile)
+        self.assertIn("delete_table", profile)
+        self.assertIn("2 retries", profile)
+
+
+class TestGlobalInstrumentation(unittest.TestCase):
+    def tearDown(self) -> None:
+        set_instrumentation(Instrumentation())
+
+    def test_default_instrumentation_records_nothing(self):
+        instrumentation = get_instrumentation()
+        instrumentation.record_call(CallRecord("job", "p", 1.0))
+        with instrumentation.phase("plan"):
+            pass
+
+        self.assertIsInstance(instrumentation, Instrumentation)
+
+    def test_set_instrumentation(self):
+        collector = MetricsCollector()
+        set_instrumentation(collector)
+
+        self.assertIs(collector, get_instrumentation())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from source.journal import Journal, default_journal_path
+from source.partition_executor import PartitionResult, SUCCEEDED, FAILED
+from source.partition_planner import PartitionPlan, without_completed
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "nested", "journal.jsonl")
+
+    def test_record_appends_one_line_per_result(self):
+        with Journal(self.path) as journal:
+            journal.record(PartitionResult("20211010", SUCCEEDED, 1.5, job_id="job"))
+            journal.record(PartitionResult("20211011", FAILED, 0.5, error="boom"))
+
+        with open(self.path) as journal_file:
+            records = [json.loads(line) for line in journal_file]
+        self.assertEqual(["20211010", "20211011"], [r["partition"] for r in records])
+        self.assertEqual("job", records[0]["job_id"])
+        self.assertEqual("boom", records[1]["error"])
+
+    @patch("source.journal.os.fsync")
+    def test_record_is_fsynced(self, mocked_fsync):
+        with Journal(self.path) as journal:
+            mocked_fsync.reset_mock()
+            journal.record(PartitionResult("20211010", SUCCEEDED, 1.5))
+
+        mocked_fsync.assert_called_once()
+
+    def test_completed_only_when_resuming(self):
+        with Journal(self.path) as journal:
+            journal.record(PartitionResult("20211010", SUCCEEDED, 1.5))
+            journal.record(PartitionResult("20211011", FAILED, 0.5, error="boom"))
+
+        with Journal(self.path, resume=True) as journal:
+            self.assertEqual({"20211010"}, journal.completed())
+            journal.record(PartitionResult("20211011", SUCCEEDED, 0.5))
+
+        with Journal(self.path, resume=True) as journal:
+            self.assertEqual({"20211010", "20211011"}, journal.completed())
+
+        with Journal(self.path) as journal:
+            self.assertEqual(set(), journal.completed())
+
+    def test_half_written_line_is_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as journal_file:
+            journal_file.write('{"partition": "20211010", "status": "succeeded"}\n')
+            journal_file.write('{"partition": "20211011", "sta')
+
+        with Journal(self.path, resume=True) as journal:
+            journal.record(PartitionResult("20211012", SUCCEEDED, 0.5))
+
+        with Journal(self.path, resume=True) as journal:
+            self.assertEqual({"20211010", "20211012"}, journal.completed())
+
+    def test_default_journal_path(self):
+        with patch.dict(os.environ, {"XDG_CACHE_HOME": "/cache"}):
+            self.assertEqual(
+                "/cache/bigquery_utils/journals/delete-partitions-p.d.t-20211010.jsonl",
+                default_journal_path("delete-partitions", "p.d.t", "20211010"),
+            )
+
+
+class TestWithoutCompleted(unittest.TestCase):
+    def test_removes_completed_partitions(self):
+        plan = PartitionPlan(["20211011", "20211012"], ["20211010"], whole_table=True)
+
+        self.assertEqual(
+            PartitionPlan(["20211012"], ["20211010", "20211011"], whole_table=False),
+            without_completed(plan, {"20211011"}),
+        )
+
+    def test_completed_whole_table_operation_skips_everything(self):
+        plan = PartitionPlan(["20211011", "20211012"], [], whole_table=True)
+
+        self.assertEqual(
+            PartitionPlan([], ["20211011", "20211012"]),
+            without_completed(plan, {"*"}),
+        )
+
+    def test_nothing_completed(self):
+        plan = PartitionPlan(["20211011"], [], whole_table=True)
+
+        self.assertIs(plan, without_completed(plan, set()))
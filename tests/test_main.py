@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("google.cloud.bigquery", "google.auth", "sql_metadata", "sqlglot")
+
+
+def imported_modules(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "main.py", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+
+
+def parse_importtime(stderr: str) -> dict:
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+class TestStartup(unittest.TestCase):
+    def assert_no_heavy_imports(self, modules: dict):
+        heavy = [
+            name
+            for name in modules
+            if any(name == m or name.startswith(f"{m}.") for m in HEAVY_MODULES)
+        ]
+        self.assertEqual([], heavy)
+
+    def test_help_does_not_import_google_libraries(self):
+        process = imported_modules("--help")
+
+        self.assertEqual(0, process.returncode)
+        modules = parse_importtime(process.stderr)
+        self.assertIn("source.bigquery_actions", modules)
+        self.assertNotIn("google", modules)
+        self.assert_no_heavy_imports(modules)
+
+    def test_argument_errors_do_not_import_google_libraries(self):
+        process = imported_modules("delete-partitions", "--project-id=p")
+
+        self.assertEqual(2, process.returncode)
+        self.assert_no_heavy_imports(parse_importtime(process.stderr))
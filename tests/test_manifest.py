@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+from source.manifest import ViewReference, load_manifest
+
+
+class TestLoadManifest(unittest.TestCase):
+    def write_manifest(self, content: str) -> str:
+        manifest = tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False)
+        self.addCleanup(os.remove, manifest.name)
+        with manifest:
+            manifest.write(content)
+        return manifest.name
+
+    def test_load_list_of_views(self):
+        path = self.write_manifest("- revenues\n- campaigns\n")
+
+        self.assertEqual(
+            [
+                ViewReference("project", "dataset", "revenues"),
+                ViewReference("project", "dataset", "campaigns"),
+            ],
+            load_manifest(path, "project", "dataset"),
+        )
+
+    def test_load_views_with_overrides(self):
+        path = self.write_manifest(
+            "dataset_id: core\n"
+            "views:\n"
+            "  - revenues\n"
+            "  - view: campaigns\n"
+            "    project_id: other-project\n"
+        )
+
+        self.assertEqual(
+            [
+                ViewReference("project", "core", "revenues"),
+                ViewReference("other-project", "core", "campaigns"),
+            ],
+            load_manifest(path, "project", "dataset"),
+        )
+
+    def test_load_invalid_manifest(self):
+        for content in ["", "views: revenues\n", "- name: revenues\n", "- a\n- a\n"]:
+            with self.subTest(content=content):
+                with self.assertRaises(ValueError):
+                    load_manifest(self.write_manifest(content), "project", "dataset")
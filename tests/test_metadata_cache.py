@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+import unittest
+
+from source.metadata_cache import MetadataCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestMetadataCache(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "bigquery_utils", "metadata.json")
+        self.clock = Clock()
+
+    def cache(self, **options) -> MetadataCache:
+        return MetadataCache(self.path, clock=self.clock, **options)
+
+    def test_entries_expire(self):
+        sut = self.cache(ttl=10)
+        sut.put("p.d.view", {"view": {"query": "SELECT 1"}})
+
+        self.clock.now += 10
+        self.assertEqual({"view": {"query": "SELECT 1"}}, sut.get("p.d.view"))
+        self.clock.now += 1
+        self.assertIsNone(sut.get("p.d.view"))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        sut = self.cache(max_entries=2)
+        sut.put("p.d.a", {})
+        sut.put("p.d.b", {})
+        sut.get("p.d.a")
+        sut.put("p.d.c", {})
+
+        self.assertIsNone(sut.get("p.d.b"))
+        self.assertEqual({}, sut.get("p.d.a"))
+        self.assertEqual({}, sut.get("p.d.c"))
+
+    def test_invalidating_a_partition_invalidates_its_table(self):
+        sut = self.cache()
+        sut.put("p.d.table", {})
+
+        sut.invalidate("p.d.table$20200101")
+
+        self.assertIsNone(sut.get("p.d.table"))
+
+    def test_entries_are_shared_with_the_next_run(self):
+        first = self.cache()
+        first.put("p.d.view", {"type": "VIEW"})
+        first.flush()
+
+        self.assertEqual({"type": "VIEW"}, self.cache().get("p.d.view"))
+
+    def test_flush_merges_with_concurrent_runs(self):
+        first, second = self.cache(), self.cache()
+        first.put("p.d.a", {"run": "first"})
+        first.put("p.d.b", {"run": "first"})
+        first.flush()
+        second.get("p.d.a")
+        self.clock.now += 1
+        second.invalidate("p.d.b")
+        second.put("p.d.c", {"run": "second"})
+        second.flush()
+
+        third = self.cache()
+        self.assertEqual({"run": "first"}, third.get("p.d.a"))
+        self.assertIsNone(third.get("p.d.b"))
+        self.assertEqual({"run": "second"}, third.get("p.d.c"))
+
+    def test_flush_without_changes_leaves_the_file_alone(self):
+        first = self.cache()
+        first.put("p.d.view", {})
+        first.flush()
+        modified = os.stat(self.path).st_mtime_ns
+
+        second = self.cache()
+        second.get("p.d.view")
+        second.flush()
+        first.flush()
+
+        self.assertEqual(modified, os.stat(self.path).st_mtime_ns)
+
+    def test_corrupted_file_is_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as cache_file:
+            cache_file.write("{")
+
+        sut = self.cache()
+        self.assertIsNone(sut.get("p.d.view"))
+        sut.put("p.d.view", {})
+        sut.flush()
+
+        with open(self.path) as cache_file:
+            self.assertEqual(["p.d.view"], [e["id"] for e in json.load(cache_file)["entries"]])
+
+    def test_memory_only(self):
+        sut = MetadataCache()
+        sut.put("p.d.view", {})
+        sut.flush()
+
+        self.assertEqual({}, sut.get("p.d.view"))
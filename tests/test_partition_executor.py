@@ -0,0 +1,293 @@
+import threading
+import unittest
+
+from unittest.mock import Mock
+
+from google.api_core.exceptions import Forbidden, ServiceUnavailable
+
+from source.partition_executor import (
+    FairQueue,
+    JobPoller,
+    JobTask,
+    PartitionExecutor,
+    PartitionTask,
+    RunSummary,
+    PartitionResult,
+    SUCCEEDED,
+    FAILED,
+    round_robin,
+)
+
+
+class TestPartitionExecutor(unittest.TestCase):
+    def test_run_returns_a_result_per_task(self):
+        tasks = [PartitionTask(str(i), lambda: None) for i in range(20)]
+
+        results = list(PartitionExecutor(4).run(tasks))
+
+        self.assertEqual(
+            sorted(str(i) for i in range(20)), sorted(r.partition for r in results)
+        )
+        self.assertTrue(all(r.succeeded for r in results))
+
+    def test_run_never_exceeds_parallelism(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+        barrier = threading.Barrier(3)
+
+        def operation():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            barrier.wait(timeout=5)
+            with lock:
+                running[0] -= 1
+
+        tasks = [PartitionTask(str(i), operation) for i in range(9)]
+
+        results = list(PartitionExecutor(3).run(tasks))
+
+        self.assertEqual(9, len(results))
+        self.assertEqual(3, peak[0])
+
+    def test_run_records_failures(self):
+        def fail():
+            raise ValueError("not allowed")
+
+        results = list(
+            PartitionExecutor(2).run(
+                [PartitionTask("ok", lambda: None), PartitionTask("ko", fail)]
+            )
+        )
+
+        by_partition = {r.partition: r for r in results}
+        self.assertEqual(SUCCEEDED, by_partition["ok"].status)
+        self.assertEqual(FAILED, by_partition["ko"].status)
+        self.assertEqual("not allowed", by_partition["ko"].error)
+
+    def test_parallelism_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            PartitionExecutor(0)
+
+
+def job_done_after(polls: int, job_id: str, error: Exception = None) -> Mock:
+    job = Mock()
+    job.job_id = job_id
+    job.done.side_effect = [False] * polls + [True]
+    if error is not None:
+        job.result.side_effect = error
+    return job
+
+
+class TestJobPoller(unittest.TestCase):
+    def test_run_submits_up_to_the_in_flight_limit_before_waiting(self):
+        submitted = []
+
+        def submit(partition, polls):
+            def _submit():
+                submitted.append(partition)
+                return job_done_after(polls, f"job_{partition}")
+
+            return _submit
+
+        tasks = [JobTask(str(i), submit(str(i), polls=i)) for i in range(5)]
+        poller = JobPoller(max_in_flight=3, poll_interval=0)
+        results = poller.run(tasks)
+
+        first = next(results)
+
+        self.assertCountEqual(["0", "1", "2"], submitted)
+        self.assertEqual("0", first.partition)
+        self.assertEqual("job_0", first.job_id)
+        self.assertEqual(["1", "2", "3", "4"], [r.partition for r in results])
+
+    def test_run_sends_submits_and_polls_concurrently(self):
+        # each call waits for the other two, so sequential calls would time out
+        submits, polls = threading.Barrier(3, timeout=5), threading.Barrier(3, timeout=5)
+
+        def submit(partition):
+            def _submit():
+                submits.wait()
+                job = Mock(job_id=f"job_{partition}")
+                job.done.side_effect = lambda: polls.wait() >= 0
+                return job
+
+            return _submit
+
+        tasks = [JobTask(str(i), submit(i)) for i in range(3)]
+
+        results = list(JobPoller(max_in_flight=3, poll_interval=0).run(tasks))
+
+        self.assertEqual([SUCCEEDED] * 3, [r.status for r in results])
+
+    def test_run_reports_failed_jobs_and_submissions(self):
+        def failing_submit():
+            raise RuntimeError("cannot submit")
+
+        tasks = [
+            JobTask("a", lambda: job_done_after(1, "job_a", RuntimeError("boom"))),
+            JobTask("b", failing_submit),
+            JobTask("c", lambda: job_done_after(0, "job_c")),
+        ]
+
+        results = {r.partition: r for r in JobPoller(10, poll_interval=0).run(tasks)}
+
+        self.assertEqual(FAILED, results["a"].status)
+        self.assertEqual("boom", results["a"].error)
+        self.assertEqual("job_a", results["a"].job_id)
+        self.assertEqual(FAILED, results["b"].status)
+        self.assertEqual("cannot submit", results["b"].error)
+        self.assertEqual(SUCCEEDED, results["c"].status)
+
+    def test_run_retries_transient_poll_failures(self):
+        job = Mock(job_id="job_a")
+        job.done.side_effect = [ServiceUnavailable("try again"), True]
+
+        results = list(JobPoller(poll_interval=0).run([JobTask("a", lambda: job)]))
+
+        self.assertEqual([SUCCEEDED], [r.status for r in results])
+
+    def test_run_fails_jobs_that_cannot_be_polled(self):
+        broken = Mock(job_id="job_a")
+        broken.done.side_effect = Forbidden("access denied")
+        unreachable = Mock(job_id="job_b")
+        unreachable.done.side_effect = ServiceUnavailable("try again")
+        queue = FairQueue(
+            {
+                "t": [
+                    JobTask("a", lambda: broken, "t"),
+                    JobTask("b", lambda: unreachable, "t"),
+                    JobTask("c", lambda: job_done_after(0, "job_c"), "t"),
+                ]
+            },
+            max_per_target=1,
+        )
+
+        results = {
+            r.partition: r
+            for r in JobPoller(poll_interval=0, max_poll_failures=3).run(queue)
+        }
+
+        self.assertEqual(1, broken.done.call_count)
+        self.assertEqual(3, unreachable.done.call_count)
+        self.assertEqual(FAILED, results["a"].status)
+        self.assertIn("access denied", results["a"].error)
+        self.assertEqual(FAILED, results["b"].status)
+        self.assertEqual(SUCCEEDED, results["c"].status)
+
+    def test_max_in_flight_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            JobPoller(0)
+
+
+class TestRunSummary(unittest.TestCase):
+    def test_str(self):
+        summary = RunSummary(
+            "delete-partitions",
+            [
+                PartitionResult("20211011", FAILED, 0.1, error="boom"),
+                PartitionResult("20211010", SUCCEEDED, 0.1),
+            ],
+        )
+
+        self.assertEqual(
+            "delete-partitions: 1 succeeded, 1 failed\n  20211011: boom", str(summary)
+        )
+
+    def test_str_with_target(self):
+        summary = RunSummary(
+            "copy-partitions",
+            [PartitionResult("20211010", SUCCEEDED, 0.1)],
+            target="dst_project_id",
+        )
+
+        self.assertEqual(
+            "copy-partitions to dst_project_id: 1 succeeded, 0 failed", str(summary)
+        )
+
+
+class TestRoundRobin(unittest.TestCase):
+    def test_interleaves_until_every_iterable_is_exhausted(self):
+        self.assertEqual(
+            ["a1", "b1", "c1", "a2", "c2", "a3"],
+            list(round_robin([["a1", "a2", "a3"], ["b1"], iter(["c1", "c2"])])),
+        )
+
+
+class TestFairQueue(unittest.TestCase):
+    def test_takes_targets_in_turn(self):
+        sut = FairQueue({"a": ["a1", "a2", "a3"], "b": ["b1"], "c": iter(["c1", "c2"])})
+
+        self.assertEqual(
+            ["a1", "b1", "c1", "a2", "c2", "a3"], list(iter(sut.take, None))
+        )
+
+    def test_a_target_at_its_cap_waits_for_a_release(self):
+        sut = FairQueue({"a": ["a1", "a2", "a3"], "b": ["b1"]}, max_per_target=1)
+
+        self.assertEqual(["a1", "b1"], list(iter(sut.take, None)))
+        sut.release("a")
+        self.assertEqual("a2", sut.take())
+        self.assertIsNone(sut.take())
+
+    def test_max_per_target_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            FairQueue({}, max_per_target=0)
+
+    def test_executor_shares_its_parallelism_within_the_caps(self):
+        lock = threading.Lock()
+        running = {"big": 0, "small": 0}
+        peak = {"big": 0, "small": 0}
+
+        def operation(target):
+            def _operation():
+                with lock:
+                    running[target] += 1
+                    peak[target] = max(peak[target], running[target])
+                threading.Event().wait(0.01)
+                with lock:
+                    running[target] -= 1
+
+            return _operation
+
+        tasks = FairQueue(
+            {
+                target: [
+                    PartitionTask(f"{target}{i}", operation(target), target)
+                    for i in range(count)
+                ]
+                for target, count in (("big", 20), ("small", 4))
+            },
+            max_per_target=2,
+        )
+
+        results = list(PartitionExecutor(8).run(tasks))
+
+        self.assertEqual(24, len(results))
+        self.assertEqual({"big": 2, "small": 2}, peak)
+        self.assertEqual({"big", "small"}, {r.target for r in results})
+
+    def test_job_poller_releases_targets_as_jobs_finish(self):
+        submitted = []
+
+        def submit(partition):
+            def _submit():
+                submitted.append(partition)
+                return job_done_after(1, f"job_{partition}")
+
+            return _submit
+
+        tasks = FairQueue(
+            {
+                target: [JobTask(f"{target}{i}", submit(f"{target}{i}"), target) for i in range(3)]
+                for target in ("a", "b")
+            },
+            max_per_target=1,
+        )
+        results = JobPoller(max_in_flight=10, poll_interval=0).run(tasks)
+
+        next(results)
+
+        self.assertCountEqual(["a0", "b0"], submitted)
+        self.assertEqual(5, len(list(results)))
@@ -0,0 +1,156 @@
+import datetime
+import unittest
+
+from source.bigquery_utils import PartitionMetadata
+from source.partition_planner import (
+    PartitionPlan,
+    largest_first,
+    plan_incremental_copy,
+    plan_partitions,
+    unplanned,
+)
+
+
+def partitions(**rows_by_id) -> dict:
+    return {
+        partition_id.lstrip("p"): PartitionMetadata(partition_id.lstrip("p"), rows, rows * 10)
+        for partition_id, rows in rows_by_id.items()
+    }
+
+
+class TestPlanPartitions(unittest.TestCase):
+    def test_unplanned(self):
+        self.assertEqual(
+            PartitionPlan(["20211010", "20211011"]), unplanned(["20211010", "20211011"])
+        )
+
+    def test_skip_missing_and_empty_partitions(self):
+        existing = partitions(p20211009=1, p20211010=5, p20211011=0)
+
+        plan = plan_partitions(["20211010", "20211011", "20211012"], existing)
+
+        self.assertEqual(["20211010"], plan.partitions)
+        self.assertEqual(["20211011", "20211012"], plan.skipped)
+        self.assertFalse(plan.whole_table)
+
+    def test_whole_table_when_range_covers_every_non_empty_partition(self):
+        existing = partitions(p20211010=5, p20211011=1, p20211020=0)
+
+        plan = plan_partitions(["20211010", "20211011", "20211012"], existing)
+
+        self.assertTrue(plan.whole_table)
+        self.assertEqual(["20211010", "20211011"], plan.partitions)
+
+    def test_special_partitions_prevent_whole_table(self):
+        existing = partitions(p20211010=5)
+        existing["__NULL__"] = PartitionMetadata("__NULL__", 0, 0)
+
+        self.assertFalse(plan_partitions(["20211010"], existing).whole_table)
+
+    def test_destination_partitions_outside_the_plan_prevent_whole_table(self):
+        source = partitions(p20211010=5)
+
+        self.assertTrue(
+            plan_partitions(["20211010"], source, partitions(p20211010=2)).whole_table
+        )
+        self.assertFalse(
+            plan_partitions(
+                ["20211010"], source, partitions(p20211010=2, p20211001=3)
+            ).whole_table
+        )
+
+    def test_keep_empty_source_partitions_with_destination_rows(self):
+        source = partitions(p20211010=5, p20211011=0)
+        destination = partitions(p20211011=2, p20211012=3, p20211013=0)
+
+        plan = plan_partitions(
+            ["20211010", "20211011", "20211012", "20211013"], source, destination
+        )
+
+        self.assertEqual(["20211010", "20211011", "20211012"], plan.partitions)
+        self.assertEqual(["20211013"], plan.skipped)
+
+    def test_empty_table_is_not_a_whole_table_operation(self):
+        self.assertFalse(plan_partitions(["20211010"], {}).whole_table)
+
+
+def modified_at(day: int, rows: int = 10, partition_id: str = "20211010") -> PartitionMetadata:
+    return PartitionMetadata(
+        partition_id, rows, rows * 10, datetime.datetime(2021, 10, day)
+    )
+
+
+class TestPlanIncrementalCopy(unittest.TestCase):
+    def test_copy_only_changed_partitions(self):
+        source = {
+            "20211010": modified_at(10, partition_id="20211010"),
+            "20211011": modified_at(15, partition_id="20211011"),
+            "20211012": modified_at(10, rows=20, partition_id="20211012"),
+            "20211013": modified_at(10, partition_id="20211013"),
+        }
+        destination = {
+            "20211010": modified_at(11, partition_id="20211010"),
+            "20211011": modified_at(11, partition_id="20211011"),
+            "20211012": modified_at(11, partition_id="20211012"),
+        }
+
+        plan = plan_incremental_copy(
+            ["20211010", "20211011", "20211012", "20211013", "20211014"],
+            source,
+            destination,
+        )
+
+        self.assertEqual(["20211011", "20211012", "20211013"], plan.partitions)
+        self.assertEqual(["20211010", "20211014"], plan.skipped)
+        self.assertFalse(plan.whole_table)
+
+    def test_unknown_modification_time_is_copied(self):
+        source = {"20211010": PartitionMetadata("20211010", 10, 100)}
+        destination = {"20211010": PartitionMetadata("20211010", 10, 100)}
+
+        plan = plan_incremental_copy(["20211010"], source, destination)
+
+        self.assertEqual(["20211010"], plan.partitions)
+
+    def test_partition_emptied_in_source_clears_destination(self):
+        source = {
+            "20211010": modified_at(10, rows=0, partition_id="20211010"),
+            "20211012": modified_at(10, partition_id="20211012"),
+        }
+        destination = {
+            "20211010": modified_at(11, partition_id="20211010"),
+            "20211011": modified_at(11, partition_id="20211011"),
+            "20211012": modified_at(11, partition_id="20211012"),
+        }
+
+        plan = plan_incremental_copy(
+            ["20211010", "20211011", "20211012", "20211013"], source, destination
+        )
+
+        self.assertEqual(["20211010", "20211011"], plan.partitions)
+        self.assertEqual(["20211012", "20211013"], plan.skipped)
+        self.assertFalse(plan.whole_table)
+
+    def test_whole_table_when_every_partition_changed(self):
+        source = {"20211010": modified_at(12)}
+
+        plan = plan_incremental_copy(["20211010"], source, {})
+
+        self.assertTrue(plan.whole_table)
+
+
+class TestLargestFirst(unittest.TestCase):
+    def test_orders_partitions_by_size_keeping_date_order_on_ties(self):
+        plan = plan_partitions(
+            ["20211010", "20211011", "20211012", "20211013"],
+            partitions(p20211010=1, p20211011=30, p20211012=1, p20211013=5),
+        )
+
+        self.assertEqual(
+            ["20211011", "20211013", "20211010", "20211012"], largest_first(plan).partitions
+        )
+
+    def test_unplanned_ranges_keep_their_order(self):
+        plan = unplanned(["20211010", "20211011"])
+
+        self.assertIs(plan, largest_first(plan))
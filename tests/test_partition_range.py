@@ -0,0 +1,61 @@
+import unittest
+
+from source.partition_range import INTEGER, MONTH, PartitionRange
+
+
+class TestPartitionRange(unittest.TestCase):
+    def test_daily(self):
+        self.assertEqual(
+            ["20211230", "20211231", "20220101"], list(PartitionRange("20211230", "20220101"))
+        )
+
+    def test_hourly(self):
+        partitions = PartitionRange("2021123122", "2022010101")
+
+        self.assertEqual(["2021123122", "2021123123", "2022010100", "2022010101"], list(partitions))
+
+    def test_monthly(self):
+        self.assertEqual(
+            ["202111", "202112", "202201"], list(PartitionRange("202111", "202201"))
+        )
+
+    def test_yearly(self):
+        self.assertEqual(["2020", "2021"], list(PartitionRange("2020", "2021")))
+
+    def test_integer(self):
+        self.assertEqual(
+            ["0", "10", "20"], list(PartitionRange("0", "25", INTEGER, interval=10))
+        )
+
+    def test_explicit_granularity(self):
+        self.assertEqual(["202012"], list(PartitionRange("202012", "202012", MONTH)))
+
+    def test_single_partition(self):
+        self.assertEqual(["20211014"], list(PartitionRange("20211014", "20211014")))
+
+    def test_start_after_end(self):
+        with self.assertRaises(ValueError):
+            PartitionRange("20211015", "20211014")
+
+    def test_mixed_granularities(self):
+        with self.assertRaises(ValueError):
+            PartitionRange("2021101400", "20211014")
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            PartitionRange("2021-10-14", "2021-10-15")
+
+    def test_is_a_lazy_sequence(self):
+        # ten years of hourly partitions
+        partitions = PartitionRange("2012010100", "2021123123")
+
+        self.assertEqual(87672, len(partitions))
+        self.assertEqual("2012010100", partitions[0])
+        self.assertEqual("2021123123", partitions[-1])
+        self.assertEqual(["2012010101", "2012010102"], partitions[1:3])
+        with self.assertRaises(IndexError):
+            partitions[len(partitions)]
+
+
+if __name__ == "__main__":
+    unittest.main()
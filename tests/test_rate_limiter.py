@@ -0,0 +1,175 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from google.api_core.exceptions import (
+    BadRequest,
+    Forbidden,
+    ServiceUnavailable,
+    TooManyRequests,
+)
+
+from source.rate_limiter import (
+    AdaptiveConcurrency,
+    RateLimiter,
+    TokenBucket,
+    is_retryable,
+    is_throttled,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_acquire_allows_a_burst_then_waits(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, clock=clock, sleep=clock.sleep)
+
+        for _ in range(4):
+            bucket.acquire()
+
+        self.assertEqual([0.5, 0.5], clock.sleeps)
+
+    def test_tokens_refill_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=3, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            bucket.acquire()
+
+        clock.now += 10
+        for _ in range(3):
+            bucket.acquire()
+
+        self.assertEqual([], clock.sleeps)
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def test_throttle_halves_the_running_concurrency(self):
+        concurrency = AdaptiveConcurrency(maximum=64)
+        for _ in range(8):
+            concurrency.__enter__()
+
+        concurrency.on_throttle()
+
+        self.assertEqual(4, concurrency.limit)
+
+    def test_success_raises_the_limit_up_to_the_maximum(self):
+        concurrency = AdaptiveConcurrency(maximum=3)
+        concurrency.limit = 2
+
+        for _ in range(10):
+            concurrency.on_success()
+
+        self.assertEqual(3, concurrency.limit)
+
+    def test_enter_blocks_above_the_limit(self):
+        concurrency = AdaptiveConcurrency(maximum=1)
+        entered = threading.Event()
+
+        def worker():
+            with concurrency:
+                entered.set()
+
+        with concurrency:
+            thread = threading.Thread(target=worker)
+            thread.start()
+            self.assertFalse(entered.wait(0.1))
+        self.assertTrue(entered.wait(5))
+        thread.join()
+
+
+class TestIsRetryable(unittest.TestCase):
+    def test_is_retryable(self):
+        self.assertTrue(is_retryable(TooManyRequests("slow down")))
+        self.assertTrue(
+            is_retryable(
+                Forbidden("quota", errors=[{"reason": "rateLimitExceeded"}])
+            )
+        )
+        self.assertFalse(
+            is_retryable(Forbidden("denied", errors=[{"reason": "accessDenied"}]))
+        )
+        self.assertFalse(is_retryable(BadRequest("invalid query")))
+        self.assertFalse(is_retryable(ValueError("boom")))
+
+
+    def test_is_throttled(self):
+        self.assertTrue(is_throttled(TooManyRequests("slow down")))
+        self.assertTrue(
+            is_throttled(Forbidden("quota", errors=[{"reason": "rateLimitExceeded"}]))
+        )
+        self.assertFalse(is_throttled(ServiceUnavailable("backend error")))
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sleeps = []
+        self.sut = RateLimiter(table_rate=1000, project_rate=1000, sleep=self.sleeps.append)
+
+    def test_call_retries_retryable_errors_with_backoff(self):
+        operation = Mock(side_effect=[TooManyRequests("a"), TooManyRequests("b"), "done"])
+
+        self.assertEqual("done", self.sut.call("project", "p.d.t$20211010", operation))
+
+        self.assertEqual(3, operation.call_count)
+        self.assertEqual(2, len(self.sleeps))
+        self.assertLessEqual(self.sleeps[0], 1.0)
+        self.assertLessEqual(self.sleeps[1], 2.0)
+
+    def test_call_does_not_retry_other_errors(self):
+        operation = Mock(side_effect=BadRequest("invalid"))
+
+        with self.assertRaises(BadRequest):
+            self.sut.call("project", "p.d.t", operation)
+
+        self.assertEqual(1, operation.call_count)
+
+    def test_call_gives_up_after_max_retries(self):
+        self.sut.max_retries = 2
+        operation = Mock(side_effect=TooManyRequests("slow down"))
+
+        with self.assertRaises(TooManyRequests):
+            self.sut.call("project", None, operation)
+
+        self.assertEqual(3, operation.call_count)
+
+    def test_only_rate_limits_lower_the_concurrency(self):
+        self.sut.call(
+            "project", None, Mock(side_effect=[ServiceUnavailable("backend error"), None])
+        )
+        self.assertEqual(self.sut.concurrency.maximum, self.sut.concurrency.limit)
+
+        self.sut.call("project", None, Mock(side_effect=[TooManyRequests("slow down"), None]))
+        self.assertLess(self.sut.concurrency.limit, self.sut.concurrency.maximum)
+
+    def test_tokens_are_waited_for_without_holding_a_slot(self):
+        in_flight = []
+
+        def sleep(seconds: float) -> None:
+            in_flight.append(self.sut.concurrency.in_flight)
+            time.sleep(seconds)
+
+        self.sut._buckets["table:p.d.t"] = TokenBucket(100, capacity=1, sleep=sleep)
+
+        self.sut.call("project", "p.d.t", lambda: None)
+        self.sut.call("project", "p.d.t", lambda: None)
+
+        self.assertTrue(in_flight)
+        self.assertEqual({0}, set(in_flight))
+
+    def test_partitions_share_the_table_bucket(self):
+        self.sut.call("project", "p.d.t$20211010", lambda: None)
+        self.sut.call("project", "p.d.t$20211011", lambda: None)
+
+        self.assertEqual({"project:project", "table:p.d.t"}, set(self.sut._buckets))
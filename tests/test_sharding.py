@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import unittest
+
+from source.partition_executor import FAILED, SUCCEEDED
+from source.partition_range import INTEGER, PartitionRange
+from source.sharding import Shard, merge_results, shard_partitions
+
+
+class TestShardPartitions(unittest.TestCase):
+    def test_shards_cover_the_range_without_overlap(self):
+        partitions = PartitionRange("20200101", "20201231")
+
+        shards = [list(shard_partitions(partitions, Shard(index, 7))) for index in range(7)]
+
+        self.assertEqual(list(partitions), [p for shard in shards for p in shard])
+        self.assertEqual({52, 53}, {len(shard) for shard in shards})
+
+    def test_integer_shards_keep_the_interval(self):
+        partitions = PartitionRange("0", "900", INTEGER, interval=100)
+
+        self.assertEqual(["500", "600", "700", "800", "900"], list(shard_partitions(partitions, Shard(1, 2))))
+
+    def test_more_shards_than_partitions(self):
+        partitions = PartitionRange("20200101", "20200102")
+
+        self.assertEqual([], list(shard_partitions(partitions, Shard(0, 4))))
+        self.assertEqual(["20200102"], list(shard_partitions(partitions, Shard(3, 4))))
+
+    def test_without_shard(self):
+        partitions = PartitionRange("20200101", "20200102")
+
+        self.assertIs(partitions, shard_partitions(partitions, None))
+
+    def test_parse(self):
+        self.assertEqual(Shard(0, 3), Shard.parse("0/3"))
+        for invalid in ("3/3", "-1/3", "1", "1/"):
+            with self.subTest(invalid), self.assertRaises(ValueError):
+                Shard.parse(invalid)
+
+
+class TestMergeResults(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name: str, records: list) -> str:
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as results_file:
+            for record in records:
+                results_file.write(json.dumps(record) + "\n")
+        return path
+
+    def test_merge_journals_and_ndjson_outputs(self):
+        journal = self.write(
+            "shard0.jsonl",
+            [
+                {"partition": "20200101", "status": SUCCEEDED, "duration": 1.0},
+                {"partition": "20200102", "status": FAILED, "duration": 1.0, "error": "boom"},
+                {"partition": "20200102", "status": SUCCEEDED, "duration": 1.0},
+            ],
+        )
+        output = self.write(
+            "shard1.ndjson",
+            [
+                {"type": "partition", "operation": "delete-partitions", "partition": "20200103",
+                 "status": FAILED, "duration": 1.0, "error": "boom", "job_id": None,
+                 "bytes": None, "target": None},
+                {"type": "summary", "operation": "delete-partitions", "target": None,
+                 "succeeded": 0, "failed": 1, "skipped": 0},
+            ],
+        )
+
+        summaries = merge_results([journal, output])
+
+        self.assertEqual(1, len(summaries))
+        self.assertEqual(
+            "delete-partitions: 2 succeeded, 1 failed\n  20200103: boom", str(summaries[0])
+        )
+
+    def test_merge_keeps_whole_table_results_of_each_shard(self):
+        first = self.write("a.jsonl", [{"partition": "*", "status": SUCCEEDED, "duration": 1.0}])
+        second = self.write("b.jsonl", [{"partition": "*", "status": SUCCEEDED, "duration": 1.0}])
+
+        self.assertEqual(2, len(merge_results([first, second])[0].succeeded))
+
+    def test_merge_reports_each_target(self):
+        path = self.write(
+            "fan_out.jsonl",
+            [
+                {"partition": "20200101", "status": SUCCEEDED, "duration": 1.0, "target": "eu"},
+                {"partition": "20200101", "status": SUCCEEDED, "duration": 1.0, "target": "us"},
+            ],
+        )
+
+        self.assertEqual(["eu", "us"], [summary.target for summary in merge_results([path])])
@@ -0,0 +1,81 @@
+import unittest
+from types import SimpleNamespace
+
+from source.bigquery_utils import Partitioning
+from source.verification import (
+    CONTENT_DIFFERS,
+    MISSING_IN_DESTINATION,
+    MISSING_IN_SOURCE,
+    ROW_COUNT_DIFFERS,
+    PartitionFingerprint,
+    diff_fingerprints,
+    fingerprint_query,
+    parse_fingerprints,
+)
+
+
+class TestVerification(unittest.TestCase):
+    def test_fingerprint_query_groups_by_partition(self):
+        query = fingerprint_query(
+            "p.d.t", Partitioning("day", "DATE", "DAY"), ["20200101", "20200102"]
+        )
+
+        self.assertEqual(
+            "SELECT FORMAT_TIMESTAMP('%Y%m%d', TIMESTAMP_TRUNC(TIMESTAMP(t.`day`), DAY)) "
+            "AS partition_id, COUNT(*) AS row_count, "
+            "SUM(CAST(FARM_FINGERPRINT(TO_JSON_STRING(t)) AS NUMERIC)) AS fingerprint "
+            "FROM `p.d.t` AS t "
+            "WHERE (`day` >= DATE '2020-01-01' AND `day` < DATE '2020-01-03') "
+            "GROUP BY partition_id",
+            query,
+        )
+
+    def test_fingerprint_query_on_a_timestamp_column(self):
+        query = fingerprint_query(
+            "p.d.t", Partitioning("ts", "TIMESTAMP", "HOUR"), ["2020010100"]
+        )
+
+        self.assertIn(
+            "FORMAT_TIMESTAMP('%Y%m%d%H', TIMESTAMP_TRUNC(t.`ts`, HOUR)) AS partition_id", query
+        )
+
+    def test_fingerprint_query_on_a_datetime_column(self):
+        query = fingerprint_query(
+            "p.d.t", Partitioning("dt", "DATETIME", "MONTH"), ["202001"]
+        )
+
+        self.assertIn("TIMESTAMP_TRUNC(TIMESTAMP(t.`dt`), MONTH)", query)
+
+    def test_fingerprint_query_on_ingestion_time(self):
+        query = fingerprint_query("p.d.t", Partitioning(None, None, "HOUR"), ["2020010100"])
+
+        self.assertIn("FORMAT_TIMESTAMP('%Y%m%d%H', TIMESTAMP_TRUNC(_PARTITIONTIME, HOUR))", query)
+
+    def test_diff_fingerprints(self):
+        source = parse_fingerprints(
+            [
+                SimpleNamespace(partition_id="20200101", row_count=10, fingerprint=1),
+                SimpleNamespace(partition_id="20200102", row_count=10, fingerprint=2),
+                SimpleNamespace(partition_id="20200103", row_count=10, fingerprint=3),
+                SimpleNamespace(partition_id="20200104", row_count=10, fingerprint=4),
+            ]
+        )
+        destination = {
+            "20200101": PartitionFingerprint("20200101", 10, "1"),
+            "20200102": PartitionFingerprint("20200102", 9, "2"),
+            "20200103": PartitionFingerprint("20200103", 10, "-3"),
+            "20200105": PartitionFingerprint("20200105", 10, "5"),
+        }
+
+        mismatches = diff_fingerprints(source, destination)
+
+        self.assertEqual(
+            [
+                ("20200102", ROW_COUNT_DIFFERS),
+                ("20200103", CONTENT_DIFFERS),
+                ("20200104", MISSING_IN_DESTINATION),
+                ("20200105", MISSING_IN_SOURCE),
+            ],
+            [(mismatch.partition_id, mismatch.reason) for mismatch in mismatches],
+        )
+        self.assertEqual("20200102: row count differs, 10 != 9", str(mismatches[0]))
@@ -0,0 +1,111 @@
+import unittest
+
+from source.view_rewriter import TableReference, rewrite_view_query, switch_color
+
+
+class TestRewriteViewQuery(unittest.TestCase):
+    def test_switches_every_colored_table(self):
+        query = (
+            "SELECT r.*, c.name FROM `p.d_versions.revenues_green` r\n"
+            "LEFT JOIN `p.d_versions.campaigns_blue` AS c ON r.id = c.id"
+        )
+
+        references, switched = rewrite_view_query(query)
+
+        self.assertEqual(
+            [
+                TableReference("p.d_versions.revenues_green", "green"),
+                TableReference("p.d_versions.campaigns_blue", "blue"),
+            ],
+            references,
+        )
+        self.assertEqual(
+            "SELECT r.*, c.name FROM `p.d_versions.revenues_blue` r\n"
+            "LEFT JOIN `p.d_versions.campaigns_green` AS c ON r.id = c.id",
+            switched,
+        )
+
+    def test_same_table_is_reported_once_and_switched_everywhere(self):
+        query = (
+            "SELECT * FROM `p.d.t_blue` WHERE id IN (SELECT id FROM `p.d.t_blue` WHERE x)"
+        )
+
+        references, switched = rewrite_view_query(query)
+
+        self.assertEqual([TableReference("p.d.t_blue", "blue")], references)
+        self.assertEqual(
+            "SELECT * FROM `p.d.t_green` WHERE id IN (SELECT id FROM `p.d.t_green` WHERE x)",
+            switched,
+        )
+
+    def test_strings_comments_and_columns_are_left_alone(self):
+        query = (
+            "-- reads p.d.old_blue\n"
+            "SELECT 'FROM p.d.a_blue' AS s, t.is_blue /* JOIN p.d.b_green */\n"
+            "FROM p.d.t_green t"
+        )
+
+        references, switched = rewrite_view_query(query)
+
+        self.assertEqual([TableReference("p.d.t_green", "green")], references)
+        self.assertEqual(query.replace("p.d.t_green", "p.d.t_blue"), switched)
+
+    def test_comma_joins_subqueries_and_quoted_segments(self):
+        query = (
+            "WITH recent_blue AS (SELECT * FROM `p`.`d`.`a_blue`)\n"
+            "SELECT * FROM (SELECT * FROM recent_blue) AS r, dataset.b_green g, "
+            "UNNEST(g.items) AS item"
+        )
+
+        references, switched = rewrite_view_query(query)
+
+        self.assertEqual(
+            [TableReference("p.d.a_blue", "blue"), TableReference("dataset.b_green", "green")],
+            references,
+        )
+        self.assertIn("FROM `p`.`d`.`a_green`)", switched)
+        self.assertIn("FROM recent_blue)", switched)
+        self.assertIn("dataset.b_blue g", switched)
+
+    def test_from_inside_a_function_call_is_not_a_table(self):
+        query = "SELECT EXTRACT(YEAR FROM t.created_blue) FROM `p.d.t_blue` t"
+
+        references, switched = rewrite_view_query(query)
+
+        self.assertEqual([TableReference("p.d.t_blue", "blue")], references)
+        self.assertEqual(
+            "SELECT EXTRACT(YEAR FROM t.created_blue) FROM `p.d.t_green` t", switched
+        )
+
+    def test_paths_starting_with_an_alias_are_not_tables(self):
+        query = (
+            "SELECT * FROM `p.d.t_blue` t, t.items_blue AS i\n"
+            "JOIN (SELECT * FROM d.a_green d) AS x ON TRUE JOIN d.b_green USING (id)"
+        )
+
+        references, switched = rewrite_view_query(query)
+
+        self.assertEqual(
+            [
+                TableReference("p.d.t_blue", "blue"),
+                TableReference("d.a_green", "green"),
+                TableReference("d.b_green", "green"),
+            ],
+            references,
+        )
+        self.assertIn("t.items_blue AS i", switched)
+
+    def test_large_queries_are_rewritten_in_one_pass(self):
+        tables = [f"`p.d.table_{index}_blue`" for index in range(2000)]
+        query = "SELECT * FROM " + " JOIN ".join(f"{table} USING (id)" for table in tables)
+
+        references, switched = rewrite_view_query(query)
+
+        self.assertEqual(2000, len(references))
+        self.assertNotIn("_blue", switched)
+        self.assertEqual(len(query) + 2000, len(switched))
+
+    def test_switch_color(self):
+        self.assertEqual("green", switch_color("blue"))
+        self.assertEqual("blue", switch_color("green"))
+        self.assertEqual("mixed", switch_color("mixed"))